@@ -0,0 +1,75 @@
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'versioning'))
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+from versioning_service.db import models
+
+
+_KEYS = 1000
+_LOOKUPS = 500
+_BATCH = 10000
+
+
+def seed(engine, rows):
+    audit = {'effective_username': 'bench', 'effective_utc': 0}
+    with engine.begin() as connection:
+        image_key = connection.execute(models.Image.__table__.insert().values(name='image', **audit)).inserted_primary_key[0]
+        artifactory_key = connection.execute(models.Artifactory.__table__.insert().values(base_uri='http://artifactory', **audit)).inserted_primary_key[0]
+        artifact_key = connection.execute(models.Artifact.__table__.insert().values(group='com.example', name='artifact',
+            artifactory_key=artifactory_key, **audit)).inserted_primary_key[0]
+        configuration_key = connection.execute(models.Configuration.__table__.insert().values(git_repository='git@example.com:config.git', **audit)).inserted_primary_key[0]
+        # Every key gets the same number of versions, each in effect for 1000ms until the next replaces it
+        versions = rows // _KEYS
+        batch = []
+        for version in range(versions):
+            for key in range(_KEYS):
+                last = version == versions - 1
+                batch.append({'environment': 'prod', 'data_center': 'AM%d' % (key % 3), 'application': 'APP%d' % (key % 50),
+                    'stripe': 'stripe-%d' % key, 'instance': 'primary',
+                    'image_key': image_key, 'image_version': str(version),
+                    'artifact_key': artifact_key, 'artifact_version': str(version),
+                    'configuration_key': configuration_key, 'configuration_version': 'master',
+                    'effective_username': 'bench', 'effective_utc': version * 1000,
+                    'deactivated_username': None if last else 'bench',
+                    'deactivated_utc': None if last else (version + 1) * 1000,
+                    'is_active': last})
+                if len(batch) == _BATCH:
+                    connection.execute(models.Deployment.__table__.insert(), batch)
+                    batch = []
+        if batch:
+            connection.execute(models.Deployment.__table__.insert(), batch)
+    return versions
+
+
+def lookups(engine, versions):
+    unit_of_work = sessionmaker(bind=engine)()
+    random.seed(versions)
+    started = time.perf_counter()
+    for _ in range(_LOOKUPS):
+        key = random.randrange(_KEYS)
+        as_of = random.randrange(versions * 1000)
+        deployment = unit_of_work.query(models.Deployment).filter_by(environment='prod', data_center='AM%d' % (key % 3),
+            application='APP%d' % (key % 50), stripe='stripe-%d' % key, instance='primary').filter(
+            models.Deployment.effective_at(as_of)).one()
+        assert deployment.image_version == str(as_of // 1000)
+    return (time.perf_counter() - started) / _LOOKUPS
+
+
+def main(sizes):
+    print('%10s %16s %16s' % ('rows', 'indexed us/op', 'unindexed us/op'))
+    for size in sizes:
+        engine = sa.create_engine('sqlite://')
+        models.Base.metadata.create_all(engine)
+        versions = seed(engine, size)
+        indexed = lookups(engine, versions)
+        models.deployment_index.drop(engine)
+        unindexed = lookups(engine, versions)
+        print('%10d %16.1f %16.1f' % (size, indexed * 1e6, unindexed * 1e6))
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000, 1000000, 3000000])
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'versioning'))
+
+import sqlalchemy as sa
+from aiohttp import web
+from sqlalchemy.orm import sessionmaker
+from versioning_service import projection, views
+from versioning_service.db import models
+from versioning_service.db.bulk import DEPLOYMENT_KEY
+from versioning_service.db.loading import DimensionCache, deployment_query
+from query_count import seed
+
+
+def orm_list(unit_of_work, dimensions, app):
+    dimensions.prime(unit_of_work)
+    return [views._deployment_document(deployment, app) for deployment in deployment_query(unit_of_work)
+        .filter_by(is_active=True).order_by(models.Deployment.deployment_key).all()]
+
+
+def core_list(unit_of_work, dimensions, app):
+    query = projection.select_deployments(models.Deployment, None, ('is_active',))
+    return [projection.full_document(row, lambda key: views._deployment_uri(app, key))[0]
+        for row in unit_of_work.execute(query, {'is_active': True})]
+
+
+def orm_one(unit_of_work, dimensions, app, key):
+    dimensions.prime(unit_of_work)
+    deployment = deployment_query(unit_of_work).filter_by(is_active=True, **dict(zip(DEPLOYMENT_KEY, key))).one()
+    return views._deployment_document(deployment, app)
+
+
+def core_one(unit_of_work, dimensions, app, key):
+    query = projection.select_deployments(models.Deployment, None, DEPLOYMENT_KEY + ('is_active',))
+    row = unit_of_work.execute(query, dict(zip(DEPLOYMENT_KEY, key), is_active=True)).one()
+    return projection.full_document(row, lambda key: views._deployment_uri(app, key))[0]
+
+
+def measure(engine, read, repeat=5):
+    # Best of repeat runs, each in a fresh unit of work as requests get
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = read(sessionmaker(bind=engine)())
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main(sizes=(10, 100, 1000, 10000), lookups=200):
+    app = web.Application()
+    views.DeploymentView.setup_routes(app)
+    print('%8s %10s %10s %14s %14s' % ('rows', 'orm ms', 'core ms', 'orm one us', 'core one us'))
+    for size in sizes:
+        engine = sa.create_engine('sqlite://')
+        models.Base.metadata.create_all(engine)
+        seed(engine, size)
+        dimensions = DimensionCache()
+        keys = [('prod', 'AM1', 'APP%d' % (i % 50), 'stripe-%d' % i, 'primary') for i in range(0, size, max(1, size // lookups))]
+        # First pass fills the dimension cache and the compiled statement cache; steady state is what requests see
+        (orm_documents, orm_seconds) = measure(engine, lambda unit_of_work: orm_list(unit_of_work, dimensions, app))
+        (core_documents, core_seconds) = measure(engine, lambda unit_of_work: core_list(unit_of_work, dimensions, app))
+        assert orm_documents == core_documents
+        (_, orm_one_seconds) = measure(engine, lambda unit_of_work: [orm_one(unit_of_work, dimensions, app, key) for key in keys])
+        (_, core_one_seconds) = measure(engine, lambda unit_of_work: [core_one(unit_of_work, dimensions, app, key) for key in keys])
+        print('%8d %10.1f %10.1f %14.1f %14.1f' % (size, orm_seconds * 1000, core_seconds * 1000,
+            orm_one_seconds / len(keys) * 1e6, core_one_seconds / len(keys) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from . import artifactory, data, mixes
+
+import aiohttp
+import sqlalchemy as sa
+import versioning
+
+
+# Kept outside the source tree, where it survives checkouts and is never committed by accident
+_RESULTS = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'versioning',
+        'load-results.jsonl')
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load', description='Load test the versioning service')
+    parser.add_argument('--db', choices=['memory', 'file'], default='memory')
+    parser.add_argument('--mix', action='append', choices=sorted(mixes.MIXES), help='defaults to every mix')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per mix')
+    parser.add_argument('--warmup', type=int, default=200, help='unmeasured requests per mix')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--deployments', type=int, default=1000)
+    parser.add_argument('--versions', type=int, default=5, help='rows of history per deployment')
+    parser.add_argument('--artifacts', type=int, default=50)
+    parser.add_argument('--artifactory-latency', type=float, default=0.005, help='seconds per stub Artifactory call')
+    parser.add_argument('--results', default=_RESULTS, help='JSON lines file each run is appended to')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+class QueryCounter(object):
+    def __init__(self, engine):
+        self._lock = threading.Lock()
+        self.count = 0
+        sa.event.listen(engine, 'before_cursor_execute', self._executed)
+
+    def _executed(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def _milliseconds(value):
+    return None if value is None else round(value * 1000, 3)
+
+
+async def drive(session, base_url, keys, mix, count, concurrency, rng):
+    operations = [name for name, weight in mixes.MIXES[mix]]
+    weights = [weight for name, weight in mixes.MIXES[mix]]
+    schedule = rng.choices(operations, weights, k=count)
+    latencies = dict((name, []) for name in operations)
+    errors = []
+
+    async def worker():
+        while schedule:
+            name = schedule.pop()
+            started = time.perf_counter()
+            try:
+                status = await mixes.OPERATIONS[name](session, base_url, keys, rng)
+            except aiohttp.ClientError as e:
+                status = str(e)
+            latencies[name].append(time.perf_counter() - started)
+            if not isinstance(status, int) or status >= 400:
+                errors.append((name, status))
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies, errors
+
+
+async def run_mix(session, base_url, keys, counter, mix, arguments):
+    rng = random.Random(arguments.seed)
+    await drive(session, base_url, keys, mix, arguments.warmup, arguments.concurrency, rng)
+    queries = counter.count
+    started = time.perf_counter()
+    latencies, errors = await drive(session, base_url, keys, mix, arguments.requests, arguments.concurrency, rng)
+    elapsed = time.perf_counter() - started
+    queries = counter.count - queries
+    everything = [latency for values in latencies.values() for latency in values]
+    return {'mix': mix,
+            'requests': len(everything),
+            'errors': len(errors),
+            'throughput': round(len(everything) / elapsed, 1),
+            'p50_ms': _milliseconds(_percentile(everything, 0.5)),
+            'p99_ms': _milliseconds(_percentile(everything, 0.99)),
+            'queries_per_request': round(queries / float(len(everything)), 2),
+            'operations': dict((name, {'requests': len(values),
+                    'p50_ms': _milliseconds(_percentile(values, 0.5)),
+                    'p99_ms': _milliseconds(_percentile(values, 0.99))}) for name, values in latencies.items())}
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                cwd=os.path.dirname(os.path.abspath(__file__))).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _previous(path, configuration, mix):
+    previous = None
+    if os.path.exists(path):
+        with open(path) as results:
+            for line in results:
+                result = json.loads(line)
+                if result['configuration'] == configuration and result['mix'] == mix:
+                    previous = result
+    return previous
+
+
+def _change(current, previous):
+    if not previous:
+        return ''
+    return ' (%+.1f%%)' % ((current - previous) * 100.0 / previous)
+
+
+def report(result, previous):
+    previous = previous or {}
+    print('%-6s %6d requests %4d errors %9.1f req/s%s  p50 %8.2f ms%s  p99 %8.2f ms%s  %5.2f queries/request%s' % (
+            result['mix'], result['requests'], result['errors'],
+            result['throughput'], _change(result['throughput'], previous.get('throughput')),
+            result['p50_ms'], _change(result['p50_ms'], previous.get('p50_ms')),
+            result['p99_ms'], _change(result['p99_ms'], previous.get('p99_ms')),
+            result['queries_per_request'], _change(result['queries_per_request'], previous.get('queries_per_request'))))
+    for name, operation in sorted(result['operations'].items()):
+        print('         %-8s %6d requests  p50 %8.2f ms  p99 %8.2f ms' % (name, operation['requests'],
+                operation['p50_ms'], operation['p99_ms']))
+
+
+async def main(loop, arguments):
+    stub_handler = artifactory.stub_artifactory(arguments.artifactory_latency).make_handler()
+    stub = await loop.create_server(stub_handler, '127.0.0.1', 0)
+    artifactory_uri = 'http://127.0.0.1:%d' % stub.sockets[0].getsockname()[1]
+    directory = None
+    if arguments.db == 'file':
+        directory = tempfile.TemporaryDirectory()
+        db_url = 'sqlite:///' + os.path.join(directory.name, 'versioning.db')
+    else:
+        db_url = 'sqlite://'
+    server, application, handler = await versioning.initialize(loop, db_url=db_url, host='127.0.0.1', port=0)
+    engine = application['db_pool'].engine
+    keys = data.generate(engine, artifactory_uri, deployments=arguments.deployments, versions=arguments.versions,
+            artifacts=arguments.artifacts, seed=arguments.seed)
+    counter = QueryCounter(engine)
+    base_url = 'http://127.0.0.1:%d' % server.sockets[0].getsockname()[1]
+    configuration = dict((name, getattr(arguments, name)) for name in ('db', 'requests', 'concurrency',
+            'deployments', 'versions', 'artifacts', 'artifactory_latency'))
+    # SessionIdentityPolicy reads the identity from the session cookie, so the writes are attributed to 'bench'
+    session_cookie = json.dumps({'created': int(time.time()), 'session': {'AIOHTTP_SECURITY': 'bench'}})
+    try:
+        async with aiohttp.ClientSession(cookies={'AIOHTTP_SESSION': session_cookie},
+                connector=aiohttp.TCPConnector(limit=arguments.concurrency)) as session:
+            for mix in arguments.mix or sorted(mixes.MIXES):
+                result = await run_mix(session, base_url, keys, counter, mix, arguments)
+                result['configuration'] = configuration
+                result['commit'] = _commit()
+                result['timestamp'] = datetime.datetime.utcnow().isoformat() + 'Z'
+                report(result, _previous(arguments.results, configuration, mix))
+                os.makedirs(os.path.dirname(os.path.abspath(arguments.results)), exist_ok=True)
+                with open(arguments.results, 'a') as results:
+                    results.write(json.dumps(result, sort_keys=True) + '\n')
+    finally:
+        await versioning.finalize(server, application, handler)
+        await stub_handler.shutdown(1.0)
+        stub.close()
+        await stub.wait_closed()
+        if directory is not None:
+            directory.cleanup()
+
+
+if __name__ == '__main__':
+    arguments = parse_arguments()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(main(loop, arguments))
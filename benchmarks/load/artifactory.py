@@ -0,0 +1,22 @@
+import asyncio
+from aiohttp import web
+
+
+def stub_artifactory(latency=0.0):
+    # Serves the two calls ArtifactoryResolver makes, each after the given latency in seconds
+    async def search(request):
+        await asyncio.sleep(latency)
+        query = request.rel_url.query
+        uri = '%s://%s/%s/api/storage/%s/%s/%s' % (request.scheme, request.host, request.match_info['repository'],
+                query['g'], query['a'], query['v'])
+        return web.json_response({'results': [{'uri': uri}]})
+
+    async def storage(request):
+        await asyncio.sleep(latency)
+        return web.json_response({'downloadUri': 'http://downloads.example.com/%s/%s/%s.jar' % (request.match_info['group'],
+                request.match_info['name'], request.match_info['version'])})
+
+    app = web.Application()
+    app.router.add_get('/{repository}/artifactory/api/search/gavc', search)
+    app.router.add_get('/{repository}/api/storage/{group}/{name}/{version}', storage)
+    return app
@@ -0,0 +1,48 @@
+import random
+from versioning_service.db import models
+
+
+_BATCH = 10000
+
+
+def _insert(connection, table, rows):
+    keys = []
+    for row in rows:
+        keys.append(connection.execute(table.insert().values(**row)).inserted_primary_key[0])
+    return keys
+
+
+def generate(engine, artifactory_uri, deployments=1000, versions=5, images=10, artifactories=2, artifacts=50,
+        configurations=20, seed=0):
+    # Every deployment gets versions rows: versions - 1 deactivated ones and the active one, each in effect for a second
+    rng = random.Random(seed)
+    audit = {'effective_username': 'bench', 'effective_utc': 0}
+    with engine.begin() as connection:
+        image_keys = _insert(connection, models.Image.__table__, [dict(name='images/image-%d' % i, **audit) for i in range(images)])
+        artifactory_keys = _insert(connection, models.Artifactory.__table__,
+                [dict(base_uri='%s/repository-%d' % (artifactory_uri, i), **audit) for i in range(artifactories)])
+        artifact_keys = _insert(connection, models.Artifact.__table__, [dict(group='com.example', name='artifact-%d' % i,
+                artifactory_key=artifactory_keys[i % artifactories], **audit) for i in range(artifacts)])
+        configuration_keys = _insert(connection, models.Configuration.__table__,
+                [dict(git_repository='git@example.com:config-%d.git' % i, **audit) for i in range(configurations)])
+        keys = []
+        batch = []
+        for i in range(deployments):
+            key = ('prod', 'AM%d' % (i % 3), 'APP%d' % (i % 50), 'stripe-%d' % i, 'primary')
+            keys.append(key)
+            dimensions = {'image_key': rng.choice(image_keys), 'artifact_key': rng.choice(artifact_keys),
+                    'configuration_key': rng.choice(configuration_keys)}
+            for version in range(versions):
+                last = version == versions - 1
+                batch.append(dict(zip(('environment', 'data_center', 'application', 'stripe', 'instance'), key),
+                        image_version='1.%d' % version, artifact_version='2.%d' % version, configuration_version='master',
+                        effective_username='bench', effective_utc=version * 1000,
+                        deactivated_username=None if last else 'bench',
+                        deactivated_utc=None if last else (version + 1) * 1000,
+                        is_active=last, **dimensions))
+                if len(batch) == _BATCH:
+                    connection.execute(models.Deployment.__table__.insert(), batch)
+                    batch = []
+        if batch:
+            connection.execute(models.Deployment.__table__.insert(), batch)
+    return keys
@@ -0,0 +1,42 @@
+import json
+
+
+_PREFIX = '/deployments'
+
+
+async def get_deployment(session, base_url, keys, rng):
+    async with session.get(base_url + _PREFIX + '/' + '/'.join(rng.choice(keys))) as response:
+        await response.read()
+        return response.status
+
+
+async def list_deployments(session, base_url, keys, rng):
+    (environment, data_center, application) = rng.choice(keys)[:3]
+    async with session.get(base_url + _PREFIX, params={'environment': environment, 'data_center': data_center,
+            'application': application, 'is_active': 'true'}) as response:
+        await response.read()
+        return response.status
+
+
+async def upgrade_deployment(session, base_url, keys, rng):
+    key = dict(zip(('environment', 'data_center', 'application', 'stripe', 'instance'), rng.choice(keys)))
+    body = {'keys': [key], 'artifact_version': '3.%d' % rng.randrange(1000000)}
+    async with session.patch(base_url + _PREFIX, data=json.dumps(body), headers={'Content-Type': 'application/json'}) as response:
+        await response.read()
+        return response.status
+
+
+OPERATIONS = {
+    'get': get_deployment,
+    'list': list_deployments,
+    'upgrade': upgrade_deployment,
+}
+
+
+# Name -> [(operation, weight)]
+MIXES = {
+    'read': [('get', 1)],
+    'list': [('list', 1)],
+    'write': [('upgrade', 1)],
+    'mixed': [('get', 80), ('list', 15), ('upgrade', 5)],
+}
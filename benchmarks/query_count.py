@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'versioning'))
+
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+from versioning_service.db import models
+from versioning_service.db.loading import DimensionCache, deployment_query
+
+
+def seed(engine, count, images=5, artifactories=2, configurations=5):
+    artifacts = max(1, count // 5)
+    unit_of_work = sessionmaker(bind=engine)()
+    audit = {'effective_username': 'bench', 'effective_utc': 0}
+    image_rows = [models.Image(name='image-%d' % i, **audit) for i in range(images)]
+    artifactory_rows = [models.Artifactory(base_uri='http://artifactory-%d' % i, **audit) for i in range(artifactories)]
+    artifact_rows = [models.Artifact(group='com.example', name='artifact-%d' % i,
+        artifactory=artifactory_rows[i % artifactories], **audit) for i in range(artifacts)]
+    configuration_rows = [models.Configuration(git_repository='git@example.com:config-%d.git' % i, **audit) for i in range(configurations)]
+    for i in range(count):
+        unit_of_work.add(models.Deployment(environment='prod', data_center='AM1', application='APP%d' % (i % 50),
+            stripe='stripe-%d' % i, instance='primary',
+            image=image_rows[i % images], image_version='1.%d' % i,
+            artifact=artifact_rows[i % artifacts], artifact_version='2.%d' % i,
+            configuration=configuration_rows[i % configurations], configuration_version='master', **audit))
+    unit_of_work.commit()
+
+
+def serialize(deployments):
+    # The relationships _deployment_document walks
+    return [(deployment.image.name, deployment.artifact.group, deployment.artifact.name,
+        deployment.artifact.artifactory.base_uri, deployment.configuration.git_repository) for deployment in deployments]
+
+
+def lazy(unit_of_work, dimensions):
+    return serialize(unit_of_work.query(models.Deployment).filter_by(is_active=True).all())
+
+
+def eager(unit_of_work, dimensions):
+    dimensions.prime(unit_of_work)
+    return serialize(deployment_query(unit_of_work).filter_by(is_active=True).all())
+
+
+def measure(engine, loader, dimensions):
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+    sa.event.listen(engine, 'before_cursor_execute', count)
+    try:
+        started = time.perf_counter()
+        loader(sessionmaker(bind=engine)(), dimensions)
+        return statements[0], time.perf_counter() - started
+    finally:
+        sa.event.remove(engine, 'before_cursor_execute', count)
+
+
+def main(sizes=(10, 100, 1000, 10000)):
+    print('%8s %14s %10s %14s %10s' % ('rows', 'lazy queries', 'lazy ms', 'eager queries', 'eager ms'))
+    for size in sizes:
+        engine = sa.create_engine('sqlite://')
+        models.Base.metadata.create_all(engine)
+        seed(engine, size)
+        dimensions = DimensionCache()
+        # First pass fills the dimension cache; steady state is what requests see
+        measure(engine, eager, dimensions)
+        lazy_queries, lazy_seconds = measure(engine, lazy, dimensions)
+        eager_queries, eager_seconds = measure(engine, eager, dimensions)
+        print('%8d %14d %10.1f %14d %10.1f' % (size, lazy_queries, lazy_seconds * 1000, eager_queries, eager_seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
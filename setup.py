@@ -1,40 +1,22 @@
-from sqlalchemy import *
+from setuptools import setup
 
-metadata = MetaData()
 
-image = Table('tImage', metadata,
-        Column('ImageKey', Integer, primary_key=True),
-        Column('Name', String(255), nullable=False, index=True))
-
-artifact = Table('tArtifact', metadata,
-        Column('ArtifactKey', Integer, primary_key=True),
-        Column('Package', String(255), nullable=False),
-        Column('Name', String(255), nullable=False),
-        Index('idx_tArtifact_Package_Name', 'Package', 'Name', unique=True))
-
-configuration = Table('tConfiguration', metadata,
-        Column('ConfigurationKey', Integer, primary_key=True),
-        Column('Repository', String(255), nullable=False, index=True))
-
-version = Table('tVersion', metadata,
-        Column('VersionKey', Integer, primary_key=True),
-        Column('Environment', String(4), nullable=False),
-        Column('DataCenter', String(3), nullable=False),
-        # Does application really need to be 255? I think 4 (i.e. stream id) should work
-        Column('Application', String(255), nullable=False),
-        Column('Stripe', String(25), nullable=False),
-        Column('Instance', String(25), nullable=False),
-        Column('ImageKey', Integer, ForeignKey(image.c.ImageKey), nullable=False),
-        Column('ImageVersion', String(255), nullable=False),
-        Column('ArtifactKey', Integer, ForeignKey(artifact.c.ArtifactKey), nullable=False),
-        Column('ArtifactVersion', String(255), nullable=False),
-        Column('ConfigurationKey', Integer, ForeignKey(configuration.c.ConfigurationKey), nullable=False),
-        Column('ConfigurationVersion', String(255), nullable=False),
-        Column('IsActive', Boolean, default=True),
-        Column('Username', String(16), nullable=False),
-        Column('EffectiveUtc', BigInteger, nullable=False))
-
-
-if __name__ == "__main__":
-    engine = create_engine("sqlite:///foo.db")
-    metadata.create_all(engine)
+setup(
+    name='versioning',
+    version='0.1.0',
+    description='Tracks which image, artifact and configuration versions are deployed where',
+    package_dir={'': 'versioning'},
+    py_modules=['versioning', 'ad_auth'],
+    packages=['versioning_service', 'versioning_service.db'],
+    install_requires=[
+        'aiohttp>=3.3,<4',
+        'aiohttp_security>=0.4,<0.5',
+        'aiohttp_session>=2.7,<3',
+        'SQLAlchemy>=1.4,<2',
+    ],
+    entry_points={
+        'console_scripts': [
+            'versioning = versioning:main',
+        ],
+    },
+)
@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'versioning'))
+
+import asyncio
+import aiohttp
+from aiohttp import web
+from sqlalchemy.orm import sessionmaker
+import versioning
+from versioning_service.db import models
+
+
+def session_cookie(identity):
+    # What SimpleCookieStorage reads SessionIdentityPolicy's identity from
+    return {'AIOHTTP_SESSION': json.dumps({'created': 1, 'session': {'AIOHTTP_SECURITY': identity}})}
+
+
+def seed(engine, stripes=1, artifactory_uri='http://127.0.0.1:1'):
+    unit_of_work = sessionmaker(bind=engine)()
+    audit = {'effective_username': 'seed', 'effective_utc': 1}
+    image = models.Image(name='image', **audit)
+    artifact = models.Artifact(group='com.example', name='artifact',
+            artifactory=models.Artifactory(base_uri=artifactory_uri, **audit), **audit)
+    configuration = models.Configuration(git_repository='git@example.com:config.git', **audit)
+    for stripe in range(stripes):
+        unit_of_work.add(models.Deployment(environment='dev', data_center='AM1', application='APP', stripe='s%d' % stripe,
+            instance='primary', image=image, image_version='1', artifact=artifact, artifact_version='1.0',
+            configuration=configuration, configuration_version='master', **audit))
+    unit_of_work.commit()
+    unit_of_work.close()
+
+
+class StubArtifactory(object):
+    # Answers the two calls ArtifactoryResolver makes, counting them; versions in missing have no package
+    def __init__(self):
+        self.latency = 0.0
+        self.missing = set()
+        self.searches = 0
+
+    async def _search(self, request):
+        self.searches += 1
+        await asyncio.sleep(self.latency)
+        query = request.rel_url.query
+        if query['v'] in self.missing:
+            return web.json_response({'results': []})
+        return web.json_response({'results': [{'uri': '%s/api/storage/%s/%s/%s' % (self.base_uri, query['g'], query['a'],
+                query['v'])}]})
+
+    async def _storage(self, request):
+        return web.json_response({'downloadUri': 'http://downloads.example.com/%s/%s/%s.jar' % (request.match_info['group'],
+                request.match_info['name'], request.match_info['version'])})
+
+    async def __aenter__(self):
+        self._application = web.Application()
+        self._application.router.add_get('/repository/artifactory/api/search/gavc', self._search)
+        self._application.router.add_get('/repository/api/storage/{group}/{name}/{version}', self._storage)
+        self._handler = self._application.make_handler()
+        self._server = await asyncio.get_event_loop().create_server(self._handler, '127.0.0.1', 0)
+        self.base_uri = 'http://127.0.0.1:%d/repository' % self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._server.close()
+        await self._handler.shutdown(1.0)
+        await self._server.wait_closed()
+
+
+class Service(object):
+    # The whole service on an ephemeral port, with a client whose session cookie carries identity. The seeded
+    # artifact lives on an unreachable Artifactory unless artifactory is set, when a StubArtifactory serves it
+    def __init__(self, identity='tester', stripes=1, artifactory=False, **options):
+        self._identity = identity
+        self._stripes = stripes
+        self.artifactory = StubArtifactory() if artifactory else None
+        self._options = options
+
+    async def __aenter__(self):
+        loop = asyncio.get_event_loop()
+        if self.artifactory is not None:
+            await self.artifactory.__aenter__()
+        (self.server, self.application, self._handler) = await versioning.initialize(loop, host='127.0.0.1', port=0,
+                **self._options)
+        seed(self.application['db_pool'].engine, self._stripes,
+                'http://127.0.0.1:1' if self.artifactory is None else self.artifactory.base_uri)
+        self.base_url = 'http://127.0.0.1:%d' % self.server.sockets[0].getsockname()[1]
+        # The default jar keeps no cookies for IP addresses
+        self.client = aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar(unsafe=True),
+                cookies=session_cookie(self._identity) if self._identity else None)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.close()
+        await versioning.finalize(self.server, self.application, self._handler)
+        if self.artifactory is not None:
+            await self.artifactory.__aexit__(*exc_info)
+
+    def request(self, method, path, **kwargs):
+        return self.client.request(method, self.base_url + path, **kwargs)
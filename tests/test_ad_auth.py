@@ -0,0 +1,177 @@
+import asyncio
+import unittest
+import support
+from ad_auth import ActiveDirectoryPolicy, DirectoryBackend, LocalDirectory
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SlowDirectory(LocalDirectory):
+    # Holds every lookup until released, so tests can act while one is in flight
+    def __init__(self, members):
+        super(SlowDirectory, self).__init__(members)
+        self.released = asyncio.Event()
+
+    async def groups(self, identity):
+        await self.released.wait()
+        return await super(SlowDirectory, self).groups(identity)
+
+
+class DirectoryBackendTest(unittest.TestCase):
+    def test_groups_must_be_implemented(self):
+        with self.assertRaises(TypeError):
+            DirectoryBackend()
+
+
+class PolicyTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = LocalDirectory({'alice': ['versioning-deployers-dev'], 'root': ['versioning-admins'],
+            'bob': ['other-group']})
+        self.clock = Clock()
+        self.policy = ActiveDirectoryPolicy(self.directory, groups_ttl=300, decision_ttl=60, clock=self.clock)
+
+
+class DecisionTest(PolicyTestCase):
+    async def test_without_a_directory_any_identified_user_is_permitted(self):
+        policy = ActiveDirectoryPolicy()
+        self.assertTrue(await policy.permits('anyone', 'admin'))
+        self.assertFalse(await policy.permits(None, 'write', {'environment': 'dev'}))
+        self.assertEqual(await policy.authorized_userid('anyone'), 'anyone')
+
+    async def test_write_is_granted_per_environment(self):
+        self.assertTrue(await self.policy.permits('alice', 'write', {'environment': 'dev'}))
+        self.assertFalse(await self.policy.permits('alice', 'write', {'environment': 'prod'}))
+        self.assertFalse(await self.policy.permits('bob', 'write', {'environment': 'dev'}))
+
+    async def test_a_group_naming_a_missing_context_key_grants_nothing(self):
+        self.assertFalse(await self.policy.permits('alice', 'write'))
+        self.assertTrue(await self.policy.permits('root', 'write'))
+
+    async def test_admins_may_administer_and_write_anywhere(self):
+        self.assertTrue(await self.policy.permits('root', 'admin'))
+        self.assertTrue(await self.policy.permits('root', 'write', {'environment': 'prod'}))
+        self.assertFalse(await self.policy.permits('alice', 'admin'))
+
+    async def test_unknown_identities_are_not_authorized(self):
+        self.assertIsNone(await self.policy.authorized_userid('mallory'))
+        self.assertFalse(await self.policy.permits('mallory', 'write', {'environment': 'dev'}))
+        self.assertEqual(await self.policy.authorized_userid('alice'), 'alice')
+
+    async def test_unknown_permissions_are_refused(self):
+        self.assertFalse(await self.policy.permits('root', 'delete-everything'))
+
+    async def test_custom_rules_replace_the_defaults(self):
+        policy = ActiveDirectoryPolicy(self.directory, rules={'write': ('other-group',)})
+        self.assertTrue(await policy.permits('bob', 'write', {'environment': 'prod'}))
+        self.assertFalse(await policy.permits('root', 'write', {'environment': 'prod'}))
+
+
+class CacheTest(PolicyTestCase):
+    async def test_decisions_and_groups_are_cached(self):
+        for _ in range(3):
+            self.assertTrue(await self.policy.permits('alice', 'write', {'environment': 'dev'}))
+        self.assertFalse(await self.policy.permits('alice', 'write', {'environment': 'prod'}))
+        self.assertEqual(self.directory.lookups, 1)
+        statistics = self.policy.statistics()
+        self.assertEqual((statistics['decision_hits'], statistics['decision_misses']), (2, 2))
+
+    async def test_memberships_are_looked_up_again_once_they_expire(self):
+        await self.policy.permits('alice', 'write', {'environment': 'dev'})
+        self.directory.set_groups('alice', [])
+        self.clock.now += 61
+        # The decision has expired, but the memberships it was made from have not
+        self.assertTrue(await self.policy.permits('alice', 'write', {'environment': 'dev'}))
+        self.clock.now += 300
+        self.assertFalse(await self.policy.permits('alice', 'write', {'environment': 'dev'}))
+        self.assertEqual(self.directory.lookups, 2)
+
+    async def test_flushing_an_identity_forgets_only_that_identity(self):
+        await self.policy.permits('alice', 'write', {'environment': 'dev'})
+        await self.policy.permits('root', 'admin')
+        self.directory.set_groups('alice', [])
+        self.directory.set_groups('root', [])
+        self.policy.flush('alice')
+        self.assertFalse(await self.policy.permits('alice', 'write', {'environment': 'dev'}))
+        self.assertTrue(await self.policy.permits('root', 'admin'))
+
+    async def test_flushing_everything_forgets_everyone(self):
+        await self.policy.permits('alice', 'write', {'environment': 'dev'})
+        await self.policy.permits('root', 'admin')
+        self.directory.set_groups('root', [])
+        self.policy.flush()
+        self.assertEqual(self.policy.statistics()['groups_size'], 0)
+        self.assertFalse(await self.policy.permits('root', 'admin'))
+        self.assertTrue(await self.policy.permits('alice', 'write', {'environment': 'dev'}))
+
+    async def test_concurrent_lookups_of_one_identity_share_a_directory_call(self):
+        directory = SlowDirectory({'alice': ['versioning-deployers-dev']})
+        policy = ActiveDirectoryPolicy(directory)
+        checks = [asyncio.ensure_future(policy.permits('alice', 'write', {'environment': environment}))
+                for environment in ('dev', 'prod', 'dev')]
+        await asyncio.sleep(0)
+        directory.released.set()
+        self.assertEqual(await asyncio.gather(*checks), [True, False, True])
+        self.assertEqual(directory.lookups, 1)
+        self.assertEqual(policy.statistics()['coalesced'], 2)
+
+    async def test_a_lookup_in_flight_during_a_flush_is_not_cached(self):
+        directory = SlowDirectory({'alice': ['versioning-deployers-dev']})
+        policy = ActiveDirectoryPolicy(directory)
+        check = asyncio.ensure_future(policy.permits('alice', 'write', {'environment': 'dev'}))
+        await asyncio.sleep(0)
+        policy.flush('alice')
+        directory.released.set()
+        self.assertTrue(await check)
+        self.assertEqual(policy.statistics()['groups_size'], 0)
+        self.assertEqual(policy.statistics()['decisions_size'], 0)
+
+
+class EndpointTest(unittest.IsolatedAsyncioTestCase):
+    async def test_writes_need_the_permission_for_their_environment(self):
+        directory = LocalDirectory({'alice': ['versioning-deployers-prod']})
+        async with support.Service(identity='alice', auth_directory=directory) as service:
+            response = await service.request('PATCH', '/deployments/dev/AM1/APP/s0/primary',
+                    data={'image_version': '2', 'artifact_version': '2.0', 'configuration_version': 'master'})
+            self.assertEqual(response.status, 403)
+
+    async def test_bulk_upgrades_need_the_permission_for_every_environment_they_reach(self):
+        directory = LocalDirectory({'alice': ['versioning-deployers-dev'], 'nobody': []})
+        key = {'environment': 'dev', 'data_center': 'AM1', 'application': 'APP', 'stripe': 's0', 'instance': 'primary'}
+        async with support.Service(identity='nobody', auth_directory=directory, stripes=2) as service:
+            for body in [{'filter': {'data_center': 'AM1'}}, {'filter': {'environment': 'dev'}}, {'keys': [key]}]:
+                response = await service.request('PATCH', '/deployments', json=dict(body, image_version='66'))
+                self.assertEqual(response.status, 403, body)
+            # No keys bound nothing: refused whether as malformed or as unauthorized
+            response = await service.request('PATCH', '/deployments',
+                    json={'filter': {'data_center': 'AM1'}, 'keys': [], 'image_version': '66'})
+            self.assertIn(response.status, (400, 403))
+            service.client.cookie_jar.update_cookies(support.session_cookie('alice'))
+            # Bounded to dev, which alice may write, but an unbounded filter needs the unscoped permission
+            self.assertEqual((await service.request('PATCH', '/deployments',
+                    json={'filter': {'data_center': 'AM1'}, 'image_version': '66'})).status, 403)
+            response = await service.request('PATCH', '/deployments', json={'keys': [key], 'image_version': '66'})
+            self.assertEqual(response.status, 200)
+            self.assertEqual((await response.json())['upgraded'], 1)
+
+    async def test_anonymous_writes_are_refused(self):
+        async with support.Service(identity=None) as service:
+            response = await service.request('DELETE', '/deployments/dev/AM1/APP/s0/primary')
+            self.assertEqual(response.status, 403)
+
+    async def test_only_admins_flush_the_cache(self):
+        directory = LocalDirectory({'alice': ['versioning-deployers-dev'], 'root': ['versioning-admins']})
+        async with support.Service(identity='alice', auth_directory=directory) as service:
+            self.assertEqual((await service.request('DELETE', '/status/auth-cache')).status, 403)
+            service.client.cookie_jar.update_cookies(support.session_cookie('root'))
+            response = await service.request('DELETE', '/status/auth-cache', params={'identity': 'alice'})
+            self.assertEqual(response.status, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
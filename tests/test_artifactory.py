@@ -0,0 +1,130 @@
+import asyncio
+import unittest
+import support
+from versioning_service.artifactory import ArtifactoryClients, ArtifactoryResolver, DownloadUrlCache
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Lookups(object):
+    # Stands in for Artifactory: counts the lookups made, which wait for release when it is set
+    def __init__(self, value='http://downloads.example.com/artifact.jar'):
+        self.value = value
+        self.count = 0
+        self.release = None
+
+    async def __call__(self):
+        self.count += 1
+        if self.release is not None:
+            await self.release.wait()
+        return self.value
+
+
+RELEASE = ('http://artifactory', 'com.example', 'artifact', '1.0')
+SNAPSHOT = ('http://artifactory', 'com.example', 'artifact', '1.1-SNAPSHOT')
+
+
+class DownloadUrlCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = DownloadUrlCache(max_size=2, release_ttl=100, snapshot_ttl=10, not_found_ttl=5, clock=self.clock)
+        self.lookups = Lookups()
+
+    async def resolve(self, key, at):
+        self.clock.now = at
+        return await self.cache.get_or_resolve(key, self.lookups)
+
+    async def test_releases_are_kept_for_the_release_ttl(self):
+        await self.resolve(RELEASE, 0)
+        await self.resolve(RELEASE, 99)
+        self.assertEqual(self.lookups.count, 1)
+        await self.resolve(RELEASE, 100)
+        self.assertEqual(self.lookups.count, 2)
+
+    async def test_snapshots_are_kept_for_the_snapshot_ttl(self):
+        await self.resolve(SNAPSHOT, 0)
+        await self.resolve(SNAPSHOT, 9)
+        self.assertEqual(self.lookups.count, 1)
+        await self.resolve(SNAPSHOT, 10)
+        self.assertEqual(self.lookups.count, 2)
+
+    async def test_missing_packages_are_kept_for_the_not_found_ttl(self):
+        self.lookups.value = None
+        self.assertIsNone(await self.resolve(RELEASE, 0))
+        self.assertIsNone(await self.resolve(RELEASE, 4))
+        self.assertEqual(self.lookups.count, 1)
+        await self.resolve(RELEASE, 5)
+        self.assertEqual(self.lookups.count, 2)
+
+    async def test_the_least_recently_used_entry_is_evicted(self):
+        other = RELEASE[:-1] + ('2.0',)
+        await self.resolve(RELEASE, 0)
+        await self.resolve(other, 0)
+        await self.resolve(RELEASE, 0)
+        await self.resolve(SNAPSHOT, 0)
+        self.assertEqual(self.lookups.count, 3)
+        await self.resolve(RELEASE, 0)
+        self.assertEqual(self.lookups.count, 3)
+        await self.resolve(other, 0)
+        self.assertEqual(self.lookups.count, 4)
+
+    async def test_concurrent_misses_share_one_lookup(self):
+        self.lookups.release = asyncio.Event()
+        readers = [asyncio.ensure_future(self.resolve(RELEASE, 0)) for _ in range(3)]
+        await asyncio.sleep(0)
+        readers[0].cancel()
+        self.lookups.release.set()
+        self.assertEqual(await asyncio.gather(*readers[1:]), [self.lookups.value] * 2)
+        self.assertEqual(self.lookups.count, 1)
+        self.assertEqual(self.cache.statistics()['coalesced'], 2)
+        # The lookup the cancelled reader started still completed and was cached for everyone
+        await self.resolve(RELEASE, 0)
+        self.assertEqual((self.lookups.count, self.cache.hits), (1, 1))
+
+
+class ArtifactoryClientsTest(unittest.IsolatedAsyncioTestCase):
+    async def test_each_artifactory_has_one_session(self):
+        clients = ArtifactoryClients(asyncio.get_event_loop(), limit_per_host=4)
+        session = clients.get('http://one')
+        self.assertIs(clients.get('http://one'), session)
+        self.assertIsNot(clients.get('http://two'), session)
+        self.assertEqual(session.connector.limit_per_host, 4)
+        # A session closed under it is replaced
+        await session.close()
+        replacement = clients.get('http://one')
+        self.assertIsNot(replacement, session)
+        await clients.close()
+        self.assertTrue(replacement.closed)
+
+
+class ArtifactoryResolverTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.artifactory = await support.StubArtifactory().__aenter__()
+        self.clients = ArtifactoryClients(asyncio.get_event_loop())
+        self.resolver = ArtifactoryResolver(self.clients)
+
+    async def asyncTearDown(self):
+        await self.clients.close()
+        await self.artifactory.__aexit__(None, None, None)
+
+    async def test_download_urls_are_looked_up_once(self):
+        for _ in range(2):
+            self.assertEqual(await self.resolver.get_download_url(self.artifactory.base_uri, 'com.example', 'artifact', '1.0'),
+                    'http://downloads.example.com/com.example/artifact/1.0.jar')
+        self.assertEqual(self.artifactory.searches, 1)
+
+    async def test_missing_packages_are_cached_too(self):
+        self.artifactory.missing.add('9.9')
+        for _ in range(2):
+            self.assertIsNone(await self.resolver.get_download_url(self.artifactory.base_uri, 'com.example', 'artifact', '9.9'))
+        self.assertEqual(self.artifactory.searches, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import support
+
+
+ARTIFACT = '/artifacts/com.example/artifact'
+
+
+class ArtifactTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=3, artifactory=True).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def move(self, base_uri, status=200, **kwargs):
+        response = await self.service.request('PUT', ARTIFACT, data={'base_uri': base_uri}, **kwargs)
+        self.assertEqual(response.status, status)
+        return response
+
+    async def download_urls(self):
+        response = await self.service.request('GET', '/deployments', params={'is_active': 'true'})
+        return [document['artifact_download_url'] for document in await response.json()]
+
+    async def test_moving_switches_every_active_deployment(self):
+        response = await self.move('http://127.0.0.1:1/repository')
+        self.assertEqual(await response.json(), {'deployments_switched': 3})
+        self.assertEqual((await (await self.service.request('GET', ARTIFACT)).json())['artifactory_base_uri'],
+                'http://127.0.0.1:1/repository')
+        self.assertEqual(await self.download_urls(), [None] * 3)
+        # The rows they replaced stay behind as history
+        response = await self.service.request('GET', '/deployments', params={'is_active': 'false', 'fields': 'stripe'})
+        self.assertEqual(len(await response.json()), 3)
+
+    async def test_moving_to_the_current_artifactory_changes_nothing(self):
+        etag = (await self.service.request('GET', ARTIFACT)).headers['ETag']
+        response = await self.move(self.service.artifactory.base_uri, headers={'If-Match': etag})
+        self.assertEqual(await response.json(), {'deployments_switched': 0})
+        self.assertEqual(response.headers['ETag'], etag)
+        response = await self.service.request('GET', '/deployments', params={'is_active': 'false', 'fields': 'stripe'})
+        self.assertEqual(await response.json(), [])
+
+    async def test_moving_back_reactivates_the_earlier_artifact(self):
+        await self.move('http://127.0.0.1:1/repository')
+        response = await self.move(self.service.artifactory.base_uri)
+        self.assertEqual(await response.json(), {'deployments_switched': 3})
+        artifact = await (await self.service.request('GET', ARTIFACT)).json()
+        self.assertEqual((artifact['artifactory_base_uri'], artifact['is_active']), (self.service.artifactory.base_uri, True))
+        self.assertNotIn('deactivated_utc', artifact)
+        self.assertEqual(await self.download_urls(), ['http://downloads.example.com/com.example/artifact/1.0.jar'] * 3)
+
+    async def test_a_stale_tag_fails_the_move(self):
+        etag = (await self.service.request('GET', ARTIFACT)).headers['ETag']
+        await self.move('http://127.0.0.1:1/repository')
+        await self.move(self.service.artifactory.base_uri, 412, headers={'If-Match': etag})
+
+    async def test_deleting_deactivates_every_deployment(self):
+        response = await self.service.request('DELETE', ARTIFACT)
+        self.assertEqual(await response.json(), {'deployments_deactivated': 3})
+        self.assertEqual((await self.service.request('GET', ARTIFACT)).status, 404)
+        self.assertEqual((await self.service.request('GET', '/deployments/dev/AM1/APP/s0/primary')).status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
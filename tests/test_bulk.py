@@ -0,0 +1,83 @@
+import unittest
+import sqlalchemy as sa
+import support
+from versioning_service.db import models
+from versioning_service.db.bulk import key_condition
+
+
+def key(stripe):
+    return {'environment': 'dev', 'data_center': 'AM1', 'application': 'APP', 'stripe': stripe, 'instance': 'primary'}
+
+
+class KeyConditionTest(unittest.TestCase):
+    def test_no_keys_match_no_rows(self):
+        engine = sa.create_engine('sqlite://')
+        models.Base.metadata.create_all(engine)
+        support.seed(engine, stripes=2)
+        table = models.Deployment.__table__
+        with engine.connect() as connection:
+            count = lambda keys: connection.execute(sa.select([sa.func.count()]).where(key_condition(table, keys))).scalar()
+            self.assertEqual(count([]), 0)
+            self.assertEqual(count([tuple(key('s1').values())]), 1)
+
+
+class BulkUpgradeTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=3).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def upgrade(self, body):
+        return await self.service.request('PATCH', '/deployments', json=body)
+
+    async def active_versions(self):
+        response = await self.service.request('GET', '/deployments',
+                params={'is_active': 'true', 'fields': 'stripe,image_version'})
+        return dict((document['stripe'], document['image_version']) for document in await response.json())
+
+    async def test_each_key_reports_its_own_outcome(self):
+        await self.upgrade({'keys': [key('s1')], 'image_version': '2'})
+        response = await self.upgrade({'keys': [key('s0'), key('s1'), key('s9')], 'image_version': '2'})
+        self.assertEqual(response.status, 200)
+        body = await response.json()
+        self.assertEqual((body['upgraded'], body['unchanged'], body['missing']), (1, 1, 1))
+        self.assertEqual(sorted((result['stripe'], result['status']) for result in body['results']),
+                [('s0', 200), ('s1', 409), ('s9', 404)])
+        self.assertEqual(await self.active_versions(), {'s0': '2', 's1': '2', 's2': '1'})
+
+    async def test_a_filter_upgrades_everything_it_matches(self):
+        response = await self.upgrade({'filter': {'environment': 'dev', 'stripe': 's2'}, 'artifact_version': '3.0'})
+        self.assertEqual((await response.json())['upgraded'], 1)
+        response = await self.upgrade({'filter': {'data_center': 'AM1'}, 'image_version': '5'})
+        self.assertEqual((await response.json())['upgraded'], 3)
+        self.assertEqual(await self.active_versions(), {'s0': '5', 's1': '5', 's2': '5'})
+
+    async def test_keys_and_filter_both_apply(self):
+        response = await self.upgrade({'filter': {'stripe': 's0'}, 'keys': [key('s0'), key('s1')], 'image_version': '2'})
+        body = await response.json()
+        self.assertEqual((body['upgraded'], body['missing']), (1, 1))
+        self.assertEqual(await self.active_versions(), {'s0': '2', 's1': '1', 's2': '1'})
+
+    async def test_requests_that_could_widen_the_upgrade_are_refused(self):
+        for body in [{'keys': [], 'filter': {'data_center': 'AM1'}, 'image_version': '2'},
+                {'keys': [], 'image_version': '2'},
+                {'filter': {'datacenter': 'AM1'}, 'image_version': '2'},
+                {'filter': {}, 'image_version': '2'},
+                {'image_version': '2'}]:
+            response = await self.upgrade(body)
+            self.assertEqual(response.status, 400, body)
+        self.assertEqual(await self.active_versions(), {'s0': '1', 's1': '1', 's2': '1'})
+
+    async def test_malformed_bodies_are_refused(self):
+        for body in [['not', 'an', 'object'], {'keys': [key('s0')]}, {'keys': [key('s0')], 'image_version': 2},
+                {'keys': [{'environment': 'dev'}], 'image_version': '2'}, {'keys': 'dev', 'image_version': '2'},
+                {'filter': {'stripe': 0}, 'image_version': '2'}, {'filter': 'dev', 'image_version': '2'}]:
+            response = await self.upgrade(body)
+            self.assertEqual(response.status, 400, body)
+        response = await self.service.request('PATCH', '/deployments', data=b'{', headers={'Content-Type': 'application/json'})
+        self.assertEqual(response.status, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+import support
+from versioning_service.db import models
+from versioning_service.db.changes import ChangePruner, prune_changes, read_changed_keys, visible_revision
+
+
+DEPLOYMENT = '/deployments/dev/AM1/APP/s0/primary'
+
+
+class ChangeTableTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        models.Base.metadata.create_all(self.engine)
+        self.connection = self.engine.connect()
+
+    def tearDown(self):
+        self.connection.close()
+
+    def record(self, revision, age, stripe='s0'):
+        # age is in seconds
+        self.connection.execute(models.Change.__table__.insert().values(revision=revision, environment='dev',
+                data_center='AM1', application='APP', stripe=stripe, instance='primary',
+                effective_utc=models.utc_now() - int(age * 1000)))
+
+    def test_a_young_gap_holds_the_revision_back(self):
+        for revision in (1, 2, 4):
+            self.record(revision, 0)
+        self.assertEqual(visible_revision(self.connection, 0, 10), 2)
+        # Once the write that took 3 commits, 4 becomes visible too
+        self.record(3, 0)
+        self.assertEqual(visible_revision(self.connection, 0, 10), 4)
+
+    def test_an_old_gap_is_a_rolled_back_write(self):
+        self.record(1, 60)
+        self.record(3, 60)
+        self.record(5, 0)
+        self.assertEqual(visible_revision(self.connection, 0, 10), 3)
+        self.assertEqual(visible_revision(self.connection, None, 10), 3)
+
+    def test_a_fresh_cursor_starts_below_young_changes(self):
+        self.record(4, 0)
+        self.record(6, 0)
+        self.assertEqual(visible_revision(self.connection, None, 10), 4)
+
+    def test_keys_past_the_gap_wait_for_it(self):
+        self.record(1, 0, 's1')
+        self.record(3, 0, 's3')
+        self.assertEqual(read_changed_keys(self.connection, 0, 10), (1, [('dev', 'AM1', 'APP', 's1', 'primary')]))
+        self.record(2, 0, 's2')
+        (revision, keys) = read_changed_keys(self.connection, 1, 10)
+        self.assertEqual((revision, sorted(keys)), (3, [('dev', 'AM1', 'APP', 's2', 'primary'),
+                ('dev', 'AM1', 'APP', 's3', 'primary')]))
+
+    def test_a_pruned_cursor_starts_over(self):
+        for revision in (1, 2, 3):
+            self.record(revision, 60)
+        unit_of_work = sessionmaker(bind=self.connection)()
+        self.assertEqual(prune_changes(unit_of_work, models.utc_now(), batch_size=1), 2)
+        unit_of_work.close()
+        # The latest change stays behind, so the revision never goes back
+        self.assertEqual([row[0] for row in self.connection.execute(sa.select([models.Change.__table__.c.revision]))], [3])
+        self.assertEqual(read_changed_keys(self.connection, 1, 10), (3, None))
+        self.assertEqual(read_changed_keys(self.connection, 2, 10), (3, [('dev', 'AM1', 'APP', 's0', 'primary')]))
+
+
+class ChangeFeedTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=2).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def feed(self, since=None):
+        params = {'timeout': 0}
+        if since is not None:
+            params['since'] = since
+        response = await self.service.request('GET', '/deployments/changes', params=params)
+        self.assertEqual(response.status, 200)
+        return await response.json()
+
+    async def test_changes_follow_the_revision(self):
+        revision = (await self.feed())['revision']
+        await self.service.request('DELETE', DEPLOYMENT)
+        feed = await self.feed(revision)
+        self.assertEqual([change['stripe'] for change in feed['changes']], ['s0'])
+        self.assertEqual((await self.feed(feed['revision']))['changes'], [])
+
+    async def test_a_pruned_cursor_is_told_to_start_over(self):
+        for stripe in ('s0', 's1'):
+            await self.service.request('DELETE', '/deployments/dev/AM1/APP/%s/primary' % stripe)
+        application = self.service.application
+        self.assertEqual(await ChangePruner(application['db_pool'], application['db_executor'], -1).prune(), 1)
+        self.assertEqual(await self.feed(0), {'revision': 2, 'changes': [], 'reset': True})
+        feed = await self.feed(1)
+        self.assertEqual((feed['revision'], [change['stripe'] for change in feed['changes']]), (2, ['s1']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import asyncio
+import unittest
+import support
+from aiohttp import web
+from versioning_service.coalescing import RequestCoalescer
+
+
+class RequestCoalescerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.coalescer = RequestCoalescer(window=60)
+        self.computed = 0
+
+    async def read(self, text, released=None):
+        self.computed += 1
+        if released is not None:
+            await released.wait()
+        return web.Response(text=text)
+
+    async def test_identical_requests_share_one_response(self):
+        released = asyncio.Event()
+        requests = [asyncio.ensure_future(self.coalescer.handle('key', lambda: self.read('old', released))) for _ in range(3)]
+        await asyncio.sleep(0)
+        released.set()
+        self.assertEqual([response.text for response in await asyncio.gather(*requests)], ['old'] * 3)
+        self.assertEqual((await self.coalescer.handle('key', lambda: self.read('new'))).text, 'old')
+        self.assertEqual(self.computed, 1)
+
+    async def test_requests_after_a_clear_do_not_join_a_read_in_flight(self):
+        released = asyncio.Event()
+        before = asyncio.ensure_future(self.coalescer.handle('key', lambda: self.read('old', released)))
+        await asyncio.sleep(0)
+        self.coalescer.clear()
+        after = asyncio.ensure_future(self.coalescer.handle('key', lambda: self.read('new')))
+        released.set()
+        self.assertEqual((await before).text, 'old')
+        self.assertEqual((await after).text, 'new')
+        # Neither does the read that raced the write get stored for later requests
+        self.assertEqual((await self.coalescer.handle('key', lambda: self.read('newest'))).text, 'new')
+        self.assertEqual(self.coalescer.statistics()['pending'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import support
+
+
+DEPLOYMENT = '/deployments/dev/AM1/APP/s0/primary'
+UPGRADE = {'image_version': '2', 'artifact_version': '2.0', 'configuration_version': 'master'}
+
+
+class ConditionalReadTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=2).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def status(self, path, **headers):
+        response = await self.service.request('GET', path, headers=headers)
+        await response.read()
+        return response.status
+
+    async def assert_revalidates(self, path):
+        response = await self.service.request('GET', path)
+        self.assertEqual(response.status, 200)
+        (etag, last_modified) = (response.headers['ETag'], response.headers['Last-Modified'])
+        self.assertEqual(await self.status(path, **{'If-None-Match': etag}), 304)
+        self.assertEqual(await self.status(path, **{'If-None-Match': '"other", W/' + etag}), 304)
+        self.assertEqual(await self.status(path, **{'If-None-Match': '*'}), 304)
+        self.assertEqual(await self.status(path, **{'If-Modified-Since': last_modified}), 304)
+        # An entity tag that no longer matches wins over a date that still does
+        self.assertEqual(await self.status(path, **{'If-None-Match': '"other"', 'If-Modified-Since': last_modified}), 200)
+        return etag
+
+    async def test_deployments(self):
+        etag = await self.assert_revalidates(DEPLOYMENT)
+        await self.service.request('PATCH', DEPLOYMENT, data=UPGRADE)
+        self.assertEqual(await self.status(DEPLOYMENT, **{'If-None-Match': etag}), 200)
+
+    async def test_collections(self):
+        etag = await self.assert_revalidates('/deployments')
+        await self.service.request('DELETE', DEPLOYMENT)
+        self.assertEqual(await self.status('/deployments', **{'If-None-Match': etag}), 200)
+
+    async def test_artifacts(self):
+        await self.assert_revalidates('/artifacts/com.example/artifact')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+import support
+
+
+DEPLOYMENT = '/deployments/dev/AM1/APP/s0/primary'
+UPGRADE = {'image_version': '2', 'artifact_version': '2.0', 'configuration_version': 'master'}
+
+
+class ConditionalWriteTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service().__aenter__()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def etag(self):
+        # Only the stored versions, so Artifactory is not asked for a download URL
+        response = await self.service.request('GET', DEPLOYMENT, params={'fields': 'artifact_version'})
+        self.assertEqual(response.status, 200)
+        return response.headers['ETag']
+
+    async def test_a_matching_tag_upgrades_and_returns_the_new_tag(self):
+        etag = await self.etag()
+        response = await self.service.request('PATCH', DEPLOYMENT, data=UPGRADE, headers={'If-Match': etag})
+        self.assertEqual(response.status, 204)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.headers['ETag'], await self.etag())
+
+    async def test_a_stale_tag_fails_the_precondition(self):
+        etag = await self.etag()
+        await self.service.request('PATCH', DEPLOYMENT, data=UPGRADE, headers={'If-Match': etag})
+        response = await self.service.request('PATCH', DEPLOYMENT, data=dict(UPGRADE, artifact_version='3.0'),
+                headers={'If-Match': etag})
+        self.assertEqual(response.status, 412)
+
+    async def test_weak_tags_never_match(self):
+        response = await self.service.request('PATCH', DEPLOYMENT, data=UPGRADE, headers={'If-Match': 'W/' + await self.etag()})
+        self.assertEqual(response.status, 412)
+
+    async def test_writing_the_current_versions_conflicts(self):
+        response = await self.service.request('PATCH', DEPLOYMENT,
+                data={'image_version': '1', 'artifact_version': '1.0', 'configuration_version': 'master'},
+                headers={'If-Match': await self.etag()})
+        self.assertEqual(response.status, 409)
+
+    async def test_an_unconditional_patch_still_upgrades(self):
+        self.assertEqual((await self.service.request('PATCH', DEPLOYMENT, data=UPGRADE)).status, 204)
+        self.assertEqual((await self.service.request('PATCH', DEPLOYMENT, data=UPGRADE)).status, 409)
+
+    async def test_delete_honours_the_tag(self):
+        etag = await self.etag()
+        await self.service.request('PATCH', DEPLOYMENT, data=UPGRADE, headers={'If-Match': etag})
+        self.assertEqual((await self.service.request('DELETE', DEPLOYMENT, headers={'If-Match': etag})).status, 412)
+        self.assertEqual((await self.service.request('DELETE', DEPLOYMENT, headers={'If-Match': await self.etag()})).status, 204)
+        self.assertEqual((await self.service.request('GET', DEPLOYMENT)).status, 404)
+
+    async def test_creating_with_a_tag_fails_the_precondition(self):
+        response = await self.service.request('POST', '/deployments/dev/AM1/APP/s9/primary', headers={'If-Match': '"1-1"'},
+                data=dict(UPGRADE, image_name='image', artifact_group='com.example', artifact_name='artifact',
+                    git_repository='git@example.com:config.git'))
+        self.assertEqual(response.status, 412)
+
+    async def test_only_one_of_several_writers_holding_one_tag_wins(self):
+        etag = await self.etag()
+        responses = await asyncio.gather(*[self.service.request('PATCH', DEPLOYMENT,
+                data=dict(UPGRADE, artifact_version='2.%d' % i), headers={'If-Match': etag}) for i in range(5)])
+        self.assertEqual(sorted(response.status for response in responses), [204, 412, 412, 412, 412])
+
+
+if __name__ == '__main__':
+    unittest.main()
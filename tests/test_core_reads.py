@@ -0,0 +1,53 @@
+import unittest
+import sqlalchemy as sa
+from aiohttp import web
+from sqlalchemy.orm import sessionmaker
+import support
+from versioning_service import projection, views
+from versioning_service.db import models
+from versioning_service.db.bulk import DEPLOYMENT_KEY
+from versioning_service.db.loading import DimensionCache, deployment_query
+
+
+class CoreReadTest(unittest.TestCase):
+    def setUp(self):
+        self.app = web.Application()
+        views.DeploymentView.setup_routes(self.app)
+        self.engine = sa.create_engine('sqlite://')
+        models.Base.metadata.create_all(self.engine)
+        support.seed(self.engine, stripes=2)
+        self.unit_of_work = sessionmaker(bind=self.engine)()
+        self.unit_of_work.query(models.Deployment).filter_by(stripe='s1').one().deactivate('tester', 5)
+        self.unit_of_work.commit()
+
+    def tearDown(self):
+        self.unit_of_work.close()
+
+    def uri(self, key):
+        return views._deployment_uri(self.app, key)
+
+    def test_full_documents_match_the_orm(self):
+        DimensionCache().prime(self.unit_of_work)
+        expected = [views._deployment_document(deployment, self.app) for deployment in deployment_query(self.unit_of_work)
+                .order_by(models.Deployment.deployment_key)]
+        rows = self.unit_of_work.execute(projection.select_deployments(models.Deployment, None, ()))
+        documents = [projection.full_document(row, self.uri)[0] for row in rows]
+        self.assertEqual(documents, expected)
+        self.assertEqual((documents[1]['is_active'], documents[1]['deactivated_utc']), (False, 5))
+        self.assertNotIn('deactivated_utc', documents[0])
+
+    def test_projected_rows_carry_only_their_fields(self):
+        query = projection.select_deployments(models.Deployment, ('uri', 'artifact_download_url'), DEPLOYMENT_KEY)
+        row = self.unit_of_work.execute(query, dict(zip(DEPLOYMENT_KEY, ('dev', 'AM1', 'APP', 's0', 'primary')))).one()
+        (deployment_key, document, artifact) = projection.row_document(row, ('uri', 'artifact_download_url'), self.uri)
+        self.assertEqual(dict(document), {'uri': '/deployments/dev/AM1/APP/s0/primary', 'artifact_download_url': None})
+        self.assertEqual(artifact, ('http://127.0.0.1:1', 'com.example', 'artifact', '1.0'))
+
+    def test_each_shape_is_built_once(self):
+        query = projection.select_deployments(models.Deployment, ('stripe',), ('is_active',), limit=True)
+        self.assertIs(projection.select_deployments(models.Deployment, ('stripe',), ('is_active',), limit=True), query)
+        self.assertIsNot(projection.select_deployments(models.Deployment, ('stripe',), ('is_active',)), query)
+
+
+if __name__ == '__main__':
+    unittest.main()
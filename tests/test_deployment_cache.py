@@ -0,0 +1,85 @@
+import unittest
+import support
+from versioning_service.cache import CachedDeployment, DeploymentCache
+
+
+DEPLOYMENT = '/deployments/dev/AM1/APP/s0/primary'
+UPGRADE = {'image_version': '2', 'artifact_version': '2.0', 'configuration_version': 'master'}
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def cached(stripe, name='artifact'):
+    return CachedDeployment({'stripe': stripe}, {}, ('http://artifactory', 'com.example', name, '1.0'))
+
+
+class DeploymentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = DeploymentCache(max_size=2, ttl=10, replica_lag=5, clock=self.clock)
+
+    def test_entries_expire_and_the_least_recently_used_goes_first(self):
+        for stripe in ('s0', 's1'):
+            self.cache.put(stripe, cached(stripe))
+        self.cache.get('s0')
+        self.cache.put('s2', cached('s2'))
+        self.assertIsNone(self.cache.get('s1'))
+        self.assertEqual(self.cache.get('s0').document, {'stripe': 's0'})
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get('s0'))
+
+    def test_a_read_that_raced_a_write_is_not_stored(self):
+        generation = self.cache.generation
+        self.cache.invalidate('s0')
+        self.cache.put('s0', cached('s0'), generation)
+        self.assertIsNone(self.cache.get('s0'))
+
+    def test_replica_reads_are_not_stored_until_the_replicas_caught_up(self):
+        self.cache.invalidate('s0')
+        self.cache.put('s0', cached('s0'), replica=True)
+        self.assertIsNone(self.cache.get('s0'))
+        self.cache.put('s1', cached('s1'), replica=True)
+        self.assertIsNotNone(self.cache.get('s1'))
+        self.clock.now = 5
+        self.cache.put('s0', cached('s0'), replica=True)
+        self.assertIsNotNone(self.cache.get('s0'))
+
+    def test_invalidating_an_artifact_drops_its_deployments(self):
+        self.cache.put('s0', cached('s0'))
+        self.cache.put('s1', cached('s1', 'other'))
+        self.cache.invalidate_artifact('com.example', 'artifact')
+        self.assertEqual((self.cache.get('s0'), self.cache.get('s1').document), (None, {'stripe': 's1'}))
+
+
+class CachedReadTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=2).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def image_version(self):
+        response = await self.service.request('GET', DEPLOYMENT, params={'fields': 'image_version'})
+        return (await response.json())['image_version']
+
+    async def statistics(self):
+        return await (await self.service.request('GET', '/status/deployment-cache')).json()
+
+    async def test_writes_invalidate_what_reads_cached(self):
+        self.assertEqual([await self.image_version() for _ in range(2)], ['1', '1'])
+        statistics = await self.statistics()
+        self.assertEqual((statistics['size'], statistics['hits']), (1, 1))
+        await self.service.request('PATCH', DEPLOYMENT, data=UPGRADE)
+        self.assertEqual(await self.image_version(), '2')
+        await self.service.request('DELETE', DEPLOYMENT)
+        self.assertEqual((await self.service.request('GET', DEPLOYMENT)).status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import support
+
+
+NEW_DEPLOYMENT = {'image_name': 'image', 'image_version': '1', 'artifact_group': 'com.example', 'artifact_name': 'artifact',
+        'artifact_version': '1.0', 'git_repository': 'git@example.com:config.git', 'configuration_version': 'master'}
+
+
+class DiffTest(unittest.IsolatedAsyncioTestCase):
+    # dev/AM1 has s0, s1 and s2; dev/AM2 has s0 as it is, s1 on another version and s3 instead of s2
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=3).__aenter__()
+        for (stripe, version) in (('s0', '1'), ('s1', '2'), ('s3', '1')):
+            response = await self.service.request('POST', '/deployments/dev/AM2/APP/%s/primary' % stripe,
+                    data=dict(NEW_DEPLOYMENT, image_version=version))
+            self.assertEqual(response.status, 201)
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def diff(self, left, right, status=200):
+        response = await self.service.request('GET', '/deployments/diff', params={'left': left, 'right': right})
+        self.assertEqual(response.status, status)
+        return await response.json() if status == 200 else None
+
+    async def test_only_differences_are_listed(self):
+        document = await self.diff('dev/AM1', 'dev/AM2')
+        self.assertEqual((document['left'], document['right']), ({'environment': 'dev', 'data_center': 'AM1'},
+                {'environment': 'dev', 'data_center': 'AM2'}))
+        differences = document['differences']
+        self.assertEqual([(difference['stripe'], difference['status']) for difference in differences],
+                [('s1', 'changed'), ('s2', 'left_only'), ('s3', 'right_only')])
+        self.assertEqual(differences[0]['differences'], ['image_version'])
+        self.assertEqual((differences[0]['left']['image_version'], differences[0]['right']['image_version']), ('1', '2'))
+        self.assertEqual((differences[1]['right'], differences[2]['left']), (None, None))
+
+    async def test_applications_pair_up_across_names(self):
+        response = await self.service.request('POST', '/deployments/dev/AM2/OTHER/s0/primary', data=NEW_DEPLOYMENT)
+        self.assertEqual(response.status, 201)
+        document = await self.diff('dev/AM1/APP', 'dev/AM2/OTHER')
+        self.assertEqual([(difference['stripe'], difference['status']) for difference in document['differences']],
+                [('s1', 'left_only'), ('s2', 'left_only')])
+
+    async def test_scopes_must_be_alike(self):
+        await self.diff('dev/AM1', 'dev/AM2/APP', 400)
+        await self.diff('dev', 'dev/AM2', 400)
+        await self.diff('dev//APP', 'dev/AM2/APP', 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import asyncio
+import time
+import unittest
+import support
+
+
+DEPLOYMENT = '/deployments/dev/AM1/APP/s0/primary'
+NEW_DEPLOYMENT = {'image_name': 'image', 'image_version': '1', 'artifact_group': 'com.example', 'artifact_name': 'artifact',
+        'artifact_version': '1.0', 'git_repository': 'git@example.com:config.git', 'configuration_version': 'master'}
+
+
+class UnreachableArtifactoryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=2).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def test_a_read_leaves_the_download_url_out_with_a_warning(self):
+        response = await self.service.request('GET', DEPLOYMENT)
+        self.assertEqual(response.status, 200)
+        self.assertIn('Warning', response.headers)
+        document = await response.json()
+        self.assertIsNone(document['artifact_download_url'])
+        self.assertEqual(len(document['warnings']), 1)
+        response = await self.service.request('GET', DEPLOYMENT, params={'fields': 'stripe,artifact_download_url'})
+        self.assertEqual(set(await response.json()), set(['stripe', 'artifact_download_url', 'warnings']))
+
+    async def test_partial_false_fails_the_read_instead(self):
+        response = await self.service.request('GET', DEPLOYMENT, params={'partial': 'false'})
+        self.assertEqual(response.status, 502)
+
+    async def test_a_create_succeeds_once_the_row_is_written(self):
+        path = '/deployments/dev/AM1/APP/s9/primary'
+        response = await self.service.request('POST', path, data=NEW_DEPLOYMENT)
+        self.assertEqual(response.status, 201)
+        self.assertIn('Warning', response.headers)
+        self.assertIsNone((await response.json())['artifact_download_url'])
+        self.assertEqual((await self.service.request('POST', path, data=NEW_DEPLOYMENT)).status, 405)
+
+    async def test_collections_leave_every_download_url_out(self):
+        response = await self.service.request('GET', '/deployments')
+        self.assertEqual(response.status, 200)
+        self.assertIn('2 deployment(s)', response.headers['Warning'])
+
+
+class SlowArtifactoryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=2, artifactory=True, download_url_timeout=0.3).__aenter__()
+        self.service.artifactory.latency = 2
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def test_a_read_waits_at_most_the_download_url_timeout(self):
+        started = time.monotonic()
+        response = await self.service.request('GET', DEPLOYMENT)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertIsNone((await response.json())['artifact_download_url'])
+        self.assertEqual((await self.service.request('GET', DEPLOYMENT, params={'partial': 'false'})).status, 504)
+
+    async def test_a_read_waiting_on_artifactory_does_not_hold_a_connection(self):
+        # The in-memory database has a single connection, so holding it would hold up every other request
+        read = asyncio.ensure_future(self.service.request('GET', DEPLOYMENT, params={'partial': 'false'}))
+        await asyncio.sleep(0.1)
+        started = time.monotonic()
+        response = await self.service.request('GET', '/deployments/dev/AM1/APP/s1/primary', params={'fields': 'stripe'})
+        self.assertEqual(response.status, 200)
+        self.assertLess(time.monotonic() - started, 0.2)
+        await read
+
+
+if __name__ == '__main__':
+    unittest.main()
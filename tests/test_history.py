@@ -0,0 +1,84 @@
+import datetime
+import unittest
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+import support
+from versioning_service.db import models
+from versioning_service.db.archive import DeploymentArchiver, archive_deployments
+
+
+DEPLOYMENT = '/deployments/dev/AM1/APP/s0/primary'
+UPGRADE = {'image_version': '2', 'artifact_version': '2.0', 'configuration_version': 'master'}
+
+
+class AsOfTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=2).__aenter__()
+        self.before = models.utc_now() - 1
+        response = await self.service.request('PATCH', DEPLOYMENT, data=UPGRADE)
+        self.assertEqual(response.status, 204)
+        self.after = models.utc_now()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def image_version(self, as_of, path=DEPLOYMENT):
+        response = await self.service.request('GET', path, params={'as_of': as_of, 'fields': 'stripe,image_version'})
+        return response.status, await response.json()
+
+    async def test_a_deployment_reads_as_it_was(self):
+        self.assertEqual(await self.image_version(self.before), (200, {'stripe': 's0', 'image_version': '1'}))
+        self.assertEqual(await self.image_version(self.after), (200, {'stripe': 's0', 'image_version': '2'}))
+        # Before the deployment existed
+        self.assertEqual((await self.image_version(0))[0], 404)
+
+    async def test_collections_read_as_they_were(self):
+        for (as_of, versions) in ((self.before, ['1', '1']), (self.after, ['2', '1']), (0, [])):
+            (status, documents) = await self.image_version(as_of, '/deployments')
+            self.assertEqual(status, 200)
+            self.assertEqual([document['image_version'] for document in sorted(documents, key=lambda d: d['stripe'])],
+                    versions)
+
+    async def test_as_of_takes_an_iso_8601_time(self):
+        moment = datetime.datetime.fromtimestamp(self.before / 1000.0, datetime.timezone.utc).isoformat()
+        self.assertEqual(await self.image_version(moment), (200, {'stripe': 's0', 'image_version': '1'}))
+        response = await self.service.request('GET', DEPLOYMENT, params={'as_of': 'yesterday'})
+        self.assertEqual(response.status, 400)
+
+
+class ArchiveTest(AsOfTest):
+    # Every as_of read reads the same once the replaced row has moved to tDeploymentHistory
+    async def asyncSetUp(self):
+        await super(ArchiveTest, self).asyncSetUp()
+        application = self.service.application
+        self.assertEqual(await DeploymentArchiver(application['db_pool'], application['db_executor'], -1).archive(), 1)
+
+    async def test_archived_rows_leave_the_current_table(self):
+        engine = self.service.application['db_pool'].engine
+        with engine.connect() as connection:
+            count = lambda table: connection.execute(sa.select([sa.func.count()]).select_from(table)).scalar()
+            self.assertEqual((count(models.Deployment.__table__), count(models.DeploymentHistory.__table__)), (2, 1))
+        response = await self.service.request('GET', '/deployments', params={'is_active': 'true', 'fields': 'stripe'})
+        self.assertEqual(len(await response.json()), 2)
+
+
+class ArchiveDeploymentsTest(unittest.TestCase):
+    def test_only_rows_deactivated_before_the_horizon_move(self):
+        engine = sa.create_engine('sqlite://')
+        models.Base.metadata.create_all(engine)
+        support.seed(engine, stripes=3)
+        unit_of_work = sessionmaker(bind=engine)()
+        for (stripe, deactivated_utc) in (('s0', 10), ('s1', 20)):
+            unit_of_work.query(models.Deployment).filter_by(stripe=stripe).one().deactivate('tester', deactivated_utc)
+        unit_of_work.commit()
+        self.assertEqual(archive_deployments(unit_of_work, 15, batch_size=1), 1)
+        self.assertEqual(archive_deployments(unit_of_work, 15, batch_size=1), 0)
+        self.assertEqual(archive_deployments(unit_of_work, 100, batch_size=1), 1)
+        self.assertEqual(sorted(deployment.stripe for deployment in unit_of_work.query(models.DeploymentHistory)),
+                ['s0', 's1'])
+        self.assertEqual([deployment.stripe for deployment in unit_of_work.query(models.Deployment)], ['s2'])
+        unit_of_work.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
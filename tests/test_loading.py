@@ -0,0 +1,74 @@
+import unittest
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+import support
+from versioning_service.db import models
+from versioning_service.db.loading import DimensionCache, deployment_query
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def seed(engine, count, first=0):
+    # Every deployment has dimension rows of its own, so lazy loading would cost queries per row
+    unit_of_work = sessionmaker(bind=engine)()
+    audit = {'effective_username': 'seed', 'effective_utc': 1}
+    for i in range(first, first + count):
+        unit_of_work.add(models.Deployment(environment='dev', data_center='AM1', application='APP', stripe='s%d' % i,
+            instance='primary', image=models.Image(name='image-%d' % i, **audit), image_version='1',
+            artifact=models.Artifact(group='com.example', name='artifact-%d' % i,
+                artifactory=models.Artifactory(base_uri='http://artifactory-%d' % i, **audit), **audit),
+            artifact_version='1.0', configuration=models.Configuration(git_repository='git@example.com:%d.git' % i, **audit),
+            configuration_version='master', **audit))
+    unit_of_work.commit()
+    unit_of_work.close()
+
+
+class DeploymentLoadingTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        models.Base.metadata.create_all(self.engine)
+        self.statements = 0
+        sa.event.listen(self.engine, 'before_cursor_execute', self.count)
+
+    def count(self, *args):
+        self.statements += 1
+
+    def load(self, dimensions):
+        # Returns the statements it took to read every deployment with the relationships documents need
+        unit_of_work = sessionmaker(bind=self.engine)()
+        self.statements = 0
+        dimensions.prime(unit_of_work)
+        rows = [(deployment.image.name, deployment.artifact.name, deployment.artifact.artifactory.base_uri,
+                deployment.configuration.git_repository) for deployment in deployment_query(unit_of_work).all()]
+        unit_of_work.close()
+        return self.statements, rows
+
+    def test_statements_do_not_grow_with_the_rows(self):
+        seed(self.engine, 3)
+        (few, rows) = self.load(DimensionCache())
+        self.assertEqual(rows[0], ('image-0', 'artifact-0', 'http://artifactory-0', 'git@example.com:0.git'))
+        seed(self.engine, 30, 3)
+        (many, rows) = self.load(DimensionCache())
+        self.assertEqual((many, len(rows)), (few, 33))
+
+    def test_primed_dimensions_are_reused_until_they_expire(self):
+        seed(self.engine, 3)
+        clock = Clock()
+        dimensions = DimensionCache(ttl=60, clock=clock)
+        (first, rows) = self.load(dimensions)
+        (cached, rows) = self.load(dimensions)
+        self.assertEqual(cached, first - 3)
+        clock.now = 60
+        self.assertEqual(self.load(dimensions)[0], first)
+        dimensions.invalidate()
+        self.assertEqual(self.load(dimensions)[0], first)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import support
+from versioning_service.metrics import Histogram
+
+
+DEPLOYMENT_ROUTE = '/deployments/{environment}/{data_center}/{application}/{stripe}/{instance}'
+
+
+class HistogramTest(unittest.TestCase):
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram('latency', 'Latency.', (0.1, 1.0), ('route',))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, ('/a',))
+        self.assertEqual(histogram.render()[2:], ['latency_bucket{route="/a",le="0.1"} 1', 'latency_bucket{route="/a",le="1.0"} 2',
+                'latency_bucket{route="/a",le="+Inf"} 3', 'latency_sum{route="/a"} 5.55', 'latency_count{route="/a"} 3'])
+
+
+class MetricsEndpointTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=2).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def metrics(self):
+        response = await self.service.request('GET', '/metrics')
+        self.assertEqual(response.status, 200)
+        self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return (await response.text()).splitlines()
+
+    async def test_requests_are_counted_by_route_pattern(self):
+        for stripe in ('s0', 's1', 's9'):
+            await (await self.service.request('GET', '/deployments/dev/AM1/APP/%s/primary' % stripe,
+                    params={'fields': 'stripe'})).read()
+        lines = await self.metrics()
+        self.assertIn('versioning_http_requests_total{route="%s",method="GET",status="200"} 2' % DEPLOYMENT_ROUTE, lines)
+        self.assertIn('versioning_http_requests_total{route="%s",method="GET",status="404"} 1' % DEPLOYMENT_ROUTE, lines)
+        self.assertIn('versioning_http_requests_in_flight 1', lines)
+
+    async def test_statements_and_pool_statistics_are_exported(self):
+        await (await self.service.request('GET', '/deployments', params={'fields': 'stripe'})).read()
+        lines = await self.metrics()
+        self.assertIn('versioning_db_statements_per_request_count{route="/deployments",method="GET"} 1', lines)
+        self.assertTrue(any(line.startswith('versioning_db_statement_duration_seconds_count{verb="SELECT"}') for line in lines))
+        self.assertIn('versioning_db_pool_in_use 0', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
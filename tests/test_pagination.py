@@ -0,0 +1,43 @@
+import json
+import unittest
+import support
+
+
+class PaginationTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=5).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def test_pages_follow_the_next_link(self):
+        url = self.service.base_url + '/deployments?fields=stripe&limit=2'
+        stripes = []
+        pages = 0
+        while url is not None:
+            response = await self.service.client.get(url)
+            self.assertEqual(response.status, 200)
+            stripes.extend(document['stripe'] for document in await response.json())
+            pages += 1
+            url = response.links.get('next', {}).get('url')
+            if url is not None:
+                url = str(url)
+        self.assertEqual(stripes, ['s%d' % stripe for stripe in range(5)])
+        # The last full page links to an empty one
+        self.assertEqual(pages, 3)
+
+    async def test_a_limit_must_be_positive(self):
+        response = await self.service.request('GET', '/deployments', params={'limit': 0})
+        self.assertEqual(response.status, 400)
+
+    async def test_ndjson_streams_one_deployment_per_line(self):
+        response = await self.service.request('GET', '/deployments', params={'format': 'ndjson', 'fields': 'stripe',
+                'after': 0, 'limit': 3})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+        lines = (await response.text()).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{'stripe': 's0'}, {'stripe': 's1'}, {'stripe': 's2'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+import support
+from versioning_service.db.executor import DatabaseExecutor
+from versioning_service.db.pool import ConnectionPool, PoolTimeout
+
+
+class ConnectionPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.executor = DatabaseExecutor(asyncio.get_event_loop(), max_workers=2)
+        self.pool = ConnectionPool('sqlite:///' + os.path.join(self.directory, 'test.db'), self.executor, size=1,
+                max_overflow=1, timeout=0.1)
+
+    async def asyncTearDown(self):
+        self.pool.dispose()
+        self.executor.shutdown()
+        shutil.rmtree(self.directory)
+
+    async def test_borrowers_beyond_capacity_time_out(self):
+        connections = [await self.pool.acquire() for _ in range(2)]
+        with self.assertRaises(PoolTimeout):
+            await self.pool.acquire()
+        statistics = self.pool.statistics()
+        self.assertEqual((statistics['capacity'], statistics['in_use'], statistics['timeouts']), (2, 2, 1))
+        await self.pool.release(connections.pop())
+        connections.append(await self.pool.acquire())
+        for connection in connections:
+            await self.pool.release(connection)
+        self.assertEqual(self.pool.statistics()['in_use'], 0)
+
+    async def test_a_released_slot_goes_to_the_next_borrower(self):
+        connections = [await self.pool.acquire() for _ in range(2)]
+        waiting = asyncio.ensure_future(self.pool.acquire())
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.pool.statistics()['waiting'], 1)
+        await self.pool.release(connections.pop())
+        connections.append(await waiting)
+        for connection in connections:
+            await self.pool.release(connection)
+
+
+class RequestConnectionTest(unittest.IsolatedAsyncioTestCase):
+    # The in-memory database has a single connection, which the test holds
+    async def asyncSetUp(self):
+        self.service = await support.Service(db_pool_timeout=0.1).__aenter__()
+        self.pool = self.service.application['db_pool']
+        self.connection = await self.pool.acquire()
+
+    async def asyncTearDown(self):
+        if self.connection is not None:
+            await self.pool.release(self.connection)
+        await self.service.__aexit__(None, None, None)
+
+    async def test_a_request_without_a_connection_is_unavailable(self):
+        response = await self.service.request('GET', '/deployments', params={'fields': 'stripe'})
+        self.assertEqual(response.status, 503)
+        await self.pool.release(self.connection)
+        self.connection = None
+        response = await self.service.request('GET', '/deployments', params={'fields': 'stripe'})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.pool.statistics()['in_use'], 0)
+
+    async def test_requests_that_do_not_query_borrow_nothing(self):
+        response = await self.service.request('GET', '/status/db-pool')
+        self.assertEqual(response.status, 200)
+        self.assertEqual((await response.json())['timeouts'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
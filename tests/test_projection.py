@@ -0,0 +1,42 @@
+import unittest
+import support
+
+
+class ProjectionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=2, gzip_min_size=100).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def get(self, params, **headers):
+        response = await self.service.request('GET', '/deployments', params=params, headers=headers)
+        self.assertEqual(response.status, 200)
+        return response, await response.json()
+
+    async def test_fields_come_in_the_order_asked(self):
+        (response, documents) = await self.get({'fields': 'image_version,stripe,image_version'})
+        self.assertEqual([list(document.items()) for document in documents],
+                [[('image_version', '1'), ('stripe', 's0')], [('image_version', '1'), ('stripe', 's1')]])
+
+    async def test_unknown_fields_are_rejected(self):
+        for fields in ('stripe,colour', ','):
+            response = await self.service.request('GET', '/deployments', params={'fields': fields})
+            self.assertEqual(response.status, 400)
+
+    async def test_columnar_names_the_columns_once(self):
+        (response, document) = await self.get({'fields': 'stripe,artifact_version', 'format': 'columnar'})
+        self.assertEqual(document, {'columns': ['stripe', 'artifact_version'], 'rows': [['s0', '1.0'], ['s1', '1.0']]})
+
+    async def test_large_responses_are_compressed_for_clients_that_accept_it(self):
+        (response, documents) = await self.get({}, **{'Accept-Encoding': 'gzip'})
+        self.assertEqual((response.headers.get('Content-Encoding'), response.headers['Vary']), ('gzip', 'Accept-Encoding'))
+        self.assertEqual(len(documents), 2)
+        (response, documents) = await self.get({}, **{'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        (response, documents) = await self.get({'fields': 'stripe'}, **{'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
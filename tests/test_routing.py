@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+import aiohttp
+import sqlalchemy as sa
+import support
+import versioning
+from versioning_service.db.routing import ReplicaRouter
+
+
+UPGRADE = {'image_version': '2', 'artifact_version': '2.0', 'configuration_version': 'master'}
+
+
+class Replica(object):
+    def __init__(self, name):
+        self.name = name
+        self.healthy = True
+
+    async def probe(self, timeout):
+        if not self.healthy:
+            raise sa.exc.OperationalError('SELECT 1', {}, Exception('unreachable'))
+
+    def statistics(self):
+        return {'name': self.name}
+
+
+class ReplicaRouterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_reads_go_round_the_healthy_replicas(self):
+        replicas = [Replica('a'), Replica('b')]
+        router = ReplicaRouter('primary', replicas)
+        self.assertEqual([router.for_read().name for _ in range(3)], ['a', 'b', 'a'])
+        replicas[0].healthy = False
+        await router.check()
+        self.assertEqual([router.for_read().name for _ in range(2)], ['b', 'b'])
+        self.assertEqual(router.statistics(), [{'name': 'a', 'healthy': False}, {'name': 'b', 'healthy': True}])
+        # With none healthy, the primary serves reads too
+        replicas[1].healthy = False
+        await router.check()
+        self.assertEqual(router.for_read(), 'primary')
+        replicas[0].healthy = True
+        await router.check()
+        self.assertEqual(router.for_read().name, 'a')
+
+
+class ReadRoutingTest(unittest.IsolatedAsyncioTestCase):
+    # The replica is a database of its own with more deployments than the primary, so reads show where they went
+    async def asyncSetUp(self):
+        self.directory = tempfile.mkdtemp()
+        replica_url = 'sqlite:///' + os.path.join(self.directory, 'replica.db')
+        versioning.create_schema(replica_url)
+        engine = sa.create_engine(replica_url)
+        support.seed(engine, stripes=3)
+        engine.dispose()
+        self.service = await support.Service(db_url='sqlite:///' + os.path.join(self.directory, 'primary.db'),
+                db_replica_urls=[replica_url], read_your_writes_window=60, coalesce_reads=False).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+        shutil.rmtree(self.directory)
+
+    async def count(self, client):
+        response = await client.get(self.service.base_url + '/deployments', params={'is_active': 'true', 'fields': 'stripe'})
+        return len(await response.json())
+
+    async def test_writes_go_to_the_primary_and_pin_their_client_to_it(self):
+        self.assertEqual(await self.count(self.service.client), 3)
+        response = await self.service.request('PATCH', '/deployments/dev/AM1/APP/s0/primary', data=UPGRADE)
+        self.assertEqual(response.status, 204)
+        self.assertEqual(await self.count(self.service.client), 1)
+        async with aiohttp.ClientSession(cookies=support.session_cookie('other')) as other:
+            self.assertEqual(await self.count(other), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import json
+import unittest
+import sqlalchemy as sa
+import support
+from versioning_service.db import models
+from versioning_service.db.snapshot import SnapshotError, export_snapshot, import_snapshot
+
+
+def export_lines(engine):
+    with engine.connect() as connection:
+        return [line for batch in export_snapshot(connection, batch_size=2) for line in batch]
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://')
+        models.Base.metadata.create_all(self.engine)
+        support.seed(self.engine, stripes=3)
+
+    def empty_engine(self):
+        engine = sa.create_engine('sqlite://')
+        models.Base.metadata.create_all(engine)
+        return engine
+
+    def test_a_snapshot_loads_into_an_empty_database_unchanged(self):
+        lines = export_lines(self.engine)
+        self.assertEqual(json.loads(lines[0]), {'format': 'versioning-snapshot', 'version': 1})
+        engine = self.empty_engine()
+        with engine.connect() as connection:
+            counts = import_snapshot(connection, lines, batch_size=2)
+        self.assertEqual(counts, {'tImage': 1, 'tArtifactory': 1, 'tArtifact': 1, 'tConfiguration': 1, 'tDeployment': 3})
+        self.assertEqual(export_lines(engine), lines)
+        # Feed subscribers hear about every deployment the import made current
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(sa.select([sa.func.count()]).select_from(models.Change.__table__)).scalar(), 3)
+
+    def test_errors_name_the_line(self):
+        lines = export_lines(self.engine)
+        engine = self.empty_engine()
+        for (broken, message) in ((lines[1:], 'line 1: expected a versioning-snapshot version 1 header'),
+                (lines[:2] + ['{"table": "tNothing", "row": {}}\n'], 'line 3: expected a row of one of'),
+                ([], 'empty snapshot')):
+            with engine.connect() as connection:
+                with self.assertRaises(SnapshotError) as raised:
+                    import_snapshot(connection, broken)
+            self.assertIn(message, str(raised.exception))
+        # Nothing of a failed import is left behind
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(sa.select([sa.func.count()]).select_from(models.Image.__table__)).scalar(), 0)
+
+
+class SnapshotEndpointTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.service = await support.Service(stripes=2).__aenter__()
+
+    async def asyncTearDown(self):
+        await self.service.__aexit__(None, None, None)
+
+    async def export(self):
+        response = await self.service.request('GET', '/admin/snapshot')
+        self.assertEqual(response.status, 200)
+        return await response.read()
+
+    async def test_importing_the_same_deployments_again_conflicts(self):
+        snapshot = await self.export()
+        response = await self.service.request('POST', '/admin/snapshot', data=snapshot)
+        self.assertEqual(response.status, 409)
+        self.assertEqual(await self.export(), snapshot)
+
+    async def test_a_snapshot_without_deployments_keeps_the_rows_there_already(self):
+        snapshot = b''.join(line + b'\n' for line in (await self.export()).splitlines() if b'"tDeployment"' not in line)
+        response = await self.service.request('POST', '/admin/snapshot', data=snapshot)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(await response.json(), {'tImage': 0, 'tArtifactory': 0, 'tArtifact': 0, 'tConfiguration': 0,
+                'tDeployment': 0})
+
+    async def test_a_malformed_snapshot_is_rejected(self):
+        response = await self.service.request('POST', '/admin/snapshot', data=b'{"format": "other"}\n')
+        self.assertEqual(response.status, 400)
+        self.assertIn('line 1', await response.text())
+
+
+if __name__ == '__main__':
+    unittest.main()
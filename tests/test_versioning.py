@@ -0,0 +1,120 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+import aiohttp
+import support
+import versioning
+from versioning_service import views
+
+
+class FinalizeTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server, self.application, self.handler = await versioning.initialize(asyncio.get_event_loop(),
+                host='127.0.0.1', port=0)
+        self.base_url = 'http://127.0.0.1:%d' % self.server.sockets[0].getsockname()[1]
+        self.client = aiohttp.ClientSession()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    async def finalize(self, shutdown_timeout=5.0):
+        started = time.monotonic()
+        await asyncio.wait_for(versioning.finalize(self.server, self.application, self.handler, shutdown_timeout), 10)
+        return time.monotonic() - started
+
+    async def test_idle_keep_alive_connections_do_not_hold_up_shutdown(self):
+        response = await self.client.get(self.base_url + '/status/db-pool')
+        await response.read()
+        self.assertLess(await self.finalize(), 1)
+
+    async def test_change_feed_subscribers_are_let_go(self):
+        poll = asyncio.ensure_future(self.client.get(self.base_url + '/deployments/changes', params={'since': 0, 'timeout': 30}))
+        websocket = await self.client.ws_connect(self.base_url + '/deployments/changes?since=0')
+        message = asyncio.ensure_future(websocket.receive())
+        await asyncio.sleep(0.2)
+        self.assertLess(await self.finalize(), 1)
+        self.assertEqual((await poll).status, 200)
+        self.assertEqual((await message).type, aiohttp.WSMsgType.CLOSE)
+
+    async def test_requests_in_progress_are_finished(self):
+        get = views.DatabasePoolView.get
+
+        async def slow_get(view):
+            await asyncio.sleep(0.5)
+            return await get(view)
+        views.DatabasePoolView.get = slow_get
+        try:
+            request = asyncio.ensure_future(self.client.get(self.base_url + '/status/db-pool'))
+            await asyncio.sleep(0.1)
+            await self.finalize()
+            self.assertEqual((await request).status, 200)
+        finally:
+            views.DatabasePoolView.get = get
+
+
+class ArgumentsTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, value):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as destination:
+            destination.write(value if isinstance(value, str) else json.dumps(value))
+        return path
+
+    def refuses(self, *argv):
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            versioning._parse_arguments(list(argv))
+
+    def test_defaults_match_initialize(self):
+        options = versioning._initialize_options(versioning._parse_arguments([]))
+        self.assertEqual(options['db_pool_size'], 5)
+        self.assertTrue(options['db_pool_pre_ping'])
+        self.assertIsNone(options['history_retention'])
+        self.assertIsNone(options['auth_directory'])
+        self.assertEqual(options['coalesce_window'], 0)
+        self.assertFalse(options['deployment_cache_warm'])
+
+    def test_every_option_reaches_initialize(self):
+        options = versioning._initialize_options(versioning._parse_arguments(['--db-pool-size', '2', '--db-max-overflow', '0',
+                '--db-pool-timeout', '3', '--db-pool-recycle', '60', '--no-db-pool-pre-ping', '--history-retention', '86400',
+                '--history-archive-interval', '600', '--auth-directory', self.write('directory.json', {'alice': ['ops']}),
+                '--auth-rules', self.write('rules.json', {'write': ['ops']}), '--auth-groups-ttl', '30',
+                '--auth-decision-ttl', '10', '--coalesce-window', '0.5', '--warm-deployment-cache']))
+        self.assertEqual([options[name] for name in ('db_pool_size', 'db_max_overflow', 'db_pool_timeout', 'db_pool_recycle',
+                'db_pool_pre_ping', 'history_retention', 'history_archive_interval', 'auth_rules', 'auth_groups_ttl',
+                'auth_decision_ttl', 'coalesce_window', 'deployment_cache_warm')],
+                [2, 0, 3, 60, False, 86400, 600, {'write': ('ops',)}, 30, 10, 0.5, True])
+        self.assertEqual(options['auth_directory']._members, {'alice': frozenset(['ops'])})
+
+    def test_malformed_values_are_refused(self):
+        self.refuses('--db-pool-size', '0')
+        self.refuses('--coalesce-window', '-1')
+        self.refuses('--history-retention', '0')
+        self.refuses('--auth-directory', os.path.join(self.directory.name, 'missing.json'))
+        self.refuses('--auth-directory', self.write('broken.json', '{'))
+        self.refuses('--auth-directory', self.write('flat.json', {'alice': 'ops'}))
+        self.refuses('--auth-rules', self.write('list.json', [['ops']]))
+
+    async def test_a_directory_restricts_writes_to_its_groups(self):
+        arguments = versioning._parse_arguments(['--auth-directory',
+                self.write('directory.json', {'alice': ['versioning-deployers-dev'], 'bob': []})])
+        options = versioning._initialize_options(arguments)
+        del options['host'], options['port']
+        upgrade = {'image_version': '2', 'artifact_version': '2.0', 'configuration_version': 'master'}
+        for (identity, status) in [('bob', 403), ('alice', 204)]:
+            async with support.Service(identity=identity, **options) as service:
+                response = await service.request('PATCH', '/deployments/dev/AM1/APP/s0/primary', data=upgrade)
+                self.assertEqual(response.status, status, identity)
+
+
+if __name__ == '__main__':
+    unittest.main()
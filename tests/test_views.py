@@ -0,0 +1,53 @@
+import threading
+import unittest
+import sqlalchemy as sa
+import support
+
+
+DEPLOYMENT = '/deployments/dev/AM1/APP/s0/primary'
+NEW_DEPLOYMENT = {'image_name': 'image', 'image_version': '1', 'artifact_group': 'com.example', 'artifact_name': 'artifact',
+        'artifact_version': '1.0', 'git_repository': 'git@example.com:config.git', 'configuration_version': 'master'}
+
+
+class EventLoopTest(unittest.IsolatedAsyncioTestCase):
+    # Every statement runs on a database executor thread, never on the thread running the event loop
+    async def asyncSetUp(self):
+        self.service = await support.Service(artifactory=True).__aenter__()
+        self.loop_thread = threading.current_thread()
+        self.on_loop = []
+        sa.event.listen(self.service.application['db_pool'].engine, 'before_cursor_execute', self.record)
+
+    async def asyncTearDown(self):
+        sa.event.remove(self.service.application['db_pool'].engine, 'before_cursor_execute', self.record)
+        await self.service.__aexit__(None, None, None)
+
+    def record(self, connection, cursor, statement, parameters, context, executemany):
+        if threading.current_thread() is self.loop_thread:
+            self.on_loop.append(statement)
+
+    async def request(self, method, path, status, **kwargs):
+        response = await self.service.request(method, path, **kwargs)
+        await response.read()
+        self.assertEqual(response.status, status, '%s %s' % (method, path))
+        self.assertEqual(self.on_loop, [], '%s %s' % (method, path))
+
+    async def test_deployment_requests(self):
+        await self.request('GET', DEPLOYMENT, 200, params={'fields': 'artifact_version'})
+        await self.request('POST', '/deployments/dev/AM1/APP/s1/primary', 201, data=NEW_DEPLOYMENT)
+        await self.request('PATCH', DEPLOYMENT, 204, data={'image_version': '2', 'artifact_version': '2.0',
+                'configuration_version': 'master'})
+        await self.request('DELETE', DEPLOYMENT, 204)
+        await self.request('GET', '/deployments', 200, params={'partial': 'true'})
+        await self.request('PATCH', '/deployments', 200, json={'filter': {'environment': 'dev'}, 'image_version': '3'})
+        await self.request('GET', '/deployments/changes', 200, params={'since': 0, 'timeout': 0})
+        await self.request('GET', '/deployments/diff', 200, params={'left': 'dev/AM1', 'right': 'dev/AM2'})
+
+    async def test_artifact_requests(self):
+        await self.request('GET', '/artifacts/com.example/artifact', 200)
+        await self.request('POST', '/artifacts/com.example/other', 201, data={'base_uri': 'http://127.0.0.1:2'})
+        await self.request('PUT', '/artifacts/com.example/artifact', 200, data={'base_uri': 'http://127.0.0.1:2'})
+        await self.request('DELETE', '/artifacts/com.example/other', 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
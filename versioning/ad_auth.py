@@ -1,11 +1,175 @@
+import abc
+import asyncio
+import time
+from collections import OrderedDict
 from aiohttp_security.abc import AbstractAuthorizationPolicy
 
 
+# Permission -> the directory groups that grant it, formatted with the permission's context; a group naming a
+# context key the check was not given grants nothing
+DEFAULT_RULES = {'admin': ('versioning-admins',),
+        'write': ('versioning-admins', 'versioning-deployers-{environment}')}
+
+
+class DirectoryBackend(abc.ABC):
+    @abc.abstractmethod
+    async def groups(self, identity):
+        # The groups identity belongs to, or None when the directory does not know it
+        pass
+
+
+class LocalDirectory(DirectoryBackend):
+    # An in-process stand-in for Active Directory, for tests and development
+    def __init__(self, members=None):
+        self._members = {}
+        self.lookups = 0
+        for identity, groups in (members or {}).items():
+            self.set_groups(identity, groups)
+
+    def set_groups(self, identity, groups):
+        if groups is None:
+            self._members.pop(identity, None)
+        else:
+            self._members[identity] = frozenset(groups)
+
+    async def groups(self, identity):
+        self.lookups += 1
+        return self._members.get(identity)
+
+
+class _ExpiringCache(object):
+    def __init__(self, max_size, ttl, clock):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._clock = clock
+        # key -> (expires, value), least recently used first
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires, value = entry
+        if expires <= self._clock():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def put(self, key, value):
+        self._entries[key] = (self._clock() + self._ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, predicate=None):
+        if predicate is None:
+            self._entries.clear()
+        else:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+
+def _context_key(context):
+    if isinstance(context, dict):
+        return tuple(sorted(context.items()))
+    return context
+
+
 class ActiveDirectoryPolicy(AbstractAuthorizationPolicy):
+    def __init__(self, directory=None, rules=None, groups_ttl=300, decision_ttl=60, max_size=10000, clock=time.monotonic):
+        # Without a directory every identified user is authorized for everything
+        self._directory = directory
+        self._rules = DEFAULT_RULES if rules is None else rules
+        self._groups = _ExpiringCache(max_size, groups_ttl, clock)
+        self._decisions = _ExpiringCache(max_size, decision_ttl, clock)
+        # (identity, generation) -> the directory lookup callers of that generation share
+        self._pending = {}
+        # Bumped by every flush, so a lookup that started before it cannot store what it found
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.decision_hits = 0
+        self.decision_misses = 0
+
+    async def _get_groups(self, identity):
+        found, groups = self._groups.get(identity)
+        if found:
+            self.hits += 1
+            return groups
+        key = (identity, self._generation)
+        pending = self._pending.get(key)
+        if pending is None:
+            self.misses += 1
+            pending = asyncio.ensure_future(self._lookup(key))
+            self._pending[key] = pending
+        else:
+            self.coalesced += 1
+        # Shielded so one cancelled caller does not cancel the lookup shared with the others
+        return await asyncio.shield(pending)
+
+    async def _lookup(self, key):
+        (identity, generation) = key
+        try:
+            groups = await self._directory.groups(identity)
+            if generation == self._generation:
+                self._groups.put(identity, groups)
+            return groups
+        finally:
+            del self._pending[key]
+
+    def _granting(self, permission, context):
+        granting = set()
+        for template in self._rules.get(permission, ()):
+            try:
+                granting.add(template.format(**(context if isinstance(context, dict) else {})))
+            except KeyError:
+                pass
+        return granting
+
     async def authorized_userid(self, identity):
-        return identity
+        if identity is None or self._directory is None:
+            return identity
+        return identity if await self._get_groups(identity) is not None else None
 
     async def permits(self, identity, permission, context=None):
         if identity is None:
             return False
-        return True
+        if self._directory is None:
+            return True
+        key = (identity, permission, _context_key(context))
+        found, decision = self._decisions.get(key)
+        if found:
+            self.decision_hits += 1
+            return decision
+        self.decision_misses += 1
+        generation = self._generation
+        groups = await self._get_groups(identity)
+        decision = groups is not None and not groups.isdisjoint(self._granting(permission, context))
+        if generation == self._generation:
+            self._decisions.put(key, decision)
+        return decision
+
+    def flush(self, identity=None):
+        # Forgets everything cached about identity, or about everyone; lookups in flight are not stored
+        self._generation += 1
+        if identity is None:
+            self._groups.discard()
+            self._decisions.discard()
+        else:
+            self._groups.discard(lambda key: key == identity)
+            self._decisions.discard(lambda key: key[0] == identity)
+
+    def statistics(self):
+        return {'groups_size': len(self._groups),
+                'decisions_size': len(self._decisions),
+                'pending': len(self._pending),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'decision_hits': self.decision_hits,
+                'decision_misses': self.decision_misses}
@@ -1,4 +1,4 @@
 #!/bin/sh
 this_dir=$(dirname $0)
-#PYTHONPATH=$this_dir/service:$PYTHONPATH python3 -m aiohttp.web -H $(hostname).rdti.com -P 8081 service:run_server
-PYTHONPATH=$this_dir/service:$PYTHONPATH python3 versioning.py
+#PYTHONPATH=$this_dir:$PYTHONPATH python3 -m aiohttp.web -H $(hostname).rdti.com -P 8081 versioning_service:run_server
+python3 $this_dir/versioning.py "$@"
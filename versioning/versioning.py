@@ -1,57 +1,511 @@
+import argparse
 import asyncio
+import math
+import os
+import json
+import signal
+import sys
+import time
+import traceback
 import sqlalchemy as sa
 from aiohttp import web
 import aiohttp_session
 import aiohttp_security
-from ad_auth import ActiveDirectoryPolicy
-from service import routes
-from service.db import tables
+from ad_auth import ActiveDirectoryPolicy, LocalDirectory
+from versioning_service import routes
+from versioning_service.cache import DeploymentCache
+from versioning_service.coalescing import RequestCoalescer, request_key
+from versioning_service.feed import ChangeNotifier
+from versioning_service.metrics import Metrics
+from versioning_service.views import DeploymentView, DeploymentCollectionView, ArtifactView, warm_deployment_cache
+from versioning_service.artifactory import ArtifactoryClients, ArtifactoryResolver, DownloadUrlCache
+from versioning_service.db import models
+from versioning_service.db.archive import DeploymentArchiver
+from versioning_service.db.changes import ChangePruner, ChangeWatcher
+from versioning_service.db.executor import DatabaseExecutor
+from versioning_service.db.loading import DimensionCache
+from versioning_service.db.pool import ConnectionPool, PoolTimeout, RequestConnection
+from versioning_service.db.routing import ReplicaRouter
+from versioning_service.db.snapshot import SnapshotError, export_snapshot, import_snapshot
+
+
+_SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+_READ_PRIMARY_COOKIE = 'versioning_read_primary_until'
+
+
+def _route_name(request):
+    route = request.match_info.route
+    resource = getattr(route, 'resource', None)
+    if resource is None:
+        return 'unmatched'
+    info = resource.get_info()
+    # The pattern rather than the path, so every deployment shares one series
+    return info.get('formatter') or info.get('path') or 'unmatched'
+
+
+class MetricsMiddlewareFactory(object):
+    def __init__(self, metrics):
+        self._metrics = metrics
+
+    async def __call__(self, app, handler):
+        async def middleware_handler(request):
+            self._metrics.in_flight.value += 1
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status
+                return response
+            except web.HTTPException as e:
+                status = e.status
+                raise
+            finally:
+                self._metrics.in_flight.value -= 1
+                db_connection = getattr(request, 'db_connection', None)
+                self._metrics.observe_request(_route_name(request), request.method, status, time.perf_counter() - started,
+                        0 if db_connection is None else db_connection.statements)
+        return middleware_handler
+
+
+def _pinned_to_primary(request):
+    try:
+        return int(request.cookies.get(_READ_PRIMARY_COOKIE, 0)) > time.time() * 1000
+    except ValueError:
+        return False
+
+
+class CoalescingMiddlewareFactory(object):
+    def __init__(self, coalescer, views=(DeploymentView, DeploymentCollectionView, ArtifactView)):
+        self._coalescer = coalescer
+        self._views = views
+
+    def _coalesces(self, request):
+        # Streamed listings are written as they are read, and a client reading its own writes must not share a replica read
+        return request.method == 'GET' and request.match_info.handler in self._views and \
+                request.rel_url.query.get('format') != 'ndjson' and not _pinned_to_primary(request)
+
+    async def __call__(self, app, handler):
+        async def middleware_handler(request):
+            if self._coalesces(request):
+                return await self._coalescer.handle(request_key(request), lambda: handler(request))
+            response = await handler(request)
+            if request.method not in _SAFE_METHODS and response.status < 400:
+                # This worker's own writes are never hidden behind its micro-cache
+                self._coalescer.clear()
+            return response
+        return middleware_handler
+
+
+def create_schema(db_url):
+    engine = sa.create_engine(db_url)
+    try:
+        models.Base.metadata.create_all(engine)
+    finally:
+        engine.dispose()
 
 
 class DatabaseConnectionMiddlewareFactory(object):
-    def __init__(self, db_engine):
-        self._db_engine = db_engine
-        tables.metadata.create_all(self._db_engine)
+    def __init__(self, db_pool, create_schema=True, replicas=None, read_your_writes_window=None):
+        self._db_pool = db_pool
+        self._replicas = replicas
+        self._read_your_writes_window = read_your_writes_window
+        if create_schema:
+            models.Base.metadata.create_all(self._db_pool.engine)
+
+    def _choose_pool(self, request):
+        if self._replicas is None or request.method not in _SAFE_METHODS or _pinned_to_primary(request):
+            return self._db_pool
+        return self._replicas.for_read()
+
+    def _pin_to_primary(self, request, response):
+        # A client that just wrote reads from the primary until the replicas have had time to catch up
+        if self._read_your_writes_window and request.method not in _SAFE_METHODS and response.status < 400:
+            response.set_cookie(_READ_PRIMARY_COOKIE, str(int((time.time() + self._read_your_writes_window) * 1000)),
+                    max_age=int(math.ceil(self._read_your_writes_window)), httponly=True)
 
     async def __call__(self, app, handler):
         async def middleware_handler(request):
-            request.db_engine = self._db_engine
-            request.db_connection = self._db_engine.connect()
-            return await handler(request)
+            pool = self._choose_pool(request)
+            request.db_engine = pool.engine
+            # Only borrowed from the pool once a view asks for a unit of work
+            request.db_connection = RequestConnection(pool, replica=pool is not self._db_pool)
+            try:
+                response = await handler(request)
+                self._pin_to_primary(request, response)
+                return response
+            except PoolTimeout as e:
+                raise web.HTTPServiceUnavailable(text=str(e))
+            finally:
+                await request.db_connection.release()
         return middleware_handler
 
 
-async def initialize(loop):
-    # TODO: Pass in connection URL as a command line argument
-    db_engine = sa.create_engine("sqlite://")
-    application = web.Application(loop=loop, middlewares=[DatabaseConnectionMiddlewareFactory(db_engine)])
+async def _close_change_feed(application):
+    # Long polls and subscriptions never finish on their own, so they would hold up every shutdown for its whole timeout
+    application['change_notifier'].close()
+
+
+def _changed_elsewhere(application):
+    def changed(keys):
+        application['dimensions'].invalidate()
+        application['request_coalescer'].clear()
+        if keys is None:
+            application['deployment_cache'].clear()
+        else:
+            for key in keys:
+                application['deployment_cache'].invalidate(key)
+        application['change_notifier'].notify()
+    return changed
+
+
+async def initialize(loop, db_url="sqlite://", db_max_workers=8, db_max_concurrency=None,
+        db_pool_size=5, db_max_overflow=10, db_pool_timeout=30, db_pool_recycle=3600, db_pool_pre_ping=True,
+        dimension_cache_ttl=60, deployment_cache_size=10000, deployment_cache_ttl=60, deployment_cache_warm=False,
+        artifactory_cache_size=4096, artifactory_release_ttl=24 * 60 * 60, artifactory_snapshot_ttl=60,
+        artifactory_not_found_ttl=30, artifactory_limit_per_host=16, artifactory_keepalive_timeout=30,
+        artifactory_connect_timeout=5, artifactory_timeout=30, download_url_concurrency=16,
+        download_url_timeout=2.0, download_url_partial_results=True, stream_batch_size=500,
+        change_feed_timeout=30, change_feed_poll_interval=2.0, change_commit_grace=10, change_retention=7 * 24 * 60 * 60,
+        change_prune_interval=3600, history_retention=None,
+        history_archive_interval=3600, history_archive_batch_size=1000, gzip_min_size=1024, host='0.0.0.0', port=8081,
+        reuse_port=False, create_schema=True, db_replica_urls=(), db_replica_health_interval=5, db_replica_health_timeout=2,
+        db_replica_max_lag=5, read_your_writes_window=None, auth_directory=None, auth_rules=None, auth_groups_ttl=300,
+        auth_decision_ttl=60, auth_cache_size=10000, coalesce_reads=True, coalesce_window=0, coalesce_cache_size=1024,
+        cache_sync_interval=None):
+    db_executor = DatabaseExecutor(loop, max_workers=db_max_workers, max_concurrency=db_max_concurrency)
+    pool_options = {'size': db_pool_size, 'max_overflow': db_max_overflow, 'timeout': db_pool_timeout,
+            'recycle': db_pool_recycle, 'pre_ping': db_pool_pre_ping}
+    db_pool = ConnectionPool(db_url, db_executor, **pool_options)
+    # Safe methods read from the replicas, everything else goes to db_url
+    db_replicas = ReplicaRouter(db_pool, [ConnectionPool(url, db_executor, **pool_options) for url in db_replica_urls],
+            health_interval=db_replica_health_interval, health_timeout=db_replica_health_timeout)
+    metrics = Metrics()
+    for pool in [db_pool] + db_replicas.replicas:
+        metrics.instrument_engine(pool.engine)
+    # Identical reads in flight share one response, and with coalesce_window it is reused for that many seconds
+    request_coalescer = RequestCoalescer(window=coalesce_window, max_size=coalesce_cache_size)
+    middlewares = [DatabaseConnectionMiddlewareFactory(db_pool, create_schema, db_replicas if db_replica_urls else None,
+            read_your_writes_window)]
+    if coalesce_reads:
+        # Ahead of the database middleware, so requests sharing another's response never borrow a connection
+        middlewares.insert(0, CoalescingMiddlewareFactory(request_coalescer))
+    # Outermost, so a request's statements are counted after its connection has gone back to the pool
+    application = web.Application(loop=loop, middlewares=[MetricsMiddlewareFactory(metrics)] + middlewares)
+    application['metrics'] = metrics
+    application['request_coalescer'] = request_coalescer
+    application['db_executor'] = db_executor
+    application['db_pool'] = db_pool
+    application['db_replicas'] = db_replicas
+    db_replicas.start()
+    application['dimensions'] = DimensionCache(ttl=dimension_cache_ttl)
+    # Deployments read from a replica are not cached until it has had time to see the latest write to them
+    application['deployment_cache'] = DeploymentCache(max_size=deployment_cache_size, ttl=deployment_cache_ttl,
+            replica_lag=db_replica_max_lag if db_replica_urls else 0)
+    application['artifactory_clients'] = ArtifactoryClients(loop, limit_per_host=artifactory_limit_per_host,
+            keepalive_timeout=artifactory_keepalive_timeout, connect_timeout=artifactory_connect_timeout,
+            total_timeout=artifactory_timeout)
+    application['artifactory'] = ArtifactoryResolver(application['artifactory_clients'], DownloadUrlCache(max_size=artifactory_cache_size,
+            release_ttl=artifactory_release_ttl, snapshot_ttl=artifactory_snapshot_ttl,
+            not_found_ttl=artifactory_not_found_ttl), metrics=metrics)
+    application['download_url_concurrency'] = download_url_concurrency
+    application['download_url_timeout'] = download_url_timeout
+    application['download_url_partial_results'] = download_url_partial_results
+    application['stream_batch_size'] = stream_batch_size
+    application['gzip_min_size'] = gzip_min_size
+    application['change_notifier'] = ChangeNotifier()
+    application.on_shutdown.append(_close_change_feed)
+    application['change_feed_timeout'] = change_feed_timeout
+    application['change_feed_poll_interval'] = change_feed_poll_interval
+    # How long a write may take to commit: a gap in tChange revisions younger than this holds readers of the feed back
+    application['change_commit_grace'] = change_commit_grace
+    # Changes older than change_retention seconds are deleted; None keeps them all
+    application['change_pruner'] = None
+    if change_retention is not None:
+        application['change_pruner'] = ChangePruner(db_pool, db_executor, change_retention, interval=change_prune_interval)
+        application['change_pruner'].start()
+    # Deactivated rows older than history_retention seconds move to tDeploymentHistory; None keeps them in place
+    application['deployment_archiver'] = None
+    if history_retention is not None:
+        application['deployment_archiver'] = DeploymentArchiver(db_pool, db_executor, history_retention,
+                interval=history_archive_interval, batch_size=history_archive_batch_size)
+        application['deployment_archiver'].start()
+    # Processes sharing the database learn of each other's writes from tChange every cache_sync_interval seconds
+    application['change_watcher'] = None
+    if cache_sync_interval is not None:
+        application['change_watcher'] = ChangeWatcher(db_pool, db_executor, _changed_elsewhere(application),
+                interval=cache_sync_interval, grace=change_commit_grace)
+        application['change_watcher'].start()
     # TODO: Use encrypted cookie storage
     aiohttp_session.setup(application, aiohttp_session.SimpleCookieStorage())
-    aiohttp_security.setup(application, aiohttp_security.SessionIdentityPolicy(), ActiveDirectoryPolicy())
+    # Group memberships and decisions are cached, so the directory is asked at most once per user per TTL
+    application['auth_policy'] = ActiveDirectoryPolicy(auth_directory, rules=auth_rules, groups_ttl=auth_groups_ttl,
+            decision_ttl=auth_decision_ttl, max_size=auth_cache_size)
+    aiohttp_security.setup(application, aiohttp_security.SessionIdentityPolicy(), application['auth_policy'])
 
     routes.setup_routes(application)
+    if deployment_cache_warm:
+        await warm_deployment_cache(application)
 
     handler = application.make_handler()
-    # TODO: Pass in host and port as command line arguments
-    server = await loop.create_server(handler, 'nydevl0008.rdti.com', 8081)
+    # With reuse_port every worker process binds the same port and the kernel spreads connections across them
+    server = await loop.create_server(handler, host, port, reuse_port=reuse_port or None)
     return server, application, handler
 
 
-async def finalize(server, application, handler):
-    await handler.finish_connections(1.0)
+async def finalize(server, application, handler, shutdown_timeout=1.0):
+    # Stop accepting first, then give requests already in progress up to shutdown_timeout to finish. Only then wait
+    # for the server: from Python 3.12.1 wait_closed also waits for open connections, idle keep-alive ones included
     server.close()
+    pre_shutdown = getattr(handler, 'pre_shutdown', None)
+    if pre_shutdown is not None:
+        # Newer aiohttp otherwise waits out the whole timeout on idle keep-alive connections as well
+        pre_shutdown()
+    await application.shutdown()
+    await handler.shutdown(shutdown_timeout)
     await server.wait_closed()
-    await application.finish()
+    await application.cleanup()
+    if application['deployment_archiver'] is not None:
+        await application['deployment_archiver'].stop()
+    if application['change_watcher'] is not None:
+        await application['change_watcher'].stop()
+    if application['change_pruner'] is not None:
+        await application['change_pruner'].stop()
+    await application['artifactory_clients'].close()
+    await application['db_replicas'].stop()
+    application['db_replicas'].dispose()
+    application['db_pool'].dispose()
+    application['db_executor'].shutdown()
     return server, application, handler
 
 
-def main():
-    loop = asyncio.get_event_loop()
-    server, application, handler = loop.run_until_complete(initialize(loop))
+def _load_groups(parser, option, path):
+    # A JSON object whose values are lists of group names
+    try:
+        with open(path, encoding='utf-8') as source:
+            value = json.load(source)
+    except (OSError, ValueError) as e:
+        parser.error('%s: %s' % (option, e))
+    if not isinstance(value, dict) or not all(isinstance(groups, list) and all(isinstance(group, str) for group in groups)
+            for groups in value.values()):
+        parser.error('%s must hold a JSON object whose values are lists of group names' % option)
+    return value
+
+
+def _parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog='versioning', description='Serve the versioning service',
+            epilog='versioning export and versioning import copy the database to and from NDJSON')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--db-url', default='sqlite://', help='SQLAlchemy database URL of the primary')
+    parser.add_argument('--db-replica-url', action='append', default=[], dest='db_replica_urls',
+            help='SQLAlchemy database URL of a read replica; may be repeated')
+    parser.add_argument('--read-your-writes', type=float, default=None, metavar='SECONDS',
+            help='after a write, send that client\'s reads to the primary for this long')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes sharing the port')
+    parser.add_argument('--cache-sync-interval', type=float, default=None, metavar='SECONDS',
+            help='how often to check for writes made by other processes and drop what they changed from the caches; '
+            'defaults to 1 with --workers, and is off otherwise')
+    parser.add_argument('--shutdown-timeout', type=float, default=30.0,
+            help='seconds a worker waits for requests in progress once asked to stop')
+    parser.add_argument('--db-pool-size', type=int, default=5, help='connections each worker keeps open')
+    parser.add_argument('--db-max-overflow', type=int, default=10,
+            help='connections each worker may open beyond --db-pool-size under load')
+    parser.add_argument('--db-pool-timeout', type=float, default=30, metavar='SECONDS',
+            help='how long a request waits for a connection before answering 503')
+    parser.add_argument('--db-pool-recycle', type=int, default=3600, metavar='SECONDS',
+            help='replace connections older than this')
+    parser.add_argument('--no-db-pool-pre-ping', action='store_false', dest='db_pool_pre_ping',
+            help='do not test connections as they are borrowed')
+    parser.add_argument('--history-retention', type=float, default=None, metavar='SECONDS',
+            help='move deployments deactivated longer ago than this to tDeploymentHistory; off by default')
+    parser.add_argument('--history-archive-interval', type=float, default=3600, metavar='SECONDS',
+            help='how often to archive with --history-retention')
+    parser.add_argument('--auth-directory', default=None, metavar='FILE',
+            help='JSON object mapping each identity to its groups; without it every identified user may do anything')
+    parser.add_argument('--auth-rules', default=None, metavar='FILE',
+            help='JSON object mapping each permission to the groups granting it, replacing the default rules')
+    parser.add_argument('--auth-groups-ttl', type=float, default=300, metavar='SECONDS',
+            help='how long group memberships are cached. Each worker has its own cache, and DELETE /status/auth-cache '
+            'only flushes the worker that answers it, so with --workers a group change takes up to this long everywhere')
+    parser.add_argument('--auth-decision-ttl', type=float, default=60, metavar='SECONDS',
+            help='how long permission decisions are cached')
+    parser.add_argument('--change-retention', type=float, default=7 * 24 * 60 * 60, metavar='SECONDS',
+            help='delete recorded changes older than this; change feed clients further behind have to start over')
+    parser.add_argument('--change-commit-grace', type=float, default=10, metavar='SECONDS',
+            help='the longest a write takes to commit; the change feed waits this long for a write that took an '
+            'earlier revision to commit before skipping it as rolled back')
+    parser.add_argument('--coalesce-window', type=float, default=0, metavar='SECONDS',
+            help='reuse a read\'s response for identical reads this long; 0 only shares reads in progress')
+    parser.add_argument('--warm-deployment-cache', action='store_true',
+            help='load the most recently changed active deployments into the cache at startup')
+    arguments = parser.parse_args(argv)
+    if arguments.workers < 1:
+        parser.error('--workers must be at least 1')
+    for name in ('db_pool_size', 'db_pool_timeout', 'history_archive_interval', 'auth_groups_ttl', 'auth_decision_ttl',
+            'change_retention'):
+        if getattr(arguments, name) <= 0:
+            parser.error('--%s must be positive' % name.replace('_', '-'))
+    for name in ('db_max_overflow', 'coalesce_window', 'change_commit_grace'):
+        if getattr(arguments, name) < 0:
+            parser.error('--%s must not be negative' % name.replace('_', '-'))
+    if arguments.history_retention is not None and arguments.history_retention <= 0:
+        parser.error('--history-retention must be positive')
+    if arguments.auth_directory is not None:
+        arguments.auth_directory = LocalDirectory(_load_groups(parser, '--auth-directory', arguments.auth_directory))
+    if arguments.auth_rules is not None:
+        arguments.auth_rules = dict((permission, tuple(groups))
+                for permission, groups in _load_groups(parser, '--auth-rules', arguments.auth_rules).items())
+    if arguments.cache_sync_interval is None and arguments.workers > 1:
+        # Each worker caches on its own, and only hears of its own writes directly
+        arguments.cache_sync_interval = 1.0
+    if arguments.cache_sync_interval is not None and arguments.cache_sync_interval <= 0:
+        parser.error('--cache-sync-interval must be positive')
+    db_url = sa.engine.url.make_url(arguments.db_url)
+    if arguments.workers > 1 and db_url.get_backend_name() == 'sqlite' and db_url.database in (None, '', ':memory:'):
+        parser.error('an in-memory database cannot be shared by several workers; pass --db-url')
+    return arguments
+
+
+def _initialize_options(arguments):
+    return {'db_url': arguments.db_url,
+            'host': arguments.host,
+            'port': arguments.port,
+            'db_replica_urls': arguments.db_replica_urls,
+            'read_your_writes_window': arguments.read_your_writes,
+            'cache_sync_interval': arguments.cache_sync_interval,
+            'db_pool_size': arguments.db_pool_size,
+            'db_max_overflow': arguments.db_max_overflow,
+            'db_pool_timeout': arguments.db_pool_timeout,
+            'db_pool_recycle': arguments.db_pool_recycle,
+            'db_pool_pre_ping': arguments.db_pool_pre_ping,
+            'history_retention': arguments.history_retention,
+            'history_archive_interval': arguments.history_archive_interval,
+            'auth_directory': arguments.auth_directory,
+            'auth_rules': arguments.auth_rules,
+            'auth_groups_ttl': arguments.auth_groups_ttl,
+            'auth_decision_ttl': arguments.auth_decision_ttl,
+            'coalesce_window': arguments.coalesce_window,
+            'change_retention': arguments.change_retention,
+            'change_commit_grace': arguments.change_commit_grace,
+            'deployment_cache_warm': arguments.warm_deployment_cache}
+
+
+def _serve(arguments, reuse_port=False, create_schema=True):
+    # Everything, the engine included, is created here so a forked worker never shares its parent's connections
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server, application, handler = loop.run_until_complete(initialize(loop, reuse_port=reuse_port,
+            create_schema=create_schema, **_initialize_options(arguments)))
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, loop.stop)
     try:
         loop.run_forever()
-    except KeyboardInterrupt:
-        loop.run_until_complete((finalize(server, application, handler)))
+    finally:
+        loop.run_until_complete(finalize(server, application, handler, arguments.shutdown_timeout))
+        loop.close()
+
+
+def _spawn(arguments):
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        _serve(arguments, reuse_port=True, create_schema=False)
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def _supervise(arguments):
+    # Created once here, before forking, so workers do not race each other to create tables
+    create_schema(arguments.db_url)
+    workers = set()
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(arguments.workers):
+        workers.add(_spawn(arguments))
+    while workers:
+        try:
+            (pid, status) = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            sys.stderr.write('Worker %d exited with status %d; starting another\n' % (pid, status))
+            # Do not spin if workers die as soon as they start
+            time.sleep(1)
+            if not stopping:
+                workers.add(_spawn(arguments))
+
+
+def _parse_snapshot_arguments(command, argv):
+    parser = argparse.ArgumentParser(prog='versioning ' + command,
+            description='Export every table to NDJSON' if command == 'export' else 'Load an NDJSON export into a database')
+    parser.add_argument('--db-url', required=True, help='SQLAlchemy database URL')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows fetched or inserted at a time')
+    parser.add_argument('file', nargs='?', default='-', help='snapshot file; - for standard %s' %
+            ('output' if command == 'export' else 'input'))
+    return parser.parse_args(argv)
+
+
+def _export(argv):
+    arguments = _parse_snapshot_arguments('export', argv)
+    engine = sa.create_engine(arguments.db_url)
+    output = sys.stdout if arguments.file == '-' else open(arguments.file, 'w', encoding='utf-8')
+    try:
+        with engine.connect() as connection:
+            for lines in export_snapshot(connection, arguments.batch_size):
+                output.writelines(lines)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        engine.dispose()
+
+
+def _import(argv):
+    arguments = _parse_snapshot_arguments('import', argv)
+    create_schema(arguments.db_url)
+    engine = sa.create_engine(arguments.db_url)
+    source = sys.stdin if arguments.file == '-' else open(arguments.file, encoding='utf-8')
+    try:
+        with engine.connect() as connection:
+            counts = import_snapshot(connection, source, arguments.batch_size)
+    except (SnapshotError, sa.exc.IntegrityError) as e:
+        sys.exit('versioning import: %s' % e)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        engine.dispose()
+    sys.stderr.write(json.dumps(counts, sort_keys=True) + '\n')
+
+
+_COMMANDS = {'export': _export, 'import': _import}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in _COMMANDS:
+        return _COMMANDS[argv[0]](argv[1:])
+    arguments = _parse_arguments(argv)
+    if arguments.workers == 1:
+        _serve(arguments)
+    else:
+        _supervise(arguments)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from collections import OrderedDict
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+
+
+def _outcome(error=None, download_url=None):
+    if error is None:
+        return 'found' if download_url else 'not_found'
+    if isinstance(error, asyncio.TimeoutError):
+        return 'timeout'
+    if isinstance(error, asyncio.CancelledError):
+        return 'cancelled'
+    return 'client_error' if isinstance(error, ClientError) else 'error'
+
+
+def _is_snapshot(version):
+    version = version.upper()
+    return version.endswith('SNAPSHOT') or version.startswith('LATEST')
+
+
+class DownloadUrlCache(object):
+    def __init__(self, max_size=4096, release_ttl=24 * 60 * 60, snapshot_ttl=60, not_found_ttl=30, clock=time.monotonic):
+        self._max_size = max_size
+        self._release_ttl = release_ttl
+        self._snapshot_ttl = snapshot_ttl
+        self._not_found_ttl = not_found_ttl
+        self._clock = clock
+        # key -> (expires, download url or None when Artifactory has no such package)
+        self._entries = OrderedDict()
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _ttl(self, key, value):
+        if value is None:
+            return self._not_found_ttl
+        return self._snapshot_ttl if _is_snapshot(key[-1]) else self._release_ttl
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires, value = entry
+        if expires <= self._clock():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _store(self, key, value):
+        self._entries[key] = (self._clock() + self._ttl(key, value), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_resolve(self, key, resolve):
+        found, value = self._lookup(key)
+        if found:
+            self.hits += 1
+            return value
+        pending = self._pending.get(key)
+        if pending is None:
+            self.misses += 1
+            pending = asyncio.ensure_future(self._resolve(key, resolve))
+            self._pending[key] = pending
+        else:
+            self.coalesced += 1
+        # Shielded so one cancelled caller does not cancel the lookup shared with the others
+        return await asyncio.shield(pending)
+
+    async def _resolve(self, key, resolve):
+        try:
+            value = await resolve()
+            self._store(key, value)
+            return value
+        finally:
+            del self._pending[key]
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def statistics(self):
+        return {'size': len(self._entries),
+                'max_size': self._max_size,
+                'pending': len(self._pending),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced}
+
+
+class ArtifactoryClients(object):
+    def __init__(self, loop, limit_per_host=16, keepalive_timeout=30, connect_timeout=5, total_timeout=30):
+        self._loop = loop
+        self._limit_per_host = limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._timeout = ClientTimeout(total=total_timeout, connect=connect_timeout)
+        self._sessions = {}
+
+    def get(self, base_uri):
+        session = self._sessions.get(base_uri)
+        if session is None or session.closed:
+            connector = TCPConnector(loop=self._loop, limit_per_host=self._limit_per_host,
+                    keepalive_timeout=self._keepalive_timeout)
+            session = ClientSession(loop=self._loop, connector=connector, timeout=self._timeout)
+            self._sessions[base_uri] = session
+        return session
+
+    async def close(self):
+        sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            await session.close()
+
+
+class ArtifactoryResolver(object):
+    def __init__(self, clients, cache=None, metrics=None):
+        self._clients = clients
+        self._cache = DownloadUrlCache() if cache is None else cache
+        self._metrics = metrics
+
+    @property
+    def cache(self):
+        return self._cache
+
+    async def _timed(self, histogram, lookup):
+        if self._metrics is None:
+            return await lookup
+        histogram = getattr(self._metrics, histogram)
+        started = time.perf_counter()
+        try:
+            download_url = await lookup
+        except BaseException as e:
+            histogram.observe(time.perf_counter() - started, (_outcome(e),))
+            raise
+        histogram.observe(time.perf_counter() - started, (_outcome(download_url=download_url),))
+        return download_url
+
+    async def get_download_url(self, base_uri, group, name, version):
+        return await self._timed('artifactory_lookup_duration', self._cache.get_or_resolve((base_uri, group, name, version),
+                lambda: self._timed('artifactory_fetch_duration', self._fetch_download_url(base_uri, group, name, version))))
+
+    async def _fetch_download_url(self, base_uri, group, name, version):
+        result = None
+        session = self._clients.get(base_uri)
+        package_uri = ''
+        async with session.get('%s/artifactory/api/search/gavc' % base_uri,
+                params={'g': group, 'a': name, 'v': version, 'c': 'release'}) as response:
+            json_result = (await response.json())['results']
+            if json_result:
+                package_uri = json_result[0]['uri']
+        if package_uri:
+            async with session.get(package_uri) as response:
+                result = (await response.json())['downloadUri']
+        return result
@@ -0,0 +1,95 @@
+import time
+from collections import OrderedDict, namedtuple
+
+
+CachedDeployment = namedtuple('CachedDeployment', ['document', 'validators', 'artifact'])
+
+
+class DeploymentCache(object):
+    def __init__(self, max_size=10000, ttl=60, replica_lag=0, clock=time.monotonic):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._replica_lag = replica_lag
+        self._clock = clock
+        # key -> until when a replica may still be serving what the key looked like before its last write
+        self._unsettled = {}
+        self._all_unsettled_until = 0
+        # five-part key -> (expires, CachedDeployment)
+        self._entries = OrderedDict()
+        # Bumped by every invalidation so a read that raced a write cannot store what it read
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value, generation=None, replica=False):
+        if generation is not None and generation != self.generation:
+            return
+        if replica and not self._settled(key):
+            return
+        self._entries[key] = (self._clock() + self._ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def _settled(self, key):
+        now = self._clock()
+        if self._all_unsettled_until > now:
+            return False
+        until = self._unsettled.get(key)
+        if until is None:
+            return True
+        if until > now:
+            return False
+        del self._unsettled[key]
+        return True
+
+    def _unsettle(self, key=None):
+        if not self._replica_lag:
+            return
+        now = self._clock()
+        if key is None:
+            self._all_unsettled_until = now + self._replica_lag
+            self._unsettled.clear()
+            return
+        self._unsettled[key] = now + self._replica_lag
+        if len(self._unsettled) > self._max_size:
+            for settled in [settled for settled, until in self._unsettled.items() if until <= now]:
+                del self._unsettled[settled]
+
+    def invalidate(self, key):
+        self.generation += 1
+        self._entries.pop(key, None)
+        self._unsettle(key)
+
+    def invalidate_artifact(self, group, name):
+        self.generation += 1
+        for key in [key for key, (expires, value) in self._entries.items() if value.artifact[1:3] == (group, name)]:
+            del self._entries[key]
+        self._unsettle()
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._unsettle()
+
+    def statistics(self):
+        return {'size': len(self._entries),
+                'max_size': self._max_size,
+                'hits': self.hits,
+                'misses': self.misses}
@@ -0,0 +1,109 @@
+import asyncio
+import time
+from collections import OrderedDict, namedtuple
+from aiohttp import web
+
+
+# What one request's response leaves for identical requests to reuse: the body is serialized once
+SharedResponse = namedtuple('SharedResponse', ['status', 'headers', 'body', 'compressed'])
+
+# Set-Cookie belongs to the client that caused it; the rest are recomputed for every response
+_UNSHARED_HEADERS = ('set-cookie', 'content-length', 'content-encoding', 'transfer-encoding')
+# Request headers that change the response, so requests differing in them are not identical
+_VARYING_HEADERS = ('Accept-Encoding', 'If-None-Match', 'If-Modified-Since')
+
+
+def request_key(request):
+    return (request.method, getattr(request.match_info.handler, '__name__', None), tuple(sorted(request.match_info.items())),
+            tuple(sorted(request.rel_url.query.items())), tuple(request.headers.get(name, '') for name in _VARYING_HEADERS))
+
+
+def _share(response):
+    # Streamed responses went straight to their own client and cannot be replayed
+    if type(response) is not web.Response or not (response.body is None or isinstance(response.body, bytes)):
+        return None
+    headers = [(name, value) for name, value in response.headers.items() if name.lower() not in _UNSHARED_HEADERS]
+    return SharedResponse(response.status, headers, response.body, response.compression)
+
+
+def _replay(shared):
+    response = web.Response(status=shared.status, body=shared.body, headers=shared.headers)
+    if shared.compressed:
+        response.enable_compression(web.ContentCoding.gzip)
+    return response
+
+
+class RequestCoalescer(object):
+    def __init__(self, window=0, max_size=1024, clock=time.monotonic):
+        # window is how many seconds a response is reused for once computed; 0 shares only while it is being computed
+        self._window = window
+        self._max_size = max_size
+        self._clock = clock
+        self._pending = {}
+        # Bumped by every clear, so a response computed from a read that started before a write is not stored
+        self._generation = 0
+        # key -> (expires, SharedResponse)
+        self._responses = OrderedDict()
+        self.leaders = 0
+        self.followers = 0
+        self.hits = 0
+
+    def _cached(self, key):
+        entry = self._responses.get(key)
+        if entry is None:
+            return None
+        expires, shared = entry
+        if expires <= self._clock():
+            del self._responses[key]
+            return None
+        return shared
+
+    def _store(self, key, shared):
+        self._responses[key] = (self._clock() + self._window, shared)
+        self._responses.move_to_end(key)
+        while len(self._responses) > self._max_size:
+            self._responses.popitem(last=False)
+
+    async def handle(self, key, compute):
+        if self._window:
+            shared = self._cached(key)
+            if shared is not None:
+                self.hits += 1
+                return _replay(shared)
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.followers += 1
+            shared = await asyncio.shield(pending)
+            # Nothing to reuse when the first request failed, streamed or went away: answer this one itself
+            return _replay(shared) if shared is not None else await compute()
+        self.leaders += 1
+        generation = self._generation
+        pending = self._pending[key] = asyncio.get_event_loop().create_future()
+        shared = None
+        try:
+            response = await compute()
+            shared = _share(response)
+            if shared is not None and self._window and generation == self._generation:
+                self._store(key, shared)
+            return response
+        finally:
+            # A clear since this started has already detached it, and a newer leader may hold the key
+            if self._pending.get(key) is pending:
+                del self._pending[key]
+            pending.set_result(shared)
+
+    def clear(self):
+        # After a write: requests from then on neither join a read already in flight nor reuse a stored response
+        self._generation += 1
+        self._pending.clear()
+        self._responses.clear()
+
+    def statistics(self):
+        coalesced = self.followers + self.hits
+        total = self.leaders + coalesced
+        return {'pending': len(self._pending),
+                'cached': len(self._responses),
+                'leaders': self.leaders,
+                'followers': self.followers,
+                'hits': self.hits,
+                'ratio': coalesced / total if total else 0.0}
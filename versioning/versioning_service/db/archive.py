@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+from .models import Deployment, DeploymentHistory, utc_now
+
+
+_logger = logging.getLogger(__name__)
+
+
+def archive_deployments(unit_of_work, horizon_utc, batch_size=1000):
+    # Moves rows deactivated before the horizon into tDeploymentHistory, one transaction per batch
+    current = Deployment.__table__
+    history = DeploymentHistory.__table__
+    names = [column.name for column in history.c]
+    expired = sa.and_(current.c.is_active == sa.false(), current.c.deactivated_utc < horizon_utc)
+    archived = 0
+    while True:
+        deployment_keys = [row[0] for row in unit_of_work.execute(sa.select([current.c.deployment_key]).where(expired)
+                .order_by(current.c.deployment_key).limit(batch_size))]
+        if not deployment_keys:
+            return archived
+        batch = current.c.deployment_key.in_(deployment_keys)
+        unit_of_work.execute(history.insert().from_select(names, sa.select([current.c[name] for name in names]).where(batch)))
+        unit_of_work.execute(current.delete().where(batch))
+        unit_of_work.commit()
+        archived += len(deployment_keys)
+
+
+class DeploymentArchiver(object):
+    def __init__(self, db_pool, db_executor, retention, interval=3600, batch_size=1000):
+        # retention and interval are in seconds
+        self._db_pool = db_pool
+        self._db_executor = db_executor
+        self._retention = retention
+        self._interval = interval
+        self._batch_size = batch_size
+        self._task = None
+        self.archived = 0
+
+    async def archive(self):
+        connection = await self._db_pool.acquire()
+        try:
+            unit_of_work = sessionmaker(bind=connection)()
+            try:
+                archived = await self._db_executor.run(archive_deployments, unit_of_work,
+                        utc_now() - int(self._retention * 1000), self._batch_size)
+            finally:
+                await self._db_executor.run(unit_of_work.close)
+        finally:
+            await self._db_pool.release(connection)
+        self.archived += archived
+        return archived
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.archive()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                _logger.exception('Archiving deployments failed; retrying in %s seconds', self._interval)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
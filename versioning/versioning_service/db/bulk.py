@@ -0,0 +1,68 @@
+import sqlalchemy as sa
+from .models import Deployment, copy_deployments, deactivate_deployments
+
+
+DEPLOYMENT_KEY = ('environment', 'data_center', 'application', 'stripe', 'instance')
+DEPLOYMENT_VERSIONS = ('image_version', 'artifact_version', 'configuration_version')
+
+
+class ConcurrentModification(Exception):
+    pass
+
+
+def key_condition(table, keys):
+    if not keys:
+        # An empty OR renders as no condition at all, which would match every row
+        return sa.false()
+    return sa.or_(*[sa.and_(*[table.c[part] == value for part, value in zip(DEPLOYMENT_KEY, key)]) for key in keys])
+
+
+def upgrade_deployments(unit_of_work, versions, username, utc_timestamp, criteria=None, keys=None):
+    table = Deployment.__table__
+    condition = [table.c.is_active == sa.true()]
+    if criteria:
+        condition.extend(table.c[name] == value for name, value in criteria.items())
+    if keys is not None:
+        condition.append(key_condition(table, keys))
+    rows = unit_of_work.execute(sa.select([table.c.deployment_key] + [table.c[name] for name in DEPLOYMENT_KEY + DEPLOYMENT_VERSIONS])
+            .where(sa.and_(*condition))).fetchall()
+    found = dict((tuple(row[part] for part in DEPLOYMENT_KEY), row) for row in rows)
+    upgraded = []
+    unchanged = []
+    for key, row in found.items():
+        if all(versions.get(name, row[name]) == row[name] for name in DEPLOYMENT_VERSIONS):
+            unchanged.append(key)
+        else:
+            upgraded.append(key)
+    missing = [] if keys is None else [key for key in keys if key not in found]
+    deployment_keys = [found[key].deployment_key for key in upgraded]
+    if deployment_keys:
+        claimed = table.c.deployment_key.in_(deployment_keys)
+        # Claim the old rows first; anything already deactivated means another writer got there in between
+        deactivated = deactivate_deployments(unit_of_work, claimed, username, utc_timestamp)
+        if deactivated != len(deployment_keys):
+            raise ConcurrentModification('%d of %d deployments changed during the upgrade' % (len(deployment_keys) - deactivated, len(deployment_keys)))
+        copy_deployments(unit_of_work, claimed, username, utc_timestamp, **versions)
+    return upgraded, unchanged, missing
+
+
+def upgrade_deployment_if_match(unit_of_work, key, expected, versions, username, utc_timestamp):
+    # expected holds the (deployment_key, revision) pairs the caller last saw; the row is claimed by one conditional
+    # UPDATE, so no read comes between the check and the write. Returns the claimed deployment key, or None
+    table = Deployment.__table__
+    changed = sa.or_(*[table.c[name] != value for name, value in versions.items()])
+    for deployment_key, revision in expected:
+        claimed = sa.and_(key_condition(table, [key]), table.c.deployment_key == deployment_key)
+        if deactivate_deployments(unit_of_work, sa.and_(claimed, table.c.revision == revision, changed), username, utc_timestamp):
+            copy_deployments(unit_of_work, claimed, username, utc_timestamp, **versions)
+            return deployment_key
+    return None
+
+
+def deactivate_deployment_if_match(unit_of_work, key, expected, username, utc_timestamp):
+    table = Deployment.__table__
+    for deployment_key, revision in expected:
+        if deactivate_deployments(unit_of_work, sa.and_(key_condition(table, [key]), table.c.deployment_key == deployment_key,
+                table.c.revision == revision), username, utc_timestamp):
+            return deployment_key
+    return None
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+from .models import Change, utc_now
+from .bulk import DEPLOYMENT_KEY
+
+
+_logger = logging.getLogger(__name__)
+
+
+def visible_revision(connection, since, grace, limit=1000):
+    # The revision up to which every change can be read. Revisions are taken before commit, so concurrent writers can
+    # commit them out of order: a gap followed by a change younger than grace seconds may still be filled by a write in
+    # progress, and nothing past it is visible yet. Older gaps are writes that rolled back
+    change = Change.__table__
+    horizon = utc_now() - int(grace * 1000)
+    if since is None:
+        since = connection.execute(sa.select([sa.func.max(change.c.revision)])
+                .where(change.c.effective_utc < horizon)).scalar()
+    if since is None:
+        oldest = connection.execute(sa.select([sa.func.min(change.c.revision)])).scalar()
+        since = 0 if oldest is None else oldest - 1
+    revision = since
+    for (row_revision, effective_utc) in connection.execute(sa.select([change.c.revision, change.c.effective_utc])
+            .where(change.c.revision > since).order_by(change.c.revision).limit(limit)):
+        if row_revision != revision + 1 and effective_utc >= horizon:
+            break
+        revision = row_revision
+    return revision
+
+
+def cursor_expired(connection, since):
+    # Whether changes after since may have been pruned, so whoever holds since has to start over
+    if since is None:
+        return False
+    oldest = connection.execute(sa.select([sa.func.min(Change.__table__.c.revision)])).scalar()
+    return oldest is not None and since < oldest - 1
+
+
+def read_changed_keys(connection, since, grace, limit=1000):
+    # The visible revision and the keys changed after since; None for the keys when more than limit changed, or when
+    # the changes since have been pruned
+    if cursor_expired(connection, since):
+        return visible_revision(connection, None, grace), None
+    revision = visible_revision(connection, since, grace, limit)
+    if since is None or revision <= since:
+        return revision, []
+    change = Change.__table__
+    rows = connection.execute(sa.select([change.c[part] for part in DEPLOYMENT_KEY]).distinct()
+            .where(sa.and_(change.c.revision > since, change.c.revision <= revision)).limit(limit + 1)).fetchall()
+    return revision, None if len(rows) > limit else [tuple(row) for row in rows]
+
+
+def prune_changes(unit_of_work, horizon_utc, batch_size=1000):
+    # Deletes changes made before the horizon, one transaction per batch. The latest is always kept, so the revision
+    # readers see never goes back
+    change = Change.__table__
+    latest = unit_of_work.execute(sa.select([sa.func.max(change.c.revision)])).scalar()
+    expired = sa.and_(change.c.effective_utc < horizon_utc, change.c.revision < latest)
+    pruned = 0
+    while latest is not None:
+        revisions = [row[0] for row in unit_of_work.execute(sa.select([change.c.revision]).where(expired)
+                .order_by(change.c.revision).limit(batch_size))]
+        if not revisions:
+            break
+        unit_of_work.execute(change.delete().where(change.c.revision.in_(revisions)))
+        unit_of_work.commit()
+        pruned += len(revisions)
+    return pruned
+
+
+class ChangeWatcher(object):
+    def __init__(self, db_pool, db_executor, listener, interval=1.0, batch_size=1000, grace=10):
+        # Calls listener with the keys other processes changed since the last poll, or None when too many changed
+        self._db_pool = db_pool
+        self._db_executor = db_executor
+        self._listener = listener
+        self._interval = interval
+        self._batch_size = batch_size
+        self._grace = grace
+        self._task = None
+        self.revision = None
+
+    async def poll(self):
+        connection = await self._db_pool.acquire()
+        try:
+            (revision, keys) = await self._db_executor.run(read_changed_keys, connection, self.revision, self._grace,
+                    self._batch_size)
+        finally:
+            await self._db_pool.release(connection)
+        # The first poll only sets where to start from: nothing has been cached before it
+        if self.revision is not None and keys != []:
+            self._listener(keys)
+        self.revision = revision
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                _logger.exception('Reading changes failed; retrying in %s seconds', self._interval)
+            await asyncio.sleep(self._interval)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class ChangePruner(object):
+    def __init__(self, db_pool, db_executor, retention, interval=3600, batch_size=1000):
+        # retention and interval are in seconds; a change feed cursor older than retention has to start over
+        self._db_pool = db_pool
+        self._db_executor = db_executor
+        self._retention = retention
+        self._interval = interval
+        self._batch_size = batch_size
+        self._task = None
+        self.pruned = 0
+
+    async def prune(self):
+        connection = await self._db_pool.acquire()
+        try:
+            unit_of_work = sessionmaker(bind=connection)()
+            try:
+                pruned = await self._db_executor.run(prune_changes, unit_of_work,
+                        utc_now() - int(self._retention * 1000), self._batch_size)
+            finally:
+                await self._db_executor.run(unit_of_work.close)
+        finally:
+            await self._db_pool.release(connection)
+        self.pruned += pruned
+        return pruned
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                _logger.exception('Pruning changes failed; retrying in %s seconds', self._interval)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,63 @@
+import sqlalchemy as sa
+from .models import Image, Artifact, Configuration, Deployment
+
+
+SCOPE = ('environment', 'data_center', 'application')
+COMPARED = ('image_name', 'image_version', 'artifact_group', 'artifact_name', 'artifact_version', 'git_repository',
+        'configuration_version')
+
+
+def _side(name, scope):
+    # The active deployments in one scope, found through the unique index on active rows
+    deployment = Deployment.__table__.alias(name + '_deployment')
+    image = Image.__table__.alias(name + '_image')
+    artifact = Artifact.__table__.alias(name + '_artifact')
+    configuration = Configuration.__table__.alias(name + '_configuration')
+    condition = [deployment.c.is_active == sa.true()] + [deployment.c[part] == value for part, value in zip(SCOPE, scope)]
+    return sa.select([deployment.c.application, deployment.c.stripe, deployment.c.instance,
+            image.c.name.label('image_name'), deployment.c.image_version, artifact.c.group.label('artifact_group'),
+            artifact.c.name.label('artifact_name'), deployment.c.artifact_version, configuration.c.git_repository,
+            deployment.c.configuration_version]) \
+            .select_from(deployment
+                .join(image, image.c.image_key == deployment.c.image_key)
+                .join(artifact, artifact.c.artifact_key == deployment.c.artifact_key)
+                .join(configuration, configuration.c.configuration_key == deployment.c.configuration_key)) \
+            .where(sa.and_(*condition)).cte(name)
+
+
+def diff_query(left, right):
+    # left and right are (environment, data_center) or (environment, data_center, application); deployments pair up
+    # on the rest of the five-part key. Only pairs that differ and deployments missing from one side are selected
+    matched = ('stripe', 'instance') if len(left) == len(SCOPE) else ('application', 'stripe', 'instance')
+    (left, right) = (_side('left_scope', left), _side('right_scope', right))
+    on = sa.and_(*[left.c[part] == right.c[part] for part in matched])
+    differs = sa.or_(*[left.c[column] != right.c[column] for column in COMPARED])
+    key = ('application', 'stripe', 'instance')
+
+    def columns(keyed, sides):
+        return [keyed.c[part].label(part) for part in key] + \
+                [(side.c[column] if side is not None else sa.null()).label('%s_%s' % (prefix, column))
+                for (prefix, side) in sides for column in COMPARED]
+
+    changed = sa.select(columns(left, (('left', left), ('right', right)))) \
+            .select_from(left.outerjoin(right, on)).where(sa.or_(right.c.stripe == None, differs))
+    added = sa.select(columns(right, (('left', None), ('right', right)))) \
+            .select_from(right.outerjoin(left, on)).where(left.c.stripe == None)
+    union = sa.union_all(changed, added).alias('diff')
+    return sa.select([union]).order_by(union.c.application, union.c.stripe, union.c.instance)
+
+
+def diff_document(row):
+    document = dict((part, row[part]) for part in ('application', 'stripe', 'instance'))
+    for prefix in ('left', 'right'):
+        values = dict((column, row['%s_%s' % (prefix, column)]) for column in COMPARED)
+        # image_name is never null on a side that has the deployment
+        document[prefix] = values if values['image_name'] is not None else None
+    if document['left'] is None:
+        document['status'] = 'right_only'
+    elif document['right'] is None:
+        document['status'] = 'left_only'
+    else:
+        document['status'] = 'changed'
+        document['differences'] = [column for column in COMPARED if document['left'][column] != document['right'][column]]
+    return document
@@ -0,0 +1,18 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DatabaseExecutor(object):
+    def __init__(self, loop, max_workers=8, max_concurrency=None):
+        self._loop = loop
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+        # Callers beyond the cap wait on the loop rather than queueing up inside the pool
+        self._semaphore = asyncio.Semaphore(max_concurrency or max_workers)
+
+    async def run(self, function, *args, **kwargs):
+        async with self._semaphore:
+            return await self._loop.run_in_executor(self._executor, functools.partial(function, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,47 @@
+import threading
+import time
+from sqlalchemy.orm import joinedload
+from .models import Image, Artifactory, Configuration, Deployment, DeploymentHistory
+
+
+_DIMENSIONS = (Image, Artifactory, Configuration)
+
+
+def deployment_query(unit_of_work, model=Deployment):
+    # Image, Configuration and Artifactory are lazy many-to-ones answered from the identity map once primed
+    return unit_of_work.query(model).options(joinedload(model.artifact))
+
+
+def deployment_models(is_active=None):
+    # Archived rows are all inactive, so reads of current state never need the history table
+    return (Deployment,) if is_active is True else (Deployment, DeploymentHistory)
+
+
+class DimensionCache(object):
+    def __init__(self, ttl=60, clock=time.monotonic):
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rows = None
+        self._expires = 0
+
+    def _load(self, unit_of_work):
+        rows = []
+        for model in _DIMENSIONS:
+            rows.extend(unit_of_work.query(model).all())
+        for row in rows:
+            unit_of_work.expunge(row)
+        return rows
+
+    def prime(self, unit_of_work):
+        with self._lock:
+            if self._rows is None or self._expires <= self._clock():
+                self._rows = self._load(unit_of_work)
+                self._expires = self._clock() + self._ttl
+            rows = self._rows
+        # The identity map only holds weak references, so the unit of work has to keep the merged rows alive
+        unit_of_work.info['dimensions'] = [unit_of_work.merge(row, load=False) for row in rows]
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
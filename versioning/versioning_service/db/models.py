@@ -0,0 +1,321 @@
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, BigInteger, ForeignKey, Index, Table, Boolean, String
+from sqlalchemy import and_, or_, literal, null, select, true, event
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.orm import relationship, object_session
+import time
+
+
+Base = declarative_base()
+
+
+def utc_now():
+    # The *_utc columns hold milliseconds since the epoch
+    return int(time.time() * 1000)
+
+
+class Auditable(object):
+    effective_username = Column(String(16), nullable=False)
+    effective_utc = Column(BigInteger, nullable=False, default=utc_now)
+
+    def clone(self):
+        clone = __class__()
+        self._build_clone(clone)
+        return clone
+
+    def _build_clone(self, clone):
+        clone.effective_username = self.effective_username
+        clone.effective_utc = self.effective_utc
+
+
+class Deactivatable(Auditable):
+    deactivated_username = Column(String(16), nullable=True)
+    deactivated_utc = Column(BigInteger, nullable=True)
+    is_active = Column(Boolean, nullable=False, default=True)
+
+    @classmethod
+    def effective_at(cls, utc_timestamp):
+        # Rows are validity intervals [effective_utc, deactivated_utc); active rows are open-ended
+        return and_(cls.effective_utc <= utc_timestamp, or_(cls.deactivated_utc == None, cls.deactivated_utc > utc_timestamp))
+
+    def deactivate(self, username, utc_timestamp=None):
+        if utc_timestamp is None:
+            utc_timestamp = utc_now()
+        if self.is_active:
+            self.deactivated_username = username
+            self.deactivated_utc = utc_timestamp
+            self.is_active = False
+
+    def activate(self, username, utc_timestamp=None):
+        self.effective_username = username
+        self.effective_utc = utc_now() if utc_timestamp is None else utc_timestamp
+        self.deactivated_username = None
+        self.deactivated_utc = None
+        self.is_active = True
+
+    def _build_clone(self, clone):
+        clone.deactivated_username = self.deactivated_username
+        clone.deactivated_utc = self.deactivated_utc
+        clone.is_active = self.is_active
+        super(self, Deactivatable).build_clone(clone)
+
+
+class Image(Base, Auditable):
+    __tablename__ = 'tImage'
+
+    image_key = Column(Integer, primary_key=True)
+    name = Column(String(255), nullable=False, index=True, unique=True)
+    deployments = relationship("Deployment", back_populates='image')
+
+    def _build_clone(self, clone):
+        clone.name = self.name
+        super(self, Image).build_clone(clone)
+
+
+class Artifactory(Base, Deactivatable):
+    __tablename__ = 'tArtifactory'
+
+    artifactory_key = Column(Integer, primary_key=True)
+    base_uri = Column(String(255), nullable=False, index=True, unique=True)
+    artifacts = relationship("Artifact", back_populates='artifactory')
+
+    def _build_clone(self, clone):
+        clone.base_uri = self.base_uri
+        super(self, Artifactory).build_clone(clone)
+
+
+class Artifact(Base, Deactivatable):
+    __tablename__ = 'tArtifact'
+
+    artifact_key = Column(Integer, primary_key=True)
+    artifactory_key = Column(Integer, ForeignKey(Artifactory.__table__.c.artifactory_key), nullable=False)
+    artifactory = relationship("Artifactory", back_populates='artifacts')
+    group = Column(String(255), nullable=False)
+    name = Column(String(255), nullable=False)
+    # Bumped by every update, so an update made from a stale read matches no row
+    revision = Column(Integer, nullable=False, default=1)
+    deployments = relationship("Deployment", back_populates='artifact')
+
+    __mapper_args__ = {'version_id_col': revision}
+
+    def _build_clone(self, clone):
+        clone.artifactory = self.artifactory
+        clone.group = self.group
+        clone.name = self.name
+        super(self, Artifact).build_clone(clone)
+
+    def change_to_artifactory(self, artifactory, username, utc_timestamp):
+        unit_of_work = object_session(self)
+        if artifactory.artifactory_key == self.artifactory_key:
+            return (self, 0)
+        # There is one row per group, name and Artifactory, so moving back to an earlier Artifactory reactivates its row
+        new_artifact = None
+        if artifactory.artifactory_key is not None:
+            new_artifact = unit_of_work.query(Artifact).filter_by(group=self.group, name=self.name,
+                    artifactory_key=artifactory.artifactory_key).one_or_none()
+        if new_artifact is None:
+            new_artifact = Artifact(group=self.group,
+                name=self.name,
+                artifactory=artifactory,
+                effective_username=username,
+                effective_utc=utc_timestamp)
+            unit_of_work.add(new_artifact)
+        else:
+            new_artifact.activate(username, utc_timestamp)
+        # The cascade refers to the new artifact by key
+        unit_of_work.flush()
+        table = Deployment.__table__
+        deployment_keys = [row[0] for row in unit_of_work.execute(select([table.c.deployment_key])
+                .where(and_(table.c.artifact_key == self.artifact_key, table.c.is_active == true())))]
+        switched = 0
+        if deployment_keys:
+            # Deactivate before copying: only one row per five-part key may be active at a time
+            claimed = table.c.deployment_key.in_(deployment_keys)
+            switched = deactivate_deployments(unit_of_work, claimed, username, utc_timestamp)
+            copy_deployments(unit_of_work, claimed, username, utc_timestamp, artifact_key=new_artifact.artifact_key)
+        super(Artifact, self).deactivate(username, utc_timestamp)
+        return (new_artifact, switched)
+
+    def deactivate(self, username, utc_timestamp=None):
+        if utc_timestamp is None:
+            utc_timestamp = utc_now()
+        deactivated = deactivate_deployments(object_session(self), Deployment.__table__.c.artifact_key == self.artifact_key,
+                username, utc_timestamp)
+        super(Artifact, self).deactivate(username, utc_timestamp)
+        return deactivated
+
+
+class Configuration(Base, Auditable):
+    __tablename__ = 'tConfiguration'
+
+    configuration_key = Column(Integer, primary_key=True)
+    git_repository = Column(String(255), nullable=False, index=True, unique=True)
+    deployments = relationship("Deployment", back_populates='configuration')
+
+    def _build_clone(self, clone):
+        clone.git_repository = self.git_repository
+        super(self, Configuration).build_clone(clone)
+
+
+class DeploymentRecord(Deactivatable):
+    # The columns shared by current deployments and their archived history
+    environment = Column(String(4), nullable=False)
+    data_center = Column(String(3), nullable=False)
+    # Does application really need to be 255? I think 8 (i.e. stream id) should work
+    application = Column(String(255), nullable=False)
+    stripe = Column(String(25), nullable=False)
+    instance = Column(String(25), nullable=False)
+    image_version = Column(String(255), nullable=False)
+    artifact_version = Column(String(255), nullable=False)
+    configuration_version = Column(String(255), nullable=False)
+    # Bumped by every update, so an update made from a stale read matches no row
+    revision = Column(Integer, nullable=False, default=1)
+
+    @declared_attr
+    def image_key(cls):
+        return Column(Integer, ForeignKey(Image.__table__.c.image_key), nullable=False)
+
+    @declared_attr
+    def artifact_key(cls):
+        return Column(Integer, ForeignKey(Artifact.__table__.c.artifact_key), nullable=False)
+
+    @declared_attr
+    def configuration_key(cls):
+        return Column(Integer, ForeignKey(Configuration.__table__.c.configuration_key), nullable=False)
+
+
+class Deployment(Base, DeploymentRecord):
+    __tablename__ = 'tDeployment'
+    # Keys move to tDeploymentHistory when archived, so they must never be reused
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    deployment_key = Column(Integer, primary_key=True)
+    image = relationship("Image", back_populates='deployments')
+    artifact = relationship("Artifact", back_populates='deployments')
+    configuration = relationship("Configuration", back_populates='deployments')
+
+    @declared_attr
+    def __mapper_args__(cls):
+        return {'version_id_col': cls.__table__.c.revision}
+
+    def _build_clone(self, clone):
+        clone.environment = self.environment
+        clone.data_center = self.data_center
+        clone.application = self.application
+        clone.stripe = self.stripe
+        clone.instance = self.instance
+        clone.image = self.image
+        clone.image_version = self.image_version
+        clone.artifact = self.artifact
+        clone.artifact_version = self.artifact_version
+        clone.configuration = self.configuration
+        clone.configuration_version = self.configuration_version
+        super(self, Deployment).build_clone(clone)
+
+    def upgrade_to(self, image_version, artifact_version, configuration_version, username, utc_timestamp):
+        self.deactivate(username, utc_timestamp)
+        upgraded_deployment = self.clone()
+        if self.image_version != image_version:
+            upgraded_deployment.image_version = image_version
+        if self.artifact_version != artifact_version:
+            upgraded_deployment.artifact_version = artifact_version
+        if self.configuration_version != configuration_version:
+            upgraded_deployment.configuration_version = configuration_version
+        upgraded_deployment.activate(username, utc_timestamp)
+        return upgraded_deployment
+
+    def switch_to_image(self, image, username, utc_timestamp):
+        switched_deployment = self.clone()
+        switched_deployment.image = image
+        switched_deployment.activate(username, utc_timestamp)
+        return switched_deployment
+
+    def switch_to_artifact(self, artifact, username, utc_timestamp):
+        switched_deployment = self.clone()
+        switched_deployment.artifact = artifact
+        switched_deployment.activate(username, utc_timestamp)
+        return switched_deployment
+
+    def switch_to_configuration(self, configuration, username, utc_timestamp):
+        switched_deployment = self.clone()
+        switched_deployment.configuration = configuration
+        switched_deployment.activate(username, utc_timestamp)
+        return switched_deployment
+
+
+class DeploymentHistory(Base, DeploymentRecord):
+    # Deactivated deployments moved out of tDeployment once they pass the retention horizon
+    __tablename__ = 'tDeploymentHistory'
+
+    deployment_key = Column(Integer, primary_key=True, autoincrement=False)
+    image = relationship("Image")
+    artifact = relationship("Artifact")
+    configuration = relationship("Configuration")
+
+
+class Change(Base):
+    __tablename__ = 'tChange'
+
+    revision = Column(Integer, primary_key=True)
+    environment = Column(String(4), nullable=False)
+    data_center = Column(String(3), nullable=False)
+    application = Column(String(255), nullable=False)
+    stripe = Column(String(25), nullable=False)
+    instance = Column(String(25), nullable=False)
+    effective_utc = Column(BigInteger, nullable=False)
+
+
+def record_changes(unit_of_work, condition, utc_timestamp):
+    table = Deployment.__table__
+    key = [table.c.environment, table.c.data_center, table.c.application, table.c.stripe, table.c.instance]
+    return unit_of_work.execute(Change.__table__.insert().from_select([column.name for column in key] + ['effective_utc'],
+            select(key + [literal(utc_timestamp, table.c.effective_utc.type)]).where(condition))).rowcount
+
+
+def deactivate_deployments(unit_of_work, condition, username, utc_timestamp):
+    # Every set-based change deactivates the rows it replaces, so this is where the change feed hears of them
+    table = Deployment.__table__
+    condition = and_(condition, table.c.is_active == true())
+    record_changes(unit_of_work, condition, utc_timestamp)
+    return unit_of_work.execute(table.update().where(condition)
+            .values(is_active=False, deactivated_username=username, deactivated_utc=utc_timestamp,
+                revision=table.c.revision + 1)).rowcount
+
+
+def copy_deployments(unit_of_work, condition, username, utc_timestamp, **overrides):
+    # INSERT ... SELECT the rows matching condition as new active rows, with overrides replacing column values
+    table = Deployment.__table__
+    columns = [column for column in table.c if column.name != 'deployment_key']
+    values = {'effective_username': literal(username, table.c.effective_username.type),
+            'effective_utc': literal(utc_timestamp, table.c.effective_utc.type),
+            'deactivated_username': null(),
+            'deactivated_utc': null(),
+            'is_active': true(),
+            'revision': literal(1, table.c.revision.type)}
+    for name, value in overrides.items():
+        values[name] = literal(value, table.c[name].type)
+    return unit_of_work.execute(table.insert().from_select([column.name for column in columns],
+            select([values.get(column.name, column) for column in columns]).where(condition))).rowcount
+
+
+artifact_index = Index('idx_tArtifact_group_name', Artifact.__table__.c.group, Artifact.__table__.c.name, unique=False)
+artifact_index = Index('idx_tArtifact_group_name_artifactory', Artifact.__table__.c.group, Artifact.__table__.c.name, Artifact.__table__.c.artifactory_key, unique=True)
+# The five-part key prefix serves current-state lookups; the timestamps let as-of lookups seek within one key's history
+deployment_index = Index('idx_tDeployment_env_dc_app_s_i_effective', Deployment.__table__.c.environment,
+        Deployment.__table__.c.data_center, Deployment.__table__.c.application, Deployment.__table__.c.stripe,
+        Deployment.__table__.c.instance, Deployment.__table__.c.effective_utc, Deployment.__table__.c.deactivated_utc, unique=False)
+# Current-state reads only touch active rows, which stay a small slice of the table however long the history grows
+active_deployment_index = Index('idx_tDeployment_active_env_dc_app_s_i', Deployment.__table__.c.environment,
+        Deployment.__table__.c.data_center, Deployment.__table__.c.application, Deployment.__table__.c.stripe,
+        Deployment.__table__.c.instance, unique=True, sqlite_where=Deployment.__table__.c.is_active == true(),
+        postgresql_where=Deployment.__table__.c.is_active == true(), mssql_where=Deployment.__table__.c.is_active == true())
+# Without partial indexes (MySQL) it would be unique over all rows and refuse every upgrade, so it is only created where
+# the WHERE is honoured. Elsewhere the effective index serves the lookups, but two concurrent creates of a key both succeed
+Deployment.__table__.indexes.discard(active_deployment_index)
+event.listen(Deployment.__table__, 'after_create',
+        CreateIndex(active_deployment_index).execute_if(dialect=('sqlite', 'postgresql', 'mssql')))
+deployment_history_index = Index('idx_tDeploymentHistory_env_dc_app_s_i_effective', DeploymentHistory.__table__.c.environment,
+        DeploymentHistory.__table__.c.data_center, DeploymentHistory.__table__.c.application, DeploymentHistory.__table__.c.stripe,
+        DeploymentHistory.__table__.c.instance, DeploymentHistory.__table__.c.effective_utc,
+        DeploymentHistory.__table__.c.deactivated_utc, unique=False)
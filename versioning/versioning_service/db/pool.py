@@ -0,0 +1,144 @@
+import asyncio
+import sqlalchemy as sa
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def _connect_args(url):
+    # SQLite connections are used from executor threads, never concurrently
+    return {'check_same_thread': False} if url.get_backend_name() == 'sqlite' else {}
+
+
+def _create_engine(url, size, max_overflow, timeout, recycle, pre_ping):
+    url = sa.engine.url.make_url(url)
+    connect_args = _connect_args(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # Every connection to an in-memory database is a different database, so there can only be one
+        return sa.create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+    return sa.create_engine(url, connect_args=connect_args, poolclass=QueuePool,
+            pool_size=size, max_overflow=max_overflow, pool_timeout=timeout,
+            pool_recycle=recycle, pool_pre_ping=pre_ping)
+
+
+def _check(engine):
+    with engine.connect() as connection:
+        connection.execute(sa.text('SELECT 1'))
+
+
+def _count_statement(connection, cursor, statement, parameters, context, executemany):
+    # A connection belongs to one borrower at a time, so its count is that borrower's
+    connection.info['statements'] = connection.info.get('statements', 0) + 1
+
+
+class ConnectionPool(object):
+    def __init__(self, url, executor, size=5, max_overflow=10, timeout=30, recycle=3600, pre_ping=True):
+        self._engine = _create_engine(url, size, max_overflow, timeout, recycle, pre_ping)
+        sa.event.listen(self._engine, 'after_cursor_execute', _count_statement)
+        self._executor = executor
+        # Health checks connect afresh each time, outside the request slots and the pool's own limits
+        self._probe_engine = sa.create_engine(self._engine.url, connect_args=_connect_args(self._engine.url), poolclass=NullPool)
+        self._capacity = size + max_overflow
+        if isinstance(self._engine.pool, StaticPool):
+            # Borrowers of the one shared connection would otherwise commit and roll back each other's work
+            self._capacity = 1
+        self._timeout = timeout
+        # Borrowers queue here, on the loop, so executor threads never block waiting for a connection
+        self._slots = asyncio.Semaphore(self._capacity)
+        self._in_use = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    @property
+    def engine(self):
+        return self._engine
+
+    async def acquire(self):
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self._timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise PoolTimeout('No database connection available after %s seconds' % self._timeout)
+        finally:
+            self._waiting -= 1
+        waited = loop.time() - started
+        self._in_use += 1
+        self._checkouts += 1
+        self._total_wait += waited
+        self._max_wait = max(self._max_wait, waited)
+        try:
+            return await self._executor.run(self._engine.connect)
+        except:
+            self._release_slot()
+            raise
+
+    async def release(self, connection):
+        try:
+            await self._executor.run(connection.close)
+        finally:
+            self._release_slot()
+
+    def _release_slot(self):
+        self._in_use -= 1
+        self._slots.release()
+
+    def statistics(self):
+        result = {'capacity': self._capacity,
+                'in_use': self._in_use,
+                'saturation': self._in_use / self._capacity,
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'average_wait_seconds': self._total_wait / self._checkouts if self._checkouts else 0.0,
+                'max_wait_seconds': self._max_wait}
+        pool = self._engine.pool
+        if isinstance(pool, QueuePool):
+            result['pool_size'] = pool.size()
+            result['pool_checked_in'] = pool.checkedin()
+            result['pool_checked_out'] = pool.checkedout()
+            result['pool_overflow'] = pool.overflow()
+        return result
+
+    async def probe(self, timeout):
+        # Not on the database executor either, so a pool saturated by requests still passes as long as the database answers
+        await asyncio.wait_for(asyncio.get_event_loop().run_in_executor(None, _check, self._probe_engine), timeout)
+
+    def dispose(self):
+        self._engine.dispose()
+        self._probe_engine.dispose()
+
+
+class RequestConnection(object):
+    def __init__(self, pool, replica=False):
+        self._pool = pool
+        self.replica = replica
+        self._connection = None
+        self._statements_before = 0
+        self._statements = 0
+
+    @property
+    def statements(self):
+        # Statements executed on the borrowed connection, including any since acquired and not yet released
+        if self._connection is None:
+            return self._statements
+        return self._statements + self._connection.info.get('statements', 0) - self._statements_before
+
+    async def acquire(self):
+        if self._connection is None:
+            self._connection = await self._pool.acquire()
+            self._statements_before = self._connection.info.get('statements', 0)
+        return self._connection
+
+    async def release(self):
+        if self._connection is not None:
+            self._statements = self.statements
+            connection, self._connection = self._connection, None
+            await self._pool.release(connection)
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+
+
+_logger = logging.getLogger(__name__)
+
+
+class ReplicaRouter(object):
+    def __init__(self, primary, replicas, health_interval=5, health_timeout=2):
+        self._primary = primary
+        self._replicas = list(replicas)
+        self._health_interval = health_interval
+        self._health_timeout = health_timeout
+        self._healthy = [True] * len(self._replicas)
+        self._next = 0
+        self._task = None
+
+    @property
+    def primary(self):
+        return self._primary
+
+    @property
+    def replicas(self):
+        return list(self._replicas)
+
+    def for_read(self):
+        # Round-robin over the healthy replicas; when none is, reads fall back to the primary
+        for _ in range(len(self._replicas)):
+            index = self._next % len(self._replicas)
+            self._next += 1
+            if self._healthy[index]:
+                return self._replicas[index]
+        return self._primary
+
+    async def check(self):
+        for index, pool in enumerate(self._replicas):
+            try:
+                await pool.probe(self._health_timeout)
+                if not self._healthy[index]:
+                    _logger.warning('Replica %d is healthy again', index)
+                self._healthy[index] = True
+            except Exception as e:
+                if self._healthy[index]:
+                    reason = 'no answer within %s seconds' % self._health_timeout if isinstance(e, asyncio.TimeoutError) else e
+                    _logger.warning('Replica %d failed its health check and takes no reads until it passes: %s', index, reason)
+                self._healthy[index] = False
+
+    async def _run(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(self._health_interval)
+
+    def start(self):
+        if self._replicas:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def statistics(self):
+        return [dict(pool.statistics(), healthy=healthy) for pool, healthy in zip(self._replicas, self._healthy)]
+
+    def dispose(self):
+        for pool in self._replicas:
+            pool.dispose()
@@ -0,0 +1,227 @@
+import json
+import sqlalchemy as sa
+from .models import Image, Artifactory, Artifact, Configuration, Deployment, DeploymentHistory, record_changes, utc_now
+
+
+FORMAT = 'versioning-snapshot'
+VERSION = 1
+
+_AUDITABLE = ('effective_username', 'effective_utc')
+_DEACTIVATABLE = _AUDITABLE + ('deactivated_username', 'deactivated_utc', 'is_active')
+_DEPLOYMENT = ('environment', 'data_center', 'application', 'stripe', 'instance', 'image_version', 'artifact_version',
+        'configuration_version', 'revision') + _DEACTIVATABLE
+# Tables that have to be written before a table's foreign keys can be resolved
+_DEPENDENCIES = {'tImage': (), 'tArtifactory': (), 'tConfiguration': (), 'tArtifact': ('tArtifactory',),
+        'tDeployment': ('tImage', 'tArtifact', 'tConfiguration')}
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _columns(table, names):
+    return [table.c[name] for name in names]
+
+
+def _export_queries():
+    # Foreign keys are exported as the natural keys of the rows they refer to, so a snapshot loads into any database
+    image = Image.__table__
+    artifactory = Artifactory.__table__
+    artifact = Artifact.__table__
+    configuration = Configuration.__table__
+    yield 'tImage', sa.select(_columns(image, ('name',) + _AUDITABLE)).order_by(image.c.image_key)
+    yield 'tArtifactory', sa.select(_columns(artifactory, ('base_uri',) + _DEACTIVATABLE)).order_by(artifactory.c.artifactory_key)
+    yield 'tArtifact', sa.select([artifactory.c.base_uri.label('artifactory_base_uri')]
+            + _columns(artifact, ('group', 'name', 'revision') + _DEACTIVATABLE)) \
+            .select_from(artifact.join(artifactory, artifactory.c.artifactory_key == artifact.c.artifactory_key)) \
+            .order_by(artifact.c.artifact_key)
+    yield 'tConfiguration', sa.select(_columns(configuration, ('git_repository',) + _AUDITABLE)) \
+            .order_by(configuration.c.configuration_key)
+    # Archived history is exported with the rest of the deployments; the archiver moves it again after an import
+    for deployment in (DeploymentHistory.__table__, Deployment.__table__):
+        yield 'tDeployment', sa.select(_columns(deployment, _DEPLOYMENT) + [image.c.name.label('image_name'),
+                artifactory.c.base_uri.label('artifactory_base_uri'), artifact.c.group.label('artifact_group'),
+                artifact.c.name.label('artifact_name'), configuration.c.git_repository]) \
+                .select_from(deployment
+                    .join(image, image.c.image_key == deployment.c.image_key)
+                    .join(artifact, artifact.c.artifact_key == deployment.c.artifact_key)
+                    .join(artifactory, artifactory.c.artifactory_key == artifact.c.artifactory_key)
+                    .join(configuration, configuration.c.configuration_key == deployment.c.configuration_key)) \
+                .order_by(deployment.c.deployment_key)
+
+
+def _begin_snapshot(connection):
+    # Every table is read in one transaction, so no deployment refers to a row the snapshot does not have
+    if connection.dialect.name == 'sqlite':
+        transaction = connection.begin()
+        # pysqlite only opens a transaction of its own ahead of a write
+        connection.execute(sa.text('BEGIN'))
+        return connection, transaction
+    if connection.dialect.name in ('postgresql', 'mysql'):
+        connection = connection.execution_options(isolation_level='REPEATABLE READ')
+    return connection, connection.begin()
+
+
+def export_snapshot(connection, batch_size=1000):
+    # Yields NDJSON lines a batch at a time, fetched through a server-side cursor where the driver has one
+    yield [json.dumps({'format': FORMAT, 'version': VERSION}) + '\n']
+    (connection, transaction) = _begin_snapshot(connection)
+    try:
+        for table, query in _export_queries():
+            result = connection.execution_options(stream_results=True).execute(query)
+            try:
+                while True:
+                    rows = result.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield [json.dumps({'table': table, 'row': dict(zip(row.keys(), row))}) + '\n' for row in rows]
+            finally:
+                result.close()
+    finally:
+        transaction.rollback()
+
+
+_TABLES = {'tImage': Image.__table__, 'tArtifactory': Artifactory.__table__, 'tArtifact': Artifact.__table__,
+        'tConfiguration': Configuration.__table__, 'tDeployment': Deployment.__table__}
+
+
+def _natural_key(table, row):
+    if table == 'tImage':
+        return row['name']
+    if table == 'tArtifactory':
+        return row['base_uri']
+    if table == 'tArtifact':
+        return (row['artifactory_base_uri'], row['group'], row['name'])
+    return row['git_repository']
+
+
+def _key_query(table):
+    # Natural key columns followed by the surrogate key, for the dimension tables
+    image = Image.__table__
+    artifactory = Artifactory.__table__
+    artifact = Artifact.__table__
+    configuration = Configuration.__table__
+    if table == 'tImage':
+        return sa.select([image.c.name, image.c.image_key]), image.c.image_key
+    if table == 'tArtifactory':
+        return sa.select([artifactory.c.base_uri, artifactory.c.artifactory_key]), artifactory.c.artifactory_key
+    if table == 'tArtifact':
+        return sa.select([artifactory.c.base_uri, artifact.c.group, artifact.c.name, artifact.c.artifact_key]) \
+                .select_from(artifact.join(artifactory, artifactory.c.artifactory_key == artifact.c.artifactory_key)), \
+                artifact.c.artifact_key
+    return sa.select([configuration.c.git_repository, configuration.c.configuration_key]), configuration.c.configuration_key
+
+
+class SnapshotImporter(object):
+    def __init__(self, connection, batch_size=1000):
+        self._connection = connection
+        self._batch_size = batch_size
+        self._pending = dict((table, []) for table in _TABLES)
+        # Natural key -> surrogate key of every dimension row, and natural keys waiting to be inserted
+        self._keys = dict((table, {}) for table in _TABLES if table != 'tDeployment')
+        self._pending_keys = dict((table, set()) for table in self._keys)
+        self._header = None
+        self._first_deployment_key = None
+        self.lines = 0
+        self.counts = dict((table, 0) for table in _TABLES)
+
+    def _max_key(self, table):
+        return self._connection.execute(sa.select([sa.func.max(list(table.primary_key)[0])])).scalar() or 0
+
+    def _load_keys(self, table, after=0):
+        query, key = _key_query(table)
+        for row in self._connection.execute(query.where(key > after)):
+            self._keys[table][tuple(row[:-1]) if len(row) > 2 else row[0]] = row[-1]
+
+    def begin(self):
+        self._first_deployment_key = self._max_key(Deployment.__table__) + 1
+        for table in self._keys:
+            self._load_keys(table)
+
+    def _resolve(self, line, table, key):
+        try:
+            return self._keys[table][key]
+        except KeyError:
+            raise SnapshotError('line %d: no %s row with natural key %r' % (line, table, key))
+
+    def _row(self, table, line, row):
+        row = dict(row)
+        try:
+            if table == 'tArtifact':
+                row['artifactory_key'] = self._resolve(line, 'tArtifactory', row.pop('artifactory_base_uri'))
+            elif table == 'tDeployment':
+                row['image_key'] = self._resolve(line, 'tImage', row.pop('image_name'))
+                row['artifact_key'] = self._resolve(line, 'tArtifact',
+                        (row.pop('artifactory_base_uri'), row.pop('artifact_group'), row.pop('artifact_name')))
+                row['configuration_key'] = self._resolve(line, 'tConfiguration', row.pop('git_repository'))
+        except KeyError as e:
+            raise SnapshotError('line %d: %s row without %s' % (line, table, e))
+        return row
+
+    def _flush(self, table):
+        for dependency in _DEPENDENCIES[table]:
+            self._flush(dependency)
+        rows = self._pending[table]
+        if not rows:
+            return
+        self._pending[table] = []
+        target = _TABLES[table]
+        before = self._max_key(target)
+        # One executemany per batch; the keys it assigned are read back by natural key
+        self._connection.execute(target.insert(), [self._row(table, line, row) for (line, row) in rows])
+        self.counts[table] += len(rows)
+        if table in self._keys:
+            self._load_keys(table, before)
+            self._pending_keys[table].clear()
+
+    def add(self, line):
+        self.lines += 1
+        try:
+            entry = json.loads(line)
+        except ValueError as e:
+            raise SnapshotError('line %d: %s' % (self.lines, e))
+        if not isinstance(entry, dict):
+            raise SnapshotError('line %d: expected an object' % self.lines)
+        if self._header is None:
+            if entry.get('format') != FORMAT or entry.get('version') != VERSION:
+                raise SnapshotError('line %d: expected a %s version %d header' % (self.lines, FORMAT, VERSION))
+            self._header = entry
+            return
+        table = entry.get('table')
+        row = entry.get('row')
+        if table not in _TABLES or not isinstance(row, dict):
+            raise SnapshotError('line %d: expected a row of one of %s' % (self.lines, ', '.join(sorted(_TABLES))))
+        try:
+            if table in self._keys:
+                # Dimension rows the database already has are kept as they are
+                natural_key = _natural_key(table, row)
+                if natural_key in self._keys[table] or natural_key in self._pending_keys[table]:
+                    return
+                self._pending_keys[table].add(natural_key)
+        except KeyError as e:
+            raise SnapshotError('line %d: %s row without %s' % (self.lines, table, e))
+        self._pending[table].append((self.lines, row))
+        if len(self._pending[table]) >= self._batch_size:
+            self._flush(table)
+
+    def finish(self):
+        if self._header is None:
+            raise SnapshotError('empty snapshot')
+        for table in _TABLES:
+            self._flush(table)
+        # Feed subscribers hear about every deployment the import made current
+        table = Deployment.__table__
+        record_changes(self._connection, sa.and_(table.c.deployment_key >= self._first_deployment_key,
+                table.c.is_active == sa.true()), utc_now())
+        return self.counts
+
+
+def import_snapshot(connection, lines, batch_size=1000):
+    # One transaction: an import either loads completely or not at all
+    importer = SnapshotImporter(connection, batch_size)
+    with connection.begin():
+        importer.begin()
+        for line in lines:
+            if line.strip():
+                importer.add(line)
+        return importer.finish()
@@ -0,0 +1,28 @@
+import asyncio
+
+
+class ChangeNotifier(object):
+    def __init__(self):
+        self.version = 0
+        self.closed = False
+        self._event = asyncio.Event()
+
+    def notify(self):
+        self.version += 1
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    def close(self):
+        # On shutdown: waiters return at once, and subscribers stop instead of waiting for the next change
+        self.closed = True
+        self.notify()
+
+    async def wait(self, version, timeout):
+        # Takes the version the caller saw before reading, so a change committed in between is not slept through
+        if self.version != version:
+            return True
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
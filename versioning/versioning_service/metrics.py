@@ -0,0 +1,149 @@
+import threading
+import time
+import sqlalchemy as sa
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)] + list(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self._description = description
+        self._label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def increment(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self._description), '# TYPE %s counter' % self.name]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append('%s%s %s' % (self.name, _labels(self._label_names, labels), _number(value)))
+        return lines
+
+
+class Gauge(object):
+    def __init__(self, name, description):
+        self.name = name
+        self._description = description
+        self.value = 0
+
+    def render(self):
+        return ['# HELP %s %s' % (self.name, self._description), '# TYPE %s gauge' % self.name,
+                '%s %s' % (self.name, _number(self.value))]
+
+
+class Histogram(object):
+    def __init__(self, name, description, buckets, labels=()):
+        self.name = name
+        self._description = description
+        self._buckets = tuple(buckets)
+        self._label_names = tuple(labels)
+        # Observed from executor threads as well as the loop
+        self._lock = threading.Lock()
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._series = {}
+
+    def observe(self, value, labels=()):
+        index = len(self._buckets)
+        for i, bound in enumerate(self._buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self._buckets) + 1) + [0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self._description), '# TYPE %s histogram' % self.name]
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self._buckets + (float('inf'),), values):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (self.name, _labels(self._label_names, labels, ['le="%s"' % _number(bound)]), cumulative))
+            lines.append('%s_sum%s %s' % (self.name, _labels(self._label_names, labels), _number(values[-1])))
+            lines.append('%s_count%s %d' % (self.name, _labels(self._label_names, labels), cumulative))
+        return lines
+
+
+class Metrics(object):
+    def __init__(self, prefix='versioning'):
+        self.requests = Counter(prefix + '_http_requests_total', 'HTTP requests by route, method and status.',
+                ('route', 'method', 'status'))
+        self.request_duration = Histogram(prefix + '_http_request_duration_seconds', 'HTTP request latency by route and method.',
+                LATENCY_BUCKETS, ('route', 'method'))
+        self.in_flight = Gauge(prefix + '_http_requests_in_flight', 'HTTP requests currently being handled.')
+        self.statement_duration = Histogram(prefix + '_db_statement_duration_seconds', 'SQL statement latency by verb.',
+                STATEMENT_BUCKETS, ('verb',))
+        self.request_statements = Histogram(prefix + '_db_statements_per_request', 'SQL statements executed per HTTP request.',
+                COUNT_BUCKETS, ('route', 'method'))
+        self.artifactory_lookup_duration = Histogram(prefix + '_artifactory_lookup_duration_seconds',
+                'Download URL lookups as seen by callers, cache hits included, by outcome.', LATENCY_BUCKETS, ('outcome',))
+        self.artifactory_fetch_duration = Histogram(prefix + '_artifactory_fetch_duration_seconds',
+                'Download URL lookups that went to Artifactory, by outcome.', LATENCY_BUCKETS, ('outcome',))
+        self._prefix = prefix
+
+    def observe_request(self, route, method, status, seconds, statements):
+        self.requests.increment((route, method, status))
+        self.request_duration.observe(seconds, (route, method))
+        self.request_statements.observe(statements, (route, method))
+
+    def instrument_engine(self, engine):
+        # The start time rides on the execution context, which is private to one statement
+        def before(connection, cursor, statement, parameters, context, executemany):
+            context._metrics_started = time.perf_counter()
+
+        def after(connection, cursor, statement, parameters, context, executemany):
+            verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'UNKNOWN'
+            self.statement_duration.observe(time.perf_counter() - context._metrics_started, (verb,))
+
+        sa.event.listen(engine, 'before_cursor_execute', before)
+        sa.event.listen(engine, 'after_cursor_execute', after)
+
+    def _statistics(self, name, statistics, description):
+        lines = []
+        for key, value in sorted(statistics.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metric = '%s_%s_%s' % (self._prefix, name, key)
+                lines.extend(['# HELP %s %s' % (metric, description), '# TYPE %s gauge' % metric,
+                        '%s %s' % (metric, _number(value))])
+        return lines
+
+    def render(self, app):
+        lines = []
+        for metric in (self.requests, self.request_duration, self.in_flight, self.statement_duration,
+                self.request_statements, self.artifactory_lookup_duration, self.artifactory_fetch_duration):
+            lines.extend(metric.render())
+        lines.extend(self._statistics('db_pool', app['db_pool'].statistics(), 'Database connection pool statistic.'))
+        lines.extend(self._statistics('deployment_cache', app['deployment_cache'].statistics(), 'Deployment cache statistic.'))
+        lines.extend(self._statistics('download_url_cache', app['artifactory'].cache.statistics(), 'Download URL cache statistic.'))
+        lines.extend(self._statistics('request_coalescer', app['request_coalescer'].statistics(),
+                'Identical concurrent reads sharing one response; ratio is the share answered without computing their own.'))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,121 @@
+import functools
+from collections import OrderedDict
+import sqlalchemy as sa
+from .db import models
+from .db.bulk import DEPLOYMENT_KEY
+
+
+# Document field -> the (table, column) pairs it is computed from, in the order documents list them
+FIELDS = OrderedDict([(part, (('deployment', part),)) for part in DEPLOYMENT_KEY] + [
+    ('image_name', (('image', 'name'),)),
+    ('image_version', (('deployment', 'image_version'),)),
+    ('artifact_group', (('artifact', 'group'),)),
+    ('artifact_name', (('artifact', 'name'),)),
+    ('artifact_version', (('deployment', 'artifact_version'),)),
+    ('artifact_download_url', (('artifactory', 'base_uri'), ('artifact', 'group'), ('artifact', 'name'),
+        ('deployment', 'artifact_version'))),
+    ('git_repository', (('configuration', 'git_repository'),)),
+    ('configuration_version', (('deployment', 'configuration_version'),)),
+    ('effective_username', (('deployment', 'effective_username'),)),
+    ('effective_utc', (('deployment', 'effective_utc'),)),
+    ('is_active', (('deployment', 'is_active'),)),
+    ('uri', tuple(('deployment', part) for part in DEPLOYMENT_KEY)),
+    ('deactivated_username', (('deployment', 'deactivated_username'),)),
+    ('deactivated_utc', (('deployment', 'deactivated_utc'),)),
+    ])
+
+_ALWAYS = (('deployment', 'deployment_key'),)
+# What the validators of a full document are built from, besides the fields
+_VERSION = (('deployment', 'deployment_key'), ('deployment', 'revision'), ('deployment', 'effective_utc'),
+        ('deployment', 'deactivated_utc'))
+
+
+def parse_fields(value):
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown or not fields:
+        raise ValueError('Unknown field(s) %s; expected some of %s' % (', '.join(unknown), ', '.join(FIELDS)))
+    # Order and duplicates follow the caller
+    return list(OrderedDict.fromkeys(fields))
+
+
+def project(document, fields):
+    return OrderedDict((field, document.get(field)) for field in fields)
+
+
+def _label(reference):
+    return '%s_%s' % reference
+
+
+def select_fields(model, fields):
+    # Joins only the dimension tables the fields need, and selects only the columns they are computed from
+    deployment = model.__table__
+    needed = set(table for field in fields for (table, column) in FIELDS[field])
+    tables = {'deployment': deployment}
+    joined = deployment
+    if 'image' in needed:
+        tables['image'] = models.Image.__table__
+        joined = joined.join(tables['image'], tables['image'].c.image_key == deployment.c.image_key)
+    if 'artifact' in needed or 'artifactory' in needed:
+        tables['artifact'] = models.Artifact.__table__
+        joined = joined.join(tables['artifact'], tables['artifact'].c.artifact_key == deployment.c.artifact_key)
+    if 'artifactory' in needed:
+        tables['artifactory'] = models.Artifactory.__table__
+        joined = joined.join(tables['artifactory'], tables['artifactory'].c.artifactory_key == tables['artifact'].c.artifactory_key)
+    if 'configuration' in needed:
+        tables['configuration'] = models.Configuration.__table__
+        joined = joined.join(tables['configuration'],
+                tables['configuration'].c.configuration_key == deployment.c.configuration_key)
+    references = OrderedDict.fromkeys(_ALWAYS + tuple(reference for field in fields for reference in FIELDS[field]))
+    return sa.select([tables[table].c[column].label(_label((table, column))) for (table, column) in references]).select_from(joined)
+
+
+@functools.lru_cache(maxsize=256)
+def select_deployments(model, fields, names, as_of=False, after=False, limit=False):
+    # Built once per shape: values arrive as bind parameters named after the filter, 'as_of', 'after' and 'limit', so
+    # every request of a shape reuses one statement and its compiled form. fields is None for full documents
+    table = model.__table__
+    if fields is None:
+        query = select_fields(model, FIELDS).add_columns(table.c.revision.label(_label(_VERSION[1])))
+    else:
+        query = select_fields(model, fields)
+    query = query.where(sa.and_(*[table.c[name] == sa.bindparam(name) for name in names]))
+    if as_of:
+        query = query.where(model.effective_at(sa.bindparam('as_of')))
+    if after:
+        query = query.where(table.c.deployment_key > sa.bindparam('after'))
+    query = query.order_by(table.c.deployment_key)
+    if limit:
+        query = query.limit(sa.bindparam('limit', type_=sa.Integer))
+    return query
+
+
+# (field, label) in document order; the download URL and uri are not plain columns and start out as None
+_DOCUMENT = [(field, None if field in ('artifact_download_url', 'uri') else _label(references[0]))
+        for (field, references) in FIELDS.items() if field not in ('deactivated_username', 'deactivated_utc')]
+_DEACTIVATED = [(field, _label(FIELDS[field][0])) for field in ('deactivated_username', 'deactivated_utc')]
+
+
+def full_document(row, uri):
+    # The document a full-document select row maps to, its artifact and what its validators are built from
+    document = dict((field, row[label] if label else None) for (field, label) in _DOCUMENT)
+    document['uri'] = uri(tuple(row[_label(reference)] for reference in FIELDS['uri']))
+    if not document['is_active']:
+        document.update((field, row[label]) for (field, label) in _DEACTIVATED)
+    return (document, tuple(row[_label(reference)] for reference in FIELDS['artifact_download_url']),
+            tuple(row[_label(reference)] for reference in _VERSION))
+
+
+def row_document(row, fields, uri):
+    # Returns the document and, when the download URL was asked for, the artifact it is resolved from
+    document = OrderedDict()
+    artifact = None
+    for field in fields:
+        if field == 'artifact_download_url':
+            artifact = tuple(row[_label(reference)] for reference in FIELDS[field])
+            document[field] = None
+        elif field == 'uri':
+            document[field] = uri(tuple(row[_label(reference)] for reference in FIELDS[field]))
+        else:
+            document[field] = row[_label(FIELDS[field][0])]
+    return row[_label(_ALWAYS[0])], document, artifact
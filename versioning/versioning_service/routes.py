@@ -0,0 +1,14 @@
+from .views import DeploymentView, DeploymentCollectionView, DeploymentDiffView, ArtifactView, ChangeFeedView, DatabasePoolView, DeploymentCacheView, MetricsView, SnapshotView, AuthCacheView
+
+
+def setup_routes(app):
+    DeploymentView.setup_routes(app)
+    DeploymentCollectionView.setup_routes(app)
+    DeploymentDiffView.setup_routes(app)
+    ArtifactView.setup_routes(app)
+    ChangeFeedView.setup_routes(app)
+    DatabasePoolView.setup_routes(app)
+    DeploymentCacheView.setup_routes(app)
+    MetricsView.setup_routes(app)
+    SnapshotView.setup_routes(app)
+    AuthCacheView.setup_routes(app)
@@ -0,0 +1,1060 @@
+import asyncio
+import email.utils
+import io
+import tempfile
+import sqlalchemy as sa
+from aiohttp import web, ClientError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm.exc import NoResultFound, StaleDataError
+from .db import models
+from .db.loading import deployment_models, deployment_query
+from .db.diff import SCOPE, diff_document, diff_query
+from .db.snapshot import SnapshotError, export_snapshot, import_snapshot
+from .db.changes import cursor_expired, visible_revision
+from .db.bulk import DEPLOYMENT_KEY, DEPLOYMENT_VERSIONS, ConcurrentModification, key_condition, upgrade_deployments, \
+        upgrade_deployment_if_match, deactivate_deployment_if_match
+from .cache import CachedDeployment
+from . import projection
+import datetime
+import urllib.request
+import json
+import aiohttp_security
+from aiohttp_security import authorized_userid
+
+
+_DEPLOYMENT_ROUTE_NAME = 'deployment'
+_ARTIFACT_ROUTE_NAME = 'artifact'
+_DOWNLOAD_URL_WARNING = '199 versioning "artifact_download_url unavailable for %d deployment(s)"'
+
+
+def _http_date(utc):
+    return email.utils.formatdate(utc / 1000.0, usegmt=True)
+
+
+def _validators(etag, last_modified_utc):
+    return {'ETag': '"%s"' % etag, 'Last-Modified': _http_date(last_modified_utc)}
+
+
+def _row_validators(key, revision, effective_utc, deactivated_utc=None):
+    # The revision moves with every write to the row, and a new row is a new key
+    return _validators('%d-%d' % (key, revision), deactivated_utc or effective_utc)
+
+
+def _if_match(request):
+    # The (key, revision) pairs If-Match names, or None when any current representation will do
+    value = request.headers.get('If-Match')
+    if value is None or value.strip() == '*':
+        return None
+    expected = []
+    for tag in value.split(','):
+        tag = tag.strip()
+        # Weak tags never match, and neither do tags this service did not issue
+        if len(tag) > 1 and tag.startswith('"') and tag.endswith('"'):
+            (key, _, revision) = tag[1:-1].partition('-')
+            if key.isdigit() and revision.isdigit():
+                expected.append((int(key), int(revision)))
+    return expected
+
+
+def _is_not_modified(request, validators):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        # If-None-Match wins over If-Modified-Since, and GET compares entity tags weakly
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+        return '*' in tags or validators['ETag'] in tags
+    if_modified_since = request.if_modified_since
+    if if_modified_since is not None:
+        return email.utils.parsedate_to_datetime(validators['Last-Modified']) <= if_modified_since
+    return False
+
+
+async def _get_artifact_download_url(artifact, app, timeout, partial_results, warnings):
+    try:
+        return await asyncio.wait_for(app['artifactory'].get_download_url(*artifact), timeout)
+    except asyncio.TimeoutError:
+        if not partial_results:
+            raise web.HTTPGatewayTimeout(text='Artifactory did not respond within %s seconds' % timeout)
+        warnings.append('artifact_download_url unavailable: Artifactory did not respond within %s seconds' % timeout)
+    except ClientError as e:
+        if not partial_results:
+            raise web.HTTPBadGateway(text='Artifactory lookup failed: %s' % e)
+        warnings.append('artifact_download_url unavailable: %s' % e)
+    return None
+
+
+def _deployment_artifact(deployment):
+    return (deployment.artifact.artifactory.base_uri, deployment.artifact.group, deployment.artifact.name, deployment.artifact_version)
+
+
+def _deployment_uri(app, key):
+    return str(app.router[_DEPLOYMENT_ROUTE_NAME].url_for(**dict(zip(DEPLOYMENT_KEY, key))))
+
+
+def _deployment_document(deployment, app):
+    uri = _deployment_uri(app, tuple(getattr(deployment, part) for part in DEPLOYMENT_KEY))
+    result = {'environment': deployment.environment,
+            'data_center': deployment.data_center,
+            'application': deployment.application,
+            'stripe': deployment.stripe,
+            'instance': deployment.instance,
+            'image_name': deployment.image.name,
+            'image_version': deployment.image_version,
+            'artifact_group': deployment.artifact.group,
+            'artifact_name': deployment.artifact.name,
+            'artifact_version': deployment.artifact_version,
+            'artifact_download_url': None,
+            'git_repository': deployment.configuration.git_repository,
+            'configuration_version': deployment.configuration_version,
+            'effective_username': deployment.effective_username,
+            'effective_utc': deployment.effective_utc,
+            'is_active': deployment.is_active,
+            'uri': uri
+            }
+    if not result['is_active']:
+        result['deactivated_username'] = deployment.deactivated_username
+        result['deactivated_utc'] = deployment.deactivated_utc
+    return result
+
+
+async def _add_download_url(document, artifact, app, timeout=None, partial_results=False):
+    warnings = []
+    result = dict(document)
+    result['artifact_download_url'] = await _get_artifact_download_url(artifact, app, timeout, partial_results, warnings)
+    if warnings:
+        result['warnings'] = warnings
+    return result
+
+
+def _deployment_document_and_artifact(deployment, app):
+    # Walks the relationships, so it runs in the executor while the unit of work is open
+    return _deployment_document(deployment, app), _deployment_artifact(deployment)
+
+
+def _deployment_validators(deployment):
+    return _row_validators(deployment.deployment_key, deployment.revision, deployment.effective_utc, deployment.deactivated_utc)
+
+
+def _cached_deployment(row, app):
+    # The download URL is left to the Artifactory resolver, whose TTLs know how long it may be reused
+    (document, artifact, version) = projection.full_document(row, lambda key: _deployment_uri(app, key))
+    return CachedDeployment(document, _row_validators(*version), artifact)
+
+
+async def warm_deployment_cache(app):
+    cache = app['deployment_cache']
+    query = projection.select_deployments(models.Deployment, None, ('is_active',)).order_by(None) \
+            .order_by(models.Deployment.effective_utc.desc()).limit(cache.max_size)
+    connection = await app['db_pool'].acquire()
+    try:
+        rows = await app['db_executor'].run(_fetch_all, connection, query, {'is_active': True})
+    finally:
+        await app['db_pool'].release(connection)
+    for row in rows:
+        cached = _cached_deployment(row, app)
+        cache.put(tuple(cached.document[part] for part in DEPLOYMENT_KEY), cached)
+
+
+async def _add_download_urls(documents, app, partial_results):
+    semaphore = asyncio.Semaphore(app['download_url_concurrency'])
+    timeout = app['download_url_timeout']
+
+    async def add_download_url(document, artifact):
+        async with semaphore:
+            return await _add_download_url(document, artifact, app, timeout, partial_results)
+    return await asyncio.gather(*[add_download_url(document, artifact) for (document, artifact) in documents])
+
+
+async def _artifact_to_dict(artifact, app):
+    uri = str(app.router[_ARTIFACT_ROUTE_NAME].url_for(group=artifact.group, name=artifact.name))
+    result = {'group': artifact.group,
+            'name': artifact.name,
+            'artifactory_base_uri': artifact.artifactory.base_uri,
+            'effective_username': artifact.effective_username,
+            'effective_utc': artifact.effective_utc,
+            'is_active': artifact.is_active,
+            'uri': uri
+            }
+    if not result['is_active']:
+        result['deactivated_username'] = artifact.deactivated_username
+        result['deactivated_utc'] = artifact.deactivated_utc
+    return result
+
+
+def _columnar(documents, fields):
+    # Column names once, then a bare array per row
+    columns = list(fields or projection.FIELDS)
+    if any('warnings' in document for document in documents):
+        columns.append('warnings')
+    return {'columns': columns, 'rows': [[document.get(column) for column in columns] for document in documents]}
+
+
+def _accepts_gzip(request):
+    for coding in request.headers.get('Accept-Encoding', '').split(','):
+        (name, _, parameters) = coding.partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            parameters = parameters.strip().replace(' ', '')
+            try:
+                return not parameters.startswith('q=') or float(parameters[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def _compress(request, response, size=None):
+    response.headers['Vary'] = 'Accept-Encoding'
+    if (size is None or size >= request.app['gzip_min_size']) and _accepts_gzip(request):
+        response.enable_compression(web.ContentCoding.gzip)
+
+
+def _download_url_headers(validators, document):
+    if 'warnings' not in document:
+        return validators
+    return dict(validators, Warning=_DOWNLOAD_URL_WARNING % 1)
+
+
+def _json_response(request, data, headers=None):
+    body = json.dumps(data).encode('utf-8')
+    response = web.Response(body=body, headers=headers, content_type='application/json')
+    _compress(request, response, len(body))
+    return response
+
+
+def _fetch_all(unit_of_work, query, parameters=None):
+    return unit_of_work.execute(query, parameters or {}).fetchall()
+
+
+def _in_transaction(unit_of_work, function, *args, **kwargs):
+    try:
+        result = function(*args, **kwargs)
+        unit_of_work.commit()
+        return result
+    except:
+        unit_of_work.rollback()
+        raise
+
+
+class ServiceBase(object):
+    @property
+    def loop(self):
+        return self.request.app.loop
+
+    @property
+    def db_executor(self):
+        return self.request.app['db_executor']
+
+    async def get_unit_of_work(self):
+        # Objects keep their state through a commit: responses are built from them on the loop, where reloading an
+        # expired attribute would block it on the database
+        return sessionmaker(bind=await self.request.db_connection.acquire(), expire_on_commit=False)()
+
+    async def run_query(self, function, *args, **kwargs):
+        return await self.db_executor.run(function, *args, **kwargs)
+
+    async def release_unit_of_work(self, unit_of_work):
+        # Hands the connection back before waiting on something else, such as Artifactory
+        await self.run_query(unit_of_work.close)
+        await self.request.db_connection.release()
+
+    async def run_transaction(self, unit_of_work, function, *args, **kwargs):
+        # Writes and their commit share one executor call: SQLite holds its write lock from the first write until the
+        # commit, and a commit queued behind executor threads blocked on that lock would never run
+        return await self.db_executor.run(_in_transaction, unit_of_work, function, *args, **kwargs)
+
+    @property
+    def is_conditional(self):
+        return 'If-None-Match' in self.request.headers or 'If-Modified-Since' in self.request.headers
+
+    async def prime_dimensions(self, unit_of_work):
+        await self.run_query(self.request.app['dimensions'].prime, unit_of_work)
+
+    async def check_permission(self, permission, **context):
+        if not await aiohttp_security.permits(self.request, permission, context or None):
+            raise web.HTTPForbidden(text='%s permission required' % permission)
+
+
+class DeploymentView(web.View, ServiceBase):
+    @staticmethod
+    def setup_routes(app, path_prefix=''):
+        app.router.add_route('*', path_prefix + '/deployments/{environment}/{data_center}/{application}/{stripe}/{instance}', DeploymentView, name=_DEPLOYMENT_ROUTE_NAME)
+
+    @property
+    def _key(self):
+        return {'environment': self.request.match_info.get('environment'),
+                'data_center': self.request.match_info.get('data_center'),
+                'application': self.request.match_info.get('application'),
+                'stripe': self.request.match_info.get('stripe'),
+                'instance': self.request.match_info.get('instance') }
+
+    @property
+    def _cache_key(self):
+        return tuple(self.request.match_info.get(part) for part in DEPLOYMENT_KEY)
+
+    @property
+    def _cache(self):
+        return self.request.app['deployment_cache']
+
+    async def _get_image(self, name, unit_of_work):
+        return await self.run_query(unit_of_work.query(models.Image).filter_by(name=name).one)
+
+    async def _get_artifact(self, group, name, unit_of_work):
+        return await self.run_query(unit_of_work.query(models.Artifact).filter_by(group=group, name=name).one)
+
+    async def _get_configuration(self, git_repository, unit_of_work):
+        return await self.run_query(unit_of_work.query(models.Configuration).filter_by(git_repository=git_repository).one)
+
+    async def _get_deployment(self, unit_of_work):
+        await self.prime_dimensions(unit_of_work)
+        return await self.run_query(deployment_query(unit_of_work).filter_by(is_active=True, **self._key).one)
+
+    async def _read_deployment(self, unit_of_work, as_of=None):
+        # Reads map plain rows straight to the document; entities are only loaded for writes
+        parameters = dict(self._key)
+        if as_of is None:
+            parameters['is_active'] = True
+            queries = [projection.select_deployments(models.Deployment, None, DEPLOYMENT_KEY + ('is_active',))]
+        else:
+            # Past the retention horizon the row has been archived
+            parameters['as_of'] = as_of
+            queries = [projection.select_deployments(model, None, DEPLOYMENT_KEY, as_of=True)
+                    for model in (models.Deployment, models.DeploymentHistory)]
+        for query in queries:
+            rows = await self.run_query(_fetch_all, unit_of_work, query, parameters)
+            if rows:
+                return _cached_deployment(rows[0], self.request.app)
+        raise NoResultFound()
+
+    def _changed(self):
+        self._cache.invalidate(self._cache_key)
+        self.request.app['change_notifier'].notify()
+
+    async def _commit_change(self, unit_of_work):
+        unit_of_work.add(models.Change(effective_utc=models.utc_now(), **self._key))
+        await self.run_query(unit_of_work.commit)
+        self._changed()
+
+    async def _precondition_failed(self, unit_of_work, expected, versions=None):
+        # Only asked once a conditional write has matched nothing, to tell the caller why
+        current = await self.run_query(unit_of_work.query(models.Deployment.deployment_key, models.Deployment.revision,
+                *[getattr(models.Deployment, name) for name in DEPLOYMENT_VERSIONS]).filter_by(**self._key, is_active=True).first)
+        if current is None:
+            return web.json_response(self._key, status=404)
+        if versions is not None and tuple(current[:2]) in expected and \
+                tuple(current[2:]) == tuple(versions[name] for name in DEPLOYMENT_VERSIONS):
+            return web.json_response(self._key, status=409)
+        return web.json_response(self._key, status=412)
+
+    async def _get_deployment_as_of(self, as_of, fields):
+        try:
+            unit_of_work = await self.get_unit_of_work()
+            deployment = await self._read_deployment(unit_of_work, as_of)
+        except NoResultFound:
+            return web.json_response(data=self._key, status=404)
+        if _is_not_modified(self.request, deployment.validators):
+            return web.Response(status=304, headers=deployment.validators)
+        await self.release_unit_of_work(unit_of_work)
+        document = await self._render(deployment.document, deployment.artifact, fields)
+        return _json_response(self.request, document, _download_url_headers(deployment.validators, document))
+
+    async def _render(self, document, artifact, fields):
+        # Artifactory is only asked when the download URL is among the fields. Unless ?partial=false, a lookup that
+        # fails or outlasts download_url_timeout leaves the URL null with a warning rather than failing the read
+        app = self.request.app
+        if fields is None or 'artifact_download_url' in fields:
+            partial_results = _get_boolean_parameter(self.request.rel_url.query, 'partial', app['download_url_partial_results'])
+            document = await _add_download_url(document, artifact, app, app['download_url_timeout'], partial_results)
+        if fields is None:
+            return document
+        projected = projection.project(document, fields)
+        if 'warnings' in document:
+            projected['warnings'] = document['warnings']
+        return projected
+
+    async def get(self):
+        fields = _get_fields_parameter(self.request.rel_url.query)
+        as_of = _get_utc_parameter(self.request.rel_url.query, 'as_of')
+        if as_of is not None:
+            return await self._get_deployment_as_of(as_of, fields)
+        cached = self._cache.get(self._cache_key)
+        if cached is None:
+            generation = self._cache.generation
+            try:
+                unit_of_work = await self.get_unit_of_work()
+                if self.is_conditional:
+                    validators = _row_validators(*await self.run_query(unit_of_work.query(models.Deployment.deployment_key,
+                        models.Deployment.revision, models.Deployment.effective_utc).filter_by(**self._key, is_active=True).one))
+                    if _is_not_modified(self.request, validators):
+                        return web.Response(status=304, headers=validators)
+                cached = await self._read_deployment(unit_of_work)
+            except NoResultFound:
+                return web.json_response(data=self._key, status=404)
+            self._cache.put(self._cache_key, cached, generation, self.request.db_connection.replica)
+            await self.release_unit_of_work(unit_of_work)
+        elif _is_not_modified(self.request, cached.validators):
+            return web.Response(status=304, headers=cached.validators)
+        document = await self._render(cached.document, cached.artifact, fields)
+        return _json_response(self.request, document, _download_url_headers(cached.validators, document))
+
+    async def post(self):
+        unit_of_work = await self.get_unit_of_work()
+        try:
+            deployment = await self._get_deployment(unit_of_work)
+            return web.json_response(self._key, status=405)
+        except NoResultFound:
+            pass
+        if _if_match(self.request) is not None:
+            # There is no current representation for a tag to match
+            return web.json_response(self._key, status=412)
+        await self.check_permission('write', environment=self._key['environment'])
+        username = await authorized_userid(self.request)
+        data = await self.request.post()
+        deployment = models.Deployment(environment=self.request.match_info.get('environment'),
+                data_center=self.request.match_info.get('data_center'),
+                application=self.request.match_info.get('application'),
+                stripe=self.request.match_info.get('stripe'),
+                instance=self.request.match_info.get('instance'),
+                image=await self._get_image(data['image_name'], unit_of_work),
+                image_version=data['image_version'],
+                artifact=await self._get_artifact(data['artifact_group'], data['artifact_name'], unit_of_work),
+                artifact_version=data['artifact_version'],
+                configuration=await self._get_configuration(data['git_repository'], unit_of_work),
+                configuration_version=data['configuration_version'],
+                effective_username=username)
+        unit_of_work.add(deployment)
+        try:
+            await self._commit_change(unit_of_work)
+        except sa.exc.IntegrityError:
+            # Another writer created it in between; the unique index on active rows keeps there from being two
+            return web.json_response(self._key, status=412 if self.request.headers.get('If-None-Match', '').strip() == '*' else 409)
+        (document, artifact) = await self.run_query(_deployment_document_and_artifact, deployment, self.request.app)
+        await self.release_unit_of_work(unit_of_work)
+        # The row is created by now, so an Artifactory failure only leaves the download URL out
+        document = await _add_download_url(document, artifact, self.request.app, self.request.app['download_url_timeout'], True)
+        return web.json_response(document, status=201, headers=_download_url_headers(_deployment_validators(deployment), document))
+
+    async def delete(self):
+        unit_of_work = await self.get_unit_of_work()
+        expected = _if_match(self.request)
+        await self.check_permission('write', environment=self._key['environment'])
+        try:
+            username = await authorized_userid(self.request)
+            if expected is not None:
+                if await self.run_transaction(unit_of_work, deactivate_deployment_if_match, unit_of_work, self._cache_key, expected,
+                        username, models.utc_now()) is None:
+                    return await self._precondition_failed(unit_of_work, expected)
+                self._changed()
+                return web.json_response({}, status=204)
+            deployment = await self._get_deployment(unit_of_work)
+            deployment.deactivate(username)
+            await self._commit_change(unit_of_work)
+            return web.json_response({}, status=204)
+        except NoResultFound:
+            return web.json_response(self._key, status=404)
+        except StaleDataError:
+            return web.json_response(self._key, status=409)
+
+    async def patch(self):
+        unit_of_work = await self.get_unit_of_work()
+        expected = _if_match(self.request)
+        await self.check_permission('write', environment=self._key['environment'])
+        try:
+            username = await authorized_userid(self.request)
+            data = await self.request.post()
+            versions = dict((name, data[name]) for name in DEPLOYMENT_VERSIONS)
+            conditional = expected is not None
+            if not conditional:
+                # Without If-Match the write is conditional on the revision read here instead
+                current = await self.run_query(unit_of_work.query(models.Deployment.deployment_key, models.Deployment.revision,
+                        *[getattr(models.Deployment, name) for name in DEPLOYMENT_VERSIONS]).filter_by(**self._key, is_active=True).one)
+                if tuple(current[2:]) == tuple(versions[name] for name in DEPLOYMENT_VERSIONS):
+                    return web.json_response(self._key, status=409)
+                expected = [tuple(current[:2])]
+            if await self.run_transaction(unit_of_work, upgrade_deployment_if_match, unit_of_work, self._cache_key, expected,
+                    versions, username, models.utc_now()) is None:
+                if not conditional:
+                    # Another writer changed it between our read and our write
+                    return web.json_response(self._key, status=409)
+                return await self._precondition_failed(unit_of_work, expected, versions)
+            self._changed()
+            # Only the new row's validators: a 204 carries no document, so Artifactory is not asked for one
+            validators = _row_validators(*await self.run_query(unit_of_work.query(models.Deployment.deployment_key,
+                models.Deployment.revision, models.Deployment.effective_utc).filter_by(**self._key, is_active=True).one))
+            return web.Response(status=204, headers=validators)
+        except NoResultFound:
+            return web.json_response(self._key, status=404)
+
+
+class ArtifactView(web.View, ServiceBase):
+    @staticmethod
+    def setup_routes(app, path_prefix=''):
+        app.router.add_route('*', path_prefix + '/artifacts/{group}/{name}', ArtifactView, name=_ARTIFACT_ROUTE_NAME)
+
+    async def _get_artifact(self, unit_of_work):
+        await self.prime_dimensions(unit_of_work)
+        return await self.run_query(unit_of_work.query(models.Artifact).filter_by(**self._key, is_active=True).one)
+
+    async def _get_artifactory(self, base_uri, username, utc_timestamp, unit_of_work):
+        result = await self.run_query(unit_of_work.query(models.Artifactory).filter_by(base_uri=base_uri).one_or_none)
+        if result is None:
+            result = models.Artifactory(base_uri=base_uri,
+                    effective_username=username,
+                    effective_utc=utc_timestamp)
+            unit_of_work.add(result)
+        return result
+
+    @property
+    def _key(self):
+        return {'group': self.request.match_info.get('group'),
+                'name': self.request.match_info.get('name') }
+
+    def _matches(self, artifact):
+        # The write itself is conditional on the revision read here: the version column makes the flush
+        # UPDATE ... WHERE revision = ?, which matches nothing if another writer got there first
+        expected = _if_match(self.request)
+        return expected is None or (artifact.artifact_key, artifact.revision) in expected
+
+    def _changed_concurrently(self):
+        return web.json_response(self._key, status=412 if _if_match(self.request) is not None else 409)
+
+    async def get(self):
+        try:
+            unit_of_work = await self.get_unit_of_work()
+            if self.is_conditional:
+                validators = _row_validators(*await self.run_query(unit_of_work.query(models.Artifact.artifact_key,
+                    models.Artifact.revision, models.Artifact.effective_utc).filter_by(**self._key, is_active=True).one))
+                if _is_not_modified(self.request, validators):
+                    return web.Response(status=304, headers=validators)
+            artifact = await self._get_artifact(unit_of_work)
+            validators = _row_validators(artifact.artifact_key, artifact.revision, artifact.effective_utc)
+            return web.json_response(await _artifact_to_dict(artifact, self.request.app), headers=validators)
+        except NoResultFound:
+            return web.json_response(data=self._key, status=404)
+
+    async def post(self):
+        await self.check_permission('write')
+        unit_of_work = await self.get_unit_of_work()
+        try:
+            artifact = await self._get_artifact(unit_of_work)
+            return web.json_response(self._key, status=405)
+        except NoResultFound:
+            pass
+        username = await authorized_userid(self.request)
+        data = await self.request.post()
+        utc_timestamp = models.utc_now()
+        artifact = models.Artifact(**self._key,
+                artifactory=await self._get_artifactory(data['base_uri'], username, utc_timestamp, unit_of_work),
+                effective_username=username,
+                effective_utc=utc_timestamp)
+        unit_of_work.add(artifact)
+        await self.run_query(unit_of_work.commit)
+        self.request.app['dimensions'].invalidate()
+        return web.json_response(await _artifact_to_dict(artifact, self.request.app), status=201)
+
+    async def put(self):
+        await self.check_permission('write')
+        unit_of_work = await self.get_unit_of_work()
+        try:
+            username = await authorized_userid(self.request)
+            data = await self.request.post()
+            utc_timestamp = models.utc_now()
+            artifact = await self._get_artifact(unit_of_work)
+            if not self._matches(artifact):
+                return web.json_response(self._key, status=412)
+            artifactory = await self._get_artifactory(data['base_uri'], username, utc_timestamp, unit_of_work)
+            if artifactory.artifactory_key == artifact.artifactory_key:
+                # Already there, so there is nothing to write
+                return web.json_response({'deployments_switched': 0},
+                        headers=_row_validators(artifact.artifact_key, artifact.revision, artifact.effective_utc))
+            (new_artifact, switched) = await self.run_transaction(unit_of_work, artifact.change_to_artifactory, artifactory,
+                    username, utc_timestamp)
+            self.request.app['dimensions'].invalidate()
+            self.request.app['deployment_cache'].invalidate_artifact(self._key['group'], self._key['name'])
+            self.request.app['change_notifier'].notify()
+            return web.json_response({'deployments_switched': switched},
+                    headers=_row_validators(new_artifact.artifact_key, new_artifact.revision, new_artifact.effective_utc))
+        except NoResultFound:
+            return web.json_response(self._key, status=404)
+        except StaleDataError:
+            return self._changed_concurrently()
+
+    async def delete(self):
+        await self.check_permission('write')
+        unit_of_work = await self.get_unit_of_work()
+        try:
+            username = await authorized_userid(self.request)
+            artifact = await self._get_artifact(unit_of_work)
+            if not self._matches(artifact):
+                return web.json_response(self._key, status=412)
+            deactivated = await self.run_transaction(unit_of_work, artifact.deactivate, username)
+            self.request.app['deployment_cache'].invalidate_artifact(self._key['group'], self._key['name'])
+            self.request.app['change_notifier'].notify()
+            return web.json_response({'deployments_deactivated': deactivated})
+        except NoResultFound:
+            return web.json_response(self._key, status=404)
+        except StaleDataError:
+            return self._changed_concurrently()
+
+
+def _set_if_present(source_key, source, destination, destination_key=None):
+    if destination_key is None:
+        destination_key = source_key
+    if source_key in source:
+        destination[destination_key] = source[source_key]
+
+
+def _get_int_parameter(source, source_key):
+    if source_key not in source:
+        return None
+    try:
+        return int(source[source_key])
+    except ValueError:
+        raise web.HTTPBadRequest(text='%s must be an integer' % source_key)
+
+
+def _get_utc_parameter(source, source_key):
+    if source_key not in source:
+        return None
+    value = source[source_key]
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise web.HTTPBadRequest(text='%s must be milliseconds since the epoch or an ISO 8601 time' % source_key)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def _get_fields_parameter(source):
+    if 'fields' not in source:
+        return None
+    try:
+        return projection.parse_fields(source['fields'])
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=str(e))
+
+
+def _get_boolean_parameter(source, source_key, default):
+    if source_key not in source:
+        return default
+    return source[source_key].lower() in ('1', 'true', 'yes')
+
+
+class DeploymentCollectionView(web.View, ServiceBase):
+    @staticmethod
+    def setup_routes(app, path_prefix=''):
+        app.router.add_route('*', path_prefix + '/deployments', DeploymentCollectionView)
+
+    async def get(self):
+        query = self.request.rel_url.query
+        lookup = {}
+        for parameter in ['is_active', 'environment', 'data_center', 'application', 'stripe', 'instance']:
+            _set_if_present(parameter, query, lookup)
+        if 'is_active' in lookup:
+            lookup['is_active'] = _get_boolean_parameter(query, 'is_active', True)
+        as_of = _get_utc_parameter(query, 'as_of')
+        if as_of is not None:
+            # What was in effect at that moment, whether or not it still is
+            lookup.pop('is_active', None)
+            lookup['as_of'] = as_of
+        after = _get_int_parameter(query, 'after')
+        limit = _get_int_parameter(query, 'limit')
+        if limit is not None and limit < 1:
+            raise web.HTTPBadRequest(text='limit must be positive')
+        partial_results = _get_boolean_parameter(query, 'partial', self.request.app['download_url_partial_results'])
+        fields = _get_fields_parameter(query)
+        response_format = query.get('format', 'json')
+        if response_format not in ('json', 'ndjson', 'columnar'):
+            raise web.HTTPBadRequest(text='format must be one of json, ndjson or columnar')
+        unit_of_work = await self.get_unit_of_work()
+        headers = await self._get_validators(unit_of_work, **lookup)
+        if _is_not_modified(self.request, headers):
+            return web.Response(status=304, headers=headers)
+        if response_format == 'ndjson':
+            return await self._stream_deployments(unit_of_work, lookup, after, limit, fields, partial_results, headers)
+        (deployment_keys, deployments) = await self._get_page(unit_of_work, after, limit, fields, partial_results, lookup)
+        if limit is not None and len(deployment_keys) == limit:
+            headers['Link'] = '<%s>; rel="next"' % self._page_after(deployment_keys[-1])
+        unavailable = sum(1 for deployment in deployments if 'warnings' in deployment)
+        if unavailable:
+            headers['Warning'] = _DOWNLOAD_URL_WARNING % unavailable
+        if response_format == 'columnar':
+            deployments = _columnar(deployments, fields)
+        return _json_response(self.request, deployments, headers)
+
+    async def patch(self):
+        try:
+            data = await self.request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text='Expected a JSON body')
+        if not isinstance(data, dict):
+            raise web.HTTPBadRequest(text='Expected a JSON object')
+        versions = dict((name, data[name]) for name in DEPLOYMENT_VERSIONS if name in data)
+        if not versions:
+            raise web.HTTPBadRequest(text='Expected at least one of %s' % ', '.join(DEPLOYMENT_VERSIONS))
+        if not all(isinstance(value, str) for value in versions.values()):
+            raise web.HTTPBadRequest(text='%s must be strings' % ', '.join(DEPLOYMENT_VERSIONS))
+        criteria = data.get('filter', {})
+        if not isinstance(criteria, dict) or not all(isinstance(value, str) for value in criteria.values()):
+            raise web.HTTPBadRequest(text='filter must be an object of strings')
+        # A misspelt key would otherwise widen the upgrade to everything the rest of the filter matches
+        unknown = sorted(name for name in criteria if name not in DEPLOYMENT_KEY)
+        if unknown:
+            raise web.HTTPBadRequest(text='Unknown filter key(s) %s; expected some of %s' % (', '.join(unknown),
+                ', '.join(DEPLOYMENT_KEY)))
+        keys = None
+        if 'keys' in data:
+            try:
+                keys = [tuple(key[part] for part in DEPLOYMENT_KEY) for key in data['keys']]
+            except (KeyError, TypeError):
+                raise web.HTTPBadRequest(text='Every key needs %s' % ', '.join(DEPLOYMENT_KEY))
+            if not keys:
+                # No keys would match nothing, not leave the upgrade to the filter alone
+                raise web.HTTPBadRequest(text='keys must not be empty')
+        if not criteria and keys is None:
+            raise web.HTTPBadRequest(text='Expected a non-empty filter or list of keys')
+        # Every environment the upgrade can reach needs the permission; only keys or an environment filter bound them
+        environments = set(key[0] for key in keys) if keys else None
+        if 'environment' in criteria:
+            environments = set([criteria['environment']])
+        if environments is None:
+            # Unbounded by environment, so only a permission that needs none will do
+            await self.check_permission('write')
+        else:
+            for environment in sorted(environments):
+                await self.check_permission('write', environment=environment)
+        username = await authorized_userid(self.request)
+        unit_of_work = await self.get_unit_of_work()
+        try:
+            (upgraded, unchanged, missing) = await self.run_transaction(unit_of_work, upgrade_deployments, unit_of_work,
+                    versions, username, models.utc_now(), criteria=criteria, keys=keys)
+        except ConcurrentModification as e:
+            return web.json_response({'error': str(e)}, status=409)
+        cache = self.request.app['deployment_cache']
+        for key in upgraded:
+            cache.invalidate(key)
+        if upgraded:
+            self.request.app['change_notifier'].notify()
+        results = []
+        for (outcome, status) in [(upgraded, 200), (unchanged, 409), (missing, 404)]:
+            for key in outcome:
+                result = dict(zip(DEPLOYMENT_KEY, key))
+                result['status'] = status
+                results.append(result)
+        return web.json_response({'upgraded': len(upgraded), 'unchanged': len(unchanged), 'missing': len(missing), 'results': results})
+
+    def _page_after(self, deployment_key):
+        query = dict(self.request.rel_url.query)
+        query['after'] = str(deployment_key)
+        return self.request.rel_url.with_query(query)
+
+    async def _get_validators(self, unit_of_work, as_of=None, **parameters):
+        # A watermark over everything the filter matches: any insert or deactivation moves one of these,
+        # while archiving a row leaves the combined watermark where it was
+        watermark = [0, 0, 0, 0]
+        for model in deployment_models(parameters.get('is_active')):
+            query = unit_of_work.query(sa.func.count(model.deployment_key),
+                sa.func.max(model.deployment_key), sa.func.max(model.effective_utc),
+                sa.func.max(model.deactivated_utc)).filter_by(**parameters)
+            if as_of is not None:
+                query = query.filter(model.effective_at(as_of))
+            (count, deployment_key, effective_utc, deactivated_utc) = await self.run_query(query.one)
+            watermark = [watermark[0] + count, max(watermark[1], deployment_key or 0), max(watermark[2], effective_utc or 0),
+                    max(watermark[3], deactivated_utc or 0)]
+        return _validators('-'.join(str(value) for value in watermark), max(watermark[2], watermark[3]))
+
+    async def _stream_deployments(self, unit_of_work, lookup, after, limit, fields, partial_results, headers):
+        response = web.StreamResponse(headers=dict(headers, **{'Content-Type': 'application/x-ndjson'}))
+        response.enable_chunked_encoding()
+        _compress(self.request, response)
+        await response.prepare(self.request)
+        batch_size = self.request.app['stream_batch_size']
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            (deployment_keys, deployments) = await self._get_page(unit_of_work, after, size, fields, partial_results, lookup)
+            if not deployments:
+                break
+            after = deployment_keys[-1]
+            await response.write(''.join(json.dumps(deployment) + '\n' for deployment in deployments).encode('utf-8'))
+            if len(deployments) < size:
+                break
+            if remaining is not None:
+                remaining -= len(deployments)
+        await response.write_eof()
+        return response
+
+    async def _get_page(self, unit_of_work, after, limit, fields, partial_results, lookup):
+        # Returns the page's deployment keys, for the next page to start after, and its documents
+        app = self.request.app
+        rows = await self._get_deployments(unit_of_work, fields, after, limit, **lookup)
+        if fields is None:
+            page = [(version[0], document, artifact) for (document, artifact, version)
+                    in (projection.full_document(row, lambda key: _deployment_uri(app, key)) for row in rows)]
+        else:
+            page = [projection.row_document(row, fields, lambda key: _deployment_uri(app, key)) for row in rows]
+        page.sort(key=lambda entry: entry[0])
+        if limit is not None:
+            page = page[:limit]
+        documents = [document for (deployment_key, document, artifact) in page]
+        if fields is None or 'artifact_download_url' in fields:
+            documents = await _add_download_urls([(document, artifact) for (deployment_key, document, artifact) in page], app,
+                    partial_results)
+        return [deployment_key for (deployment_key, document, artifact) in page], documents
+
+    async def _get_deployments(self, unit_of_work, fields, after=None, limit=None, as_of=None, **parameters):
+        # Plain rows of the columns the fields need, or of whole documents when there are no fields, never ORM entities
+        rows = []
+        names = tuple(sorted(parameters))
+        values = dict(parameters, as_of=as_of, after=after, limit=limit)
+        # Keys are never reused, so merging the current and archived pages by key keeps the keyset pagination intact
+        for model in deployment_models(parameters.get('is_active')):
+            query = projection.select_deployments(model, None if fields is None else tuple(fields), names,
+                    as_of is not None, after is not None, limit is not None)
+            rows.extend(await self.run_query(_fetch_all, unit_of_work, query, values))
+        return rows
+
+
+def _get_scope_parameter(source, source_key):
+    # environment/data_center or environment/data_center/application
+    value = source.get(source_key)
+    parts = tuple(value.split('/')) if value else ()
+    if len(parts) not in (2, 3) or not all(parts):
+        raise web.HTTPBadRequest(text='%s must be environment/data_center or environment/data_center/application' % source_key)
+    return parts
+
+
+class DeploymentDiffView(web.View, ServiceBase):
+    @staticmethod
+    def setup_routes(app, path_prefix=''):
+        app.router.add_route('GET', path_prefix + '/deployments/diff', DeploymentDiffView)
+
+    async def get(self):
+        query = self.request.rel_url.query
+        left = _get_scope_parameter(query, 'left')
+        right = _get_scope_parameter(query, 'right')
+        if len(left) != len(right):
+            raise web.HTTPBadRequest(text='left and right must both name an application, or neither')
+        # One statement over both scopes, and nothing that needs Artifactory
+        unit_of_work = await self.get_unit_of_work()
+        rows = await self.run_query(_fetch_all, unit_of_work, diff_query(left, right))
+        return _json_response(self.request, {'left': dict(zip(SCOPE, left)), 'right': dict(zip(SCOPE, right)),
+                'differences': [diff_document(row) for row in rows]})
+
+
+def _read_changes(unit_of_work, app, since, limit, lookup):
+    # Returns None for the changes when those after since have been pruned
+    Change = models.Change
+    connection = unit_of_work.connection()
+    grace = app['change_commit_grace']
+    if cursor_expired(connection, since):
+        return visible_revision(connection, None, grace), None
+    revision = visible_revision(connection, since, grace, limit)
+    if since is None or since >= revision:
+        return revision, []
+    changes = unit_of_work.query(Change).filter(Change.revision > since, Change.revision <= revision).filter_by(**lookup) \
+            .order_by(Change.revision).limit(limit).all()
+    if len(changes) == limit:
+        revision = changes[-1].revision
+    # Only the latest change per key matters: clients are sent each key's current state, not its history
+    latest = {}
+    for change in changes:
+        latest[tuple(getattr(change, part) for part in DEPLOYMENT_KEY)] = change.revision
+    deployments = {}
+    if latest:
+        app['dimensions'].prime(unit_of_work)
+        for deployment in deployment_query(unit_of_work).filter(key_condition(models.Deployment.__table__, list(latest)),
+                models.Deployment.is_active == sa.true()):
+            deployments[tuple(getattr(deployment, part) for part in DEPLOYMENT_KEY)] = deployment
+    result = []
+    for key, change_revision in sorted(latest.items(), key=lambda item: item[1]):
+        deployment = deployments.get(key)
+        if deployment is None:
+            result.append((change_revision, key, None, None))
+        else:
+            result.append((change_revision, key, _deployment_document(deployment, app), _deployment_artifact(deployment)))
+    return revision, result
+
+
+class ChangeFeedView(web.View, ServiceBase):
+    @staticmethod
+    def setup_routes(app, path_prefix=''):
+        app.router.add_route('GET', path_prefix + '/deployments/changes', ChangeFeedView)
+
+    async def get(self):
+        query = self.request.rel_url.query
+        lookup = {}
+        for parameter in DEPLOYMENT_KEY:
+            _set_if_present(parameter, query, lookup)
+        since = _get_int_parameter(query, 'since')
+        websocket = web.WebSocketResponse()
+        if websocket.can_prepare(self.request):
+            return await self._subscribe(websocket, since, lookup)
+        timeout = _get_int_parameter(query, 'timeout')
+        timeout = self.request.app['change_feed_timeout'] if timeout is None else min(timeout, self.request.app['change_feed_timeout'])
+        return web.json_response(await self._wait_for_changes(since, lookup, timeout))
+
+    async def _get_changes(self, since, lookup):
+        app = self.request.app
+        # Borrowed per read rather than per request: subscriptions are long-lived and would otherwise pin the pool
+        connection = await app['db_pool'].acquire()
+        try:
+            unit_of_work = sessionmaker(bind=connection)()
+            try:
+                (revision, changes) = await self.run_query(_read_changes, unit_of_work, app, since, app['stream_batch_size'], lookup)
+            finally:
+                await self.run_query(unit_of_work.close)
+        finally:
+            await app['db_pool'].release(connection)
+        if changes is None:
+            # The client has to read the current state again, then follow the feed from revision
+            return {'revision': revision, 'changes': [], 'reset': True}
+        present = [(document, artifact) for (change_revision, key, document, artifact) in changes if document is not None]
+        documents = iter(await _add_download_urls(present, app, True))
+        result = []
+        for (change_revision, key, document, artifact) in changes:
+            change = dict(zip(DEPLOYMENT_KEY, key))
+            change['revision'] = change_revision
+            change['deployment'] = None if document is None else next(documents)
+            result.append(change)
+        return {'revision': revision, 'changes': result}
+
+    async def _wait_for_changes(self, since, lookup, timeout):
+        notifier = self.request.app['change_notifier']
+        poll_interval = self.request.app['change_feed_poll_interval']
+        deadline = self.loop.time() + timeout
+        while True:
+            version = notifier.version
+            feed = await self._get_changes(since, lookup)
+            remaining = deadline - self.loop.time()
+            if feed['changes'] or feed.get('reset') or since is None or remaining <= 0 or notifier.closed:
+                return feed
+            since = feed['revision']
+            # Writes in this process wake us at once; polling picks up those made by other processes
+            await notifier.wait(version, min(remaining, poll_interval))
+
+    async def _subscribe(self, websocket, since, lookup):
+        notifier = self.request.app['change_notifier']
+        poll_interval = self.request.app['change_feed_poll_interval']
+        await websocket.prepare(self.request)
+        reader = asyncio.ensure_future(self._read_until_closed(websocket))
+        try:
+            while not reader.done() and not notifier.closed:
+                version = notifier.version
+                feed = await self._get_changes(since, lookup)
+                if feed['changes'] or feed.get('reset') or since is None:
+                    await websocket.send_json(feed)
+                since = feed['revision']
+                await notifier.wait(version, poll_interval)
+        finally:
+            reader.cancel()
+            await websocket.close()
+        return websocket
+
+    async def _read_until_closed(self, websocket):
+        async for message in websocket:
+            pass
+
+
+class DatabasePoolView(web.View):
+    @staticmethod
+    def setup_routes(app, path_prefix=''):
+        app.router.add_route('GET', path_prefix + '/status/db-pool', DatabasePoolView)
+
+    async def get(self):
+        statistics = self.request.app['db_pool'].statistics()
+        replicas = self.request.app['db_replicas'].statistics()
+        if replicas:
+            statistics['replicas'] = replicas
+        return web.json_response(statistics)
+
+
+class DeploymentCacheView(web.View):
+    @staticmethod
+    def setup_routes(app, path_prefix=''):
+        app.router.add_route('GET', path_prefix + '/status/deployment-cache', DeploymentCacheView)
+
+    async def get(self):
+        return web.json_response(self.request.app['deployment_cache'].statistics())
+
+
+class MetricsView(web.View):
+    @staticmethod
+    def setup_routes(app, path_prefix=''):
+        app.router.add_route('GET', path_prefix + '/metrics', MetricsView)
+
+    async def get(self):
+        return web.Response(body=self.request.app['metrics'].render(self.request.app).encode('utf-8'),
+                headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+def _import_spooled(connection, body, batch_size):
+    body.seek(0)
+    return import_snapshot(connection, io.TextIOWrapper(body, encoding='utf-8'), batch_size)
+
+
+class SnapshotView(web.View, ServiceBase):
+    @staticmethod
+    def setup_routes(app, path_prefix=''):
+        app.router.add_route('*', path_prefix + '/admin/snapshot', SnapshotView)
+
+    async def get(self):
+        await self.check_permission('admin')
+        connection = await self.request.db_connection.acquire()
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson',
+                'Content-Disposition': 'attachment; filename="versioning-snapshot.ndjson"'})
+        response.enable_chunked_encoding()
+        _compress(self.request, response)
+        await response.prepare(self.request)
+        batches = export_snapshot(connection, self.request.app['stream_batch_size'])
+        try:
+            while True:
+                lines = await self.run_query(next, batches, None)
+                if lines is None:
+                    break
+                await response.write(''.join(lines).encode('utf-8'))
+        finally:
+            # Ends the export's transaction when the client goes away part way through
+            await self.run_query(batches.close)
+        await response.write_eof()
+        return response
+
+    async def post(self):
+        await self.check_permission('admin')
+        # The upload is spooled to disk, so the import runs as one transaction in one executor call
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as body:
+            while True:
+                chunk = await self.request.content.read(64 * 1024)
+                if not chunk:
+                    break
+                body.write(chunk)
+            connection = await self.request.db_connection.acquire()
+            try:
+                counts = await self.run_query(_import_spooled, connection, body, self.request.app['stream_batch_size'])
+            except SnapshotError as e:
+                raise web.HTTPBadRequest(text=str(e))
+            except sa.exc.IntegrityError as e:
+                raise web.HTTPConflict(text='snapshot could not be loaded: %s' % e.orig)
+        self.request.app['dimensions'].invalidate()
+        self.request.app['deployment_cache'].clear()
+        self.request.app['change_notifier'].notify()
+        return web.json_response(counts)
+
+
+class AuthCacheView(web.View, ServiceBase):
+    @staticmethod
+    def setup_routes(app, path_prefix=''):
+        app.router.add_route('*', path_prefix + '/status/auth-cache', AuthCacheView)
+
+    async def get(self):
+        return web.json_response(self.request.app['auth_policy'].statistics())
+
+    async def delete(self):
+        # ?identity= forgets one user, say after a group change in the directory; otherwise everyone. Each worker
+        # process has its own cache and only this one is flushed: the others catch up within auth_groups_ttl
+        await self.check_permission('admin')
+        self.request.app['auth_policy'].flush(self.request.rel_url.query.get('identity'))
+        return web.json_response(self.request.app['auth_policy'].statistics())